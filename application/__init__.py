@@ -1,12 +1,49 @@
+"""
+__init__.py
+This file contains the application factory. create_app(config) builds a
+Flask app: it loads the config, connects MongoEngine and registers the
+blueprints, importing each blueprint's module only then. Importing the
+package itself only defines the MongoEngine instance, so tools that use a
+few modules (the models, the unit tests) don't pay for the whole app and
+nothing touches the database until an app is created.
+
+Behind a load balancer, PROXY_FIX_HOPS makes request.remote_addr the
+client's address rather than the proxy's (see werkzeug's ProxyFix).
+
+main.py creates the app for "flask run" and gunicorn; "flask
+profile-startup" reports how long each module takes to import.
+
+"""
+
+
 from flask import Flask   # importing from flask class
-from config import Config  # imports config
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_mongoengine import MongoEngine
 
-app = Flask(__name__)
+from config import Config  # imports config
+
+db = MongoEngine()  # instantiate class, connected by create_app
+
 
-app.config.from_object(Config)  # load config file
+def create_app(config=Config):
+    """
+    Builds and returns the Flask app for the given config class (Config,
+    or a subclass such as the tests' one). MongoEngine connections are
+    process-wide, so one process should create one app.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)  # load config file
+    hops = app.config.get('PROXY_FIX_HOPS', 0)
+    if hops:  # take the client address and scheme from the trusted proxies' headers
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
 
-db = MongoEngine()  # instantiate class
-db.init_app(app)
+    from application import dbstats
+    dbstats.install(app.config.get('SLOW_QUERY_MS'))  # must come before connecting
+    db.init_app(app)
 
-from application import route
+    # plain imports (not importlib) so "python -X importtime" reports them
+    from application import route, account, admin, api, metrics, server, commands, assets
+    for blueprint in (route.bp, account.bp, admin.bp, api.blueprint, metrics.bp, server.bp, commands.bp,
+                      assets.bp):
+        app.register_blueprint(blueprint)
+    return app
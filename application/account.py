@@ -0,0 +1,314 @@
+"""
+Account.py
+This file contains the routes for registered users: registering, logging
+in and out, and submitting, editing and deleting their own attractions
+while they await approval. They live on the "account" blueprint, so
+templates and redirects name them as "account.<view>" (e.g.
+url_for('account.login')).
+
+"""
+
+
+from flask import Blueprint, render_template, request, redirect, flash, url_for, session
+from application.models import User, Attractions
+from application.forms import LoginForm, RegisterForm
+from application.sequences import next_id
+from application.search import index_attraction
+from application.listing import fetch_rows, MY_PENDING_FIELDS
+from application.images import schedule_variants
+from application.uploads import store_upload, release, UploadError
+from application.cache import invalidate
+from application.auth import authenticate, login_user, logout_user, AuthBusy
+from application.geo import point_from_form, GeoError
+from application.autocomplete import update_attraction
+from application.states import transition_attraction, DONE, NOT_FOUND, NOT_ALLOWED, FORBIDDEN
+
+
+bp = Blueprint('account', __name__)
+
+
+def get_next_available_user_id():
+    """
+    This function returns the next user ID from the "user_id" counter.
+    See route.get_next_available_review_id.
+    """
+    return next_id('user_id')
+
+
+def get_next_available_attraction_id():
+    """
+    This function returns the next attraction ID from the "attractionID"
+    counter. See route.get_next_available_review_id.
+    """
+    return next_id('attractionID')
+
+
+@bp.route("/register", methods=['GET', 'POST'])
+def register():
+    """
+    This is the registration route
+    URL endpoint: /register
+    Methods: GET, POST
+    Description: Handles user registration
+    On GET request, it renders the registration form
+    On POST request, it processes the form data, creates a new user,
+    and saves it to the database. After successful registration, it
+    redirects the user to the home page if not successful error message flashed 
+    and stay on the registration page.
+    """
+    if session.get('username'):
+        return redirect(url_for('main.home'))
+
+    form = RegisterForm()
+    if form.validate_on_submit():
+        user_id = get_next_available_user_id()
+        email = form.email.data
+        password = form.password.data
+        first_name = form.first_name.data
+        last_name = form.last_name.data
+
+        user = User(user_id=user_id, email=email, first_name=first_name, last_name=last_name)
+        user.set_password(password)
+        user.save()
+
+        flash("You are registered","success")
+        return redirect(url_for('main.home'))
+
+    return render_template("register.html", title="Register", form=form, register=True)
+
+
+@bp.route("/login", methods=['GET', 'POST'])
+def login():
+    """
+    This is the login route
+    URL endpoint: /login
+    Methods: GET, POST
+    Description: Handles user login
+    On GET request, it renders the login form
+    On POST request, it processes the form data, checks the user's credentials,
+    and if valid, logs the user in by setting session variables. After
+    successful login, it redirects the user to the home page. If the
+    credentials are invalid, it flashes an error message. If the user is
+    an admin, it also sets an "is_admin" flag in the session for admin-specific
+    functionalities. The user and admin status are loaded in one query and
+    the password is checked on the hashing pool (see auth.py); if that pool
+    is saturated the login is refused with a 503 so the user can retry.
+    """
+    if session.get('username'):
+        return redirect(url_for('main.home'))
+
+    form = LoginForm()
+    if form.validate_on_submit():
+        email = form.email.data
+        password = form.password.data
+
+        try:
+            identity = authenticate(email, password)
+        except AuthBusy:
+            flash("We are busy right now, please try again in a moment", "warning")
+            return render_template("login.html", title="Login", form=form, login=True), 503
+
+        if identity:
+            flash(f"{identity.first_name} , You are successfully logged in", "success")
+            login_user(identity)
+            return redirect(url_for('main.home'))
+        else:
+            flash("Sorry, try again","danger")
+    return render_template("login.html", title="Login", form=form, login=True)
+
+
+@bp.route("/logout")
+def logout():
+    """
+    This is the logout route
+    URL endpoint: /logout
+    Methods: GET
+    Description: Logs the user out by clearing the session variables and
+    redirects to the home page
+    """
+    logout_user()
+    return redirect(url_for('main.home'))
+
+
+@bp.route("/my_pending")
+def my_pending():
+    """
+    This is the my pending attractions route
+    URL endpoint: /my_pending
+    Methods: GET
+    Description: Renders the page with a list of the current user's pending attractions.
+    This page is used by users to view and manage their own pending attractions. It checks
+    if the user is logged in, and if so, retrieves all attractions created by the user that
+    are not approved. If the user is not logged in, it flashes a warning message and redirects
+    to the login page. Otherwise, it renders the my pending template with the list of pending
+    attractions for the user.
+    """
+    if not session.get('user_id'):
+        flash("Please log in to view your pending attractions", "warning")
+        return redirect(url_for('account.login'))
+    user_id = session.get('user_id')
+    pending_attractions = fetch_rows(Attractions.objects(created_by=user_id, status__ne="approved"), MY_PENDING_FIELDS)
+    return render_template("my_pending.html", pending_attractions=pending_attractions, pending=True)
+
+
+@bp.route("/add_attraction", methods=["GET", "POST"])
+def add_attraction():
+    """
+    This is the add attraction route
+    URL endpoint: /add_attraction
+    Methods: GET, POST
+    Description: Handles adding a new attraction. On GET request, it renders
+    the add attraction form. On POST request, it processes the form data, creates
+    a new attraction object, and saves it to the database. The attraction is initially
+    set to "pending" status and is associated with the current user. After successful 
+    creation, it flashes a success message and redirects to the browse page. If the user
+    is not logged in, it flashes a warning message and redirects to the login page.
+    """
+    if request.method == "POST":
+        attractionID = get_next_available_attraction_id()
+        attractionID = str(attractionID)
+        name = request.form.get("attraction_name")
+        description = request.form.get("description")
+        location = request.form.get("location")
+        try:
+            point = point_from_form(request.form)
+        except GeoError as error:
+            flash(str(error), "danger")
+            return render_template("add_attraction.html", title="Add Attraction")
+        image_file = request.files.get('image')
+        image_field = None
+        if image_file and image_file.filename:
+            try:
+                image_field = store_upload(image_file)
+            except UploadError as error:
+                flash(str(error), "danger")
+                return render_template("add_attraction.html", title="Add Attraction")
+
+        status = "pending"
+        created_by = session.get('user_id')
+
+        attraction = Attractions(attractionID=attractionID, name=name, description=description, location=location, point=point, image=image_field, status=status, created_by=created_by)
+        attraction.save()
+        schedule_variants(attraction)
+
+        flash(f"{name} has been added and is pending approval", "success")
+        return redirect(url_for('main.browse'))
+
+    return render_template("add_attraction.html", title="Add Attraction")
+
+
+@bp.route("/edit_attraction/<int:attraction_id>", methods=["GET", "POST"])
+def edit_attraction(attraction_id):
+    """
+    This is the edit attraction route.
+    URL endpoint: /edit_attraction/<int:attraction_id>
+    Methods: GET, POST
+    Parameters: attraction_id (int) - The ID of the attraction to be edited.
+    Description: Handles editing an existing attraction. On GET request, it
+    renders the edit form with the current attraction details. On POST request,
+    it processes the form data, updates the attraction in the database, and saves
+    the changes. Only the creator of the attraction can edit it, and only if the
+    attraction is still pending or rejected. After successful editing, it flashes
+    a success message and redirects back to the user's pending attractions page. If
+    the attraction is not found, the user does not have permission, or the attraction
+    is not pending/rejected, it flashes an appropriate error message and redirects back
+    to the user's pending attractions page.
+    The save is a single conditional update (see states.py), so the checks
+    and the write can't be split by a concurrent approval.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return _edit_refused(FORBIDDEN)
+    changes = {}
+    if request.method == "POST":
+        changes = {'name': request.form.get("attraction_name"),
+                   'description': request.form.get("description"),
+                   'location': request.form.get("location")}
+        try:
+            changes['point'] = point_from_form(request.form)
+            image_file = request.files.get('image')
+            if image_file and image_file.filename:
+                changes['image'] = store_upload(image_file)
+                changes['image_variants'] = {}
+        except (GeoError, UploadError) as error:
+            flash(str(error), "danger")
+        else:
+            # one conditional update checks the owner and status and saves
+            # the changes; a rejected attraction goes back to pending
+            result = transition_attraction(attraction_id, 'edit', user_id=user_id, changes=changes)
+            new_image = changes.get('image')
+            if result.outcome != DONE:
+                release(new_image)
+                return _edit_refused(result.outcome)
+            attraction = result.doc
+            index_attraction(attraction)
+            update_attraction(attraction)
+            invalidate("browse", f"attraction:{attraction_id}")
+            if new_image:
+                # the same file again only drops the extra reference just taken
+                release(attraction.old_image)
+                schedule_variants(attraction)
+            flash("Attraction updated successfully!", "success")
+            return redirect(url_for('account.my_pending'))
+
+    attraction = Attractions.objects(attractionID=attraction_id).first()
+    if not attraction:
+        return _edit_refused(NOT_FOUND)
+    if attraction.created_by != user_id:
+        return _edit_refused(FORBIDDEN)
+    if attraction.status not in ["pending", "rejected"]:
+        return _edit_refused(NOT_ALLOWED)
+    for name in ('name', 'description', 'location'):
+        if name in changes:
+            setattr(attraction, name, changes[name])  # show what was entered
+    return render_template("edit_attraction.html", attraction=attraction)
+
+
+def _edit_refused(outcome):
+    """
+    Explains why an attraction can't be edited and goes back to the user's
+    pending attractions page.
+    """
+    if outcome == NOT_FOUND:
+        flash("Attraction not found", "danger")
+    elif outcome == FORBIDDEN:
+        flash("You do not have permission to edit this attraction", "danger")
+    else:
+        flash("You can only edit pending or rejected attractions", "warning")
+    return redirect(url_for('account.my_pending'))
+
+
+@bp.route("/delete_attraction/<int:attraction_id>", methods=["POST"])
+def delete_attraction(attraction_id):
+    """
+    This is the delete attraction route
+    URL endpoint: /delete_attraction/<int:attraction_id>
+    Methods: POST
+    Parameters: attraction_id (int) - The ID of the attraction to be deleted.
+    Description: Deletes an attraction from the database. This route is typically
+    used by users to delete their own pending attractions. It takes the attraction
+    ID as a parameter, checks if the attraction exists and if the current user is the
+    creator of the attraction. If both conditions are met and the attraction is still
+    pending, it deletes the attraction from the database. After deletion, it flashes a
+    success message and redirects back to the user's pending attractions page. If the
+    attraction is not found, the user does not have permission, or the attraction is
+    not pending, it flashes an appropriate error message and redirects back to the user's
+    pending attractions page.
+    """
+    attraction = Attractions.objects(attractionID=attraction_id).first()
+    if not attraction:
+        flash("Attraction not found", "danger")
+        return redirect(url_for('account.my_pending'))
+
+    if attraction.created_by != session.get('user_id'):
+        flash("You do not have permission to delete this attraction", "danger")
+        return redirect(url_for('account.my_pending'))
+
+    if attraction.status != "pending":
+        flash("You can only delete pending attractions", "warning")
+        return redirect(url_for('account.my_pending'))
+
+    attraction.delete()
+    release(attraction.image)
+    flash("Attraction deleted successfully!", "success")
+    return redirect(url_for('account.my_pending'))
@@ -0,0 +1,459 @@
+"""
+Admin.py
+This file contains the admin routes: the admin page with the moderation
+queue, approving and rejecting attractions and reported reviews one at a
+time or in bulk, claiming batches of the queue, and granting or removing
+admin rights. They live on the "admin" blueprint, so templates and
+redirects name them as "admin.<view>" (e.g. url_for('admin.admin')).
+
+"""
+
+
+import time
+
+from flask import Blueprint, render_template, request, redirect, flash, url_for, session, jsonify
+from application.models import User, Admin, Attractions, Reviews
+from application.sequences import next_id
+from application.search import index_attraction
+from application.pagination import keyset_page
+from application.listing import USER_FIELDS, PENDING_FIELDS, REPORTED_REVIEW_FIELDS
+from application.ratings import add_rating, remove_rating
+from application.cache import invalidate
+from application.auth import current_identity
+from application.moderation import bulk_attractions, bulk_reviews
+from application.autocomplete import update_attraction
+from application.reports import queue, QUEUE_SORT, claim_batch, release_claims
+from application.states import transition_attraction, transition_review, remove_review, DONE, NOT_FOUND, CLAIMED
+
+
+bp = Blueprint('admin', __name__)
+
+
+def get_next_available_admin_id():
+    """
+    This function returns the next admin ID from the "adminID" counter.
+    See route.get_next_available_review_id.
+    """
+    return next_id('adminID')
+
+
+@bp.route("/admin")
+def admin():
+    """
+    This is the admin route.
+    URL endpoint: /admin
+    Methods: GET
+    Description: Renders the admin page with lists of users, pending attractions,
+    pending reviews, and admins. This page is only accessible to users with admin
+    privileges. It allows admins to manage users, approve or reject attractions,
+    and review reported reviews. The route queries the database for all users except
+    the current user, all pending attractions, all reported reviews, and all admins.
+    It then renders the admin template with this data for display and management.
+    The users, pending attractions and reported reviews lists are each paged
+    independently with "users_", "attractions_" and "reviews_" cursors.
+    Reported reviews are listed as the moderation queue, most reported and
+    then longest waiting first; with "reviews_mine" only the batch the admin
+    has claimed is shown (see claim_reviews).
+    The page makes a fixed number of queries whatever the queue size: the
+    attraction names for the reported reviews are fetched with one $in query
+    and the admin flags for the listed users with another.
+    """
+    current_user_id = session.get('user_id')
+    users = keyset_page(User.objects(user_id__ne=current_user_id), 'user_id', prefix='users_', fields=USER_FIELDS)
+    pending_attractions = keyset_page(Attractions.objects(status="pending"), 'attractionID', prefix='attractions_', fields=PENDING_FIELDS)
+    reviews_queue = queue()
+    if request.args.get('reviews_mine'):
+        reviews_queue = reviews_queue.filter(claimed_by=current_user_id, claimed_until__gt=time.time())
+    pending_reviews = keyset_page(reviews_queue, 'reviewID', prefix='reviews_', sort=QUEUE_SORT, fields=REPORTED_REVIEW_FIELDS)
+    pending_attractions_count = Attractions.objects(status="pending").count()
+    pending_reviews_count = queue().count()
+    admin_ids = set(Admin.objects(user_id__in=[u.user_id for u in users]).distinct('user_id'))
+
+    attraction_ids = list({review.attractionID for review in pending_reviews})
+    attraction_names = {
+        a['attractionID']: a.get('name')
+        for a in Attractions.objects(attractionID__in=attraction_ids).only('attractionID', 'name').as_pymongo()
+    } if attraction_ids else {}
+
+    reviews_with_attractions = []
+    for review in pending_reviews:
+        reviews_with_attractions.append({
+            'review': review,
+            'attraction_name': attraction_names.get(review.attractionID, "Unknown")
+        })
+
+    return render_template("admin.html", users=users, pending_attractions=pending_attractions, pending_reviews=reviews_with_attractions, admin_ids=admin_ids,
+                           pending_attractions_count=pending_attractions_count, pending_reviews_count=pending_reviews_count,
+                           reviews_page=pending_reviews, now=time.time())
+
+
+@bp.route("/user")
+def user():
+    """
+    This is the user route.
+    URL endpoint: /user
+    Methods: GET
+    Description: Renders the user page with a list of all users.
+    This page is typically used by admins to manage users. It retrieves
+    user records from the database one page at a time (keyed on user_id),
+    loading only the displayed fields as raw rows (never the password hash),
+    and passes them to the template for display
+    """
+    users = keyset_page(User.objects, 'user_id', fields=USER_FIELDS)
+    return render_template("users.html", users=users)
+
+
+@bp.route("/pending_attraction/<int:attraction_id>")
+def pending_attraction_detail(attraction_id):
+    """
+    This is the pending attraction detail route
+    URL endpoint: /pending_attraction/<int:attraction_id>
+    Methods: GET
+    Parameters: attraction_id (int) - The ID of the pending attraction to be
+    displayed
+    Description: Renders the pending attraction detail page for a specific
+    attraction.This page is typically used by admins to review pending
+    attractions. It retrieves the attraction from the database using the
+    provided ID and checks if it is pending. It also retrieves all reviews
+    for that attraction, regardless of their reported status. If the attraction
+    is not found or not pending, it flashes an error message and redirects
+    back to the admin page. Otherwise, it renders the pending attraction
+    detail template with the attraction and its reviews for admin review
+    and approval.
+    """
+    attraction = Attractions.objects(attractionID=attraction_id).first()
+    if not attraction:
+        flash("Attraction not found", "danger")
+        return redirect(url_for('admin.admin'))
+    reviews = Reviews.objects(attractionID=attraction_id)
+
+    return render_template("pending_attraction_detail.html", attraction=attraction, reviews=reviews)
+
+
+@bp.route("/approve_review/<int:review_id>", methods=["POST"])
+def approve_review(review_id):
+    """
+    This is the approve review route.
+    URL endpoint: /approve_review/<int:review_id>
+    Methods: POST
+    Parameters: review_id (int) - The ID of the review to be approved.
+    Description: Approves a reported review by changing its status to "approved".
+    This route is typically used by admins to approve reviews that have been reported
+    as inappropriate but are deemed acceptable. It takes the review ID as a parameter,
+    finds the corresponding review in the database, updates its status to "approved",
+    and resets the "reported" flag to False. After approval, it flashes a success message 
+    and redirects back to the admin page. If the review is not found or has not been
+    reported, it flashes an appropriate message and redirects back to the admin page.
+    The review also leaves the moderation queue; one that another admin has
+    claimed (see reports.py) is left alone.
+    """
+    result = transition_review(review_id, 'approve', current_identity().user_id)
+    if result.outcome == DONE:
+        add_rating(result.doc)
+        invalidate(f"attraction:{result.doc.attractionID}")
+        flash("Review approved", "success")
+    else:
+        _flash_review_outcome(result)
+    return redirect(url_for('admin.admin'))
+
+
+@bp.route("/reject_review/<int:review_id>", methods=["POST"])
+def reject_review(review_id):
+    """
+    This is the reject review route.
+    URL endpoint: /reject_review/<int:review_id>
+    Methods: POST
+    Parameters: review_id (int) - The ID of the review to be rejected.
+    Description: Rejects a reported review by changing its status to "rejected".
+    This route is typically used by admins to reject reviews that have been reported
+    as inappropriate. It takes the review ID as a parameter, finds the corresponding
+    review in the database, updates its status to "rejected", and saves the changes.
+    After rejection, it flashes a warning message and redirects back to the admin page.
+    If the review is not found or has not been reported, it flashes an appropriate
+    message and redirects back to the admin page. The review also leaves the
+    moderation queue; one that another admin has claimed is left alone.
+    """
+    # a rejected review stays reported (hidden), so its rating is already
+    # excluded from the attraction's summary
+    result = transition_review(review_id, 'reject', current_identity().user_id)
+    if result.outcome == DONE:
+        invalidate(f"attraction:{result.doc.attractionID}")
+        flash("Review rejected", "warning")
+    else:
+        _flash_review_outcome(result)
+    return redirect(url_for('admin.admin'))
+
+
+def _flash_review_outcome(result):
+    """
+    Explains why a review moderation action did nothing.
+    """
+    if result.outcome == NOT_FOUND:
+        flash("Review not found", "danger")
+    elif result.outcome == CLAIMED:
+        flash("Another admin is moderating this review", "warning")
+    elif result.state == 'visible':
+        flash("Review has not been reported", "warning")
+    else:
+        flash(f"Review is already {result.state}", "info")
+
+
+@bp.route("/claim_reviews", methods=["POST"])
+def claim_reviews():
+    """
+    This is the claim reviews route.
+    URL endpoint: /claim_reviews
+    Methods: POST
+    Description: Claims the next MODERATION_BATCH_SIZE reviews of the
+    moderation queue for the current admin, for MODERATION_LEASE_SECONDS
+    (claiming again renews the lease). Other admins skip claimed reviews, so
+    several admins can work through the queue without handling the same
+    review twice. Redirects to the admin page showing the claimed batch.
+    Clients that ask for JSON get the claimed review IDs instead.
+    """
+    identity = current_identity()
+    if not identity.is_admin:
+        flash("You are not authorised", "danger")
+        return redirect(url_for('main.home'))
+    batch = claim_batch(identity.user_id)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({'claimed': [review.reviewID for review in batch],
+                        'until': batch[0].claimed_until if batch else None})
+    if batch:
+        flash(f"{len(batch)} reviews claimed", "success")
+    else:
+        flash("No unclaimed reviews in the queue", "info")
+    return redirect(url_for('admin.admin', reviews_mine=1, _anchor='reviews'))
+
+
+@bp.route("/release_reviews", methods=["POST"])
+def release_reviews():
+    """
+    This is the release reviews route.
+    URL endpoint: /release_reviews
+    Methods: POST
+    Description: Gives up the current admin's claimed reviews so other
+    admins can take them, and redirects back to the admin page.
+    """
+    identity = current_identity()
+    if not identity.is_admin:
+        flash("You are not authorised", "danger")
+        return redirect(url_for('main.home'))
+    flash(f"{release_claims(identity.user_id)} reviews released", "info")
+    return redirect(url_for('admin.admin'))
+
+
+@bp.route("/make_admin/<int:user_id>", methods=["POST"])
+def make_admin(user_id):
+    """
+    This is the make admin route.
+    URL endpoint: /make_admin/<int:user_id>
+    Methods: POST
+    Parameters: user_id (int) - The ID of the user to be granted admin privileges
+    Description: Grants admin privileges to a user. This route is typically used
+    by existing admins to promote other users to admin status. Then route checks
+    if the current user is an admin, and if so, it finds the user by ID and creates
+    a new admin record in the database. After granting admin privileges, it flashes
+    a success message and redirects back to the admin page. If the user is not found
+    or is already an admin, it flashes an appropriate message and redirects back to
+    the admin page.   
+    """
+    if not current_identity().is_admin:
+        flash("You are not authorised", "danger")
+        return redirect(url_for('main.home'))
+    user = User.objects(user_id=user_id).first()
+    if not user:
+        flash("User not found", "danger")
+        return redirect(url_for('admin.admin'))
+
+    if Admin.objects(user_id=user_id).first():
+        flash(f"{user.first_name} is already an admin", "info")
+        return redirect(url_for('admin.admin'))
+
+    adminID = get_next_available_admin_id()
+    admin_record = Admin(adminID=adminID, user_id=user_id)
+    admin_record.save()
+    flash(f"{user.first_name} is now an admin", "success")
+    return redirect(url_for('admin.admin'))
+
+
+@bp.route("/remove_admin/<int:user_id>", methods=["POST"])
+def remove_admin(user_id):
+    """
+    This is the remove admin route.
+    URL endpoint: /remove_admin/<int:user_id>   
+    Methods: POST
+    Parameters: user_id (int) - The ID of the user to be removed from admin privileges.
+    Description: Removes admin privileges from a user.
+    This route is typically used by existing admins to revoke admin
+    privileges from other users. It takes the user ID as a parameter,
+    checks if the user is currently an admin, and if so, deletes the
+    corresponding admin record from the database. After removal, it 
+    flashes a success message and redirects back to the admin page.
+    If the user is not found or is not an admin, it flashes an appropriate
+    message and redirects back to the admin page.
+    """
+    if not current_identity().is_admin:
+        flash("You are not authorised", "danger")
+        return redirect(url_for('main.home'))
+    admin_record = Admin.objects(user_id=user_id).first()
+    if admin_record:
+        admin_record.delete()
+        user = User.objects(user_id=user_id).first()
+        if user:
+            flash(f"{user.first_name} is no longer an admin", "success")
+    return redirect(url_for('admin.admin'))
+
+
+@bp.route("/approve_attraction/<int:attraction_id>", methods=["POST"])
+def approve_attraction(attraction_id):
+    """
+    This is the approve attraction route.
+    URL endpoint: /approve_attraction/<attraction_id>
+    Methods: POST
+    Parameters: attraction_id (int) - The ID of the attraction to be approved.
+    Description: Approves an attraction by changing its status to "approved".
+    This route is typically used by admins to approve attractions that meet the
+    approval criteria. It takes the attraction ID as a parameter, finds the 
+    corresponding attraction in the database, updates its status to "approved",
+    and saves the changes. After approval, it flashes a success message and
+    redirects back to the admin page.
+    """
+    result = transition_attraction(attraction_id, 'approve')
+    if result.outcome == NOT_FOUND:
+        flash("Attraction not found", "danger")
+    elif result.outcome != DONE:
+        flash(f"Attraction '{result.doc.name}' is already {result.state}", "info")
+    else:
+        index_attraction(result.doc)
+        update_attraction(result.doc)
+        invalidate("browse", "home", f"attraction:{attraction_id}")
+        flash(f"Attraction '{result.doc.name}' approved", "success")
+    return redirect(url_for('admin.admin'))
+
+
+@bp.route("/reject_attraction/<int:attraction_id>", methods=["POST"])
+def reject_attraction(attraction_id):
+    """
+    This is the reject attraction route.
+    URL endpoint: /reject_attraction/<attraction_id>
+    Methods: POST
+    Parameters: attraction_id (int) - The ID of the attraction to be rejected.
+    Description: Rejects an attraction by changing its status to "rejected".
+    This route is typically used by admins to reject attractions that do not
+    meet the approval criteria. It takes the attraction ID as a parameter,
+    finds the corresponding attraction in the database, updates its status to
+    "rejected", and saves the changes. After rejection, it flashes a warning
+    message and redirects back to the admin page.
+    """
+    result = transition_attraction(attraction_id, 'reject')
+    if result.outcome == NOT_FOUND:
+        flash("Attraction not found", "danger")
+    elif result.outcome != DONE:
+        flash(f"Attraction '{result.doc.name}' is already {result.state}", "info")
+    else:
+        index_attraction(result.doc)
+        update_attraction(result.doc)
+        invalidate("browse", "home", f"attraction:{attraction_id}")
+        flash(f"Attraction '{result.doc.name}' rejected", "warning")
+    return redirect(url_for('admin.admin'))
+
+
+@bp.route("/delete_review/<int:review_id>", methods=["POST"])
+def delete_review(review_id):
+    """
+    This is the delete review route.
+    URL endpoint: /delete_review/<int:review_id> 
+    Methods: POST
+    Parameters: review_id (int) - The ID of the review to be deleted.
+    Description: Deletes a review from the database.
+    This route is typically used by admins to remove inappropriate reviews.
+    It takes the review ID as a parameter, finds the corresponding review in
+    the database, and deletes it. After deletion, it flashes a success message
+    and redirects back to the admin page. A review that another admin has
+    claimed from the moderation queue is left alone.
+    """
+    result = remove_review(review_id, current_identity().user_id)
+    if result.outcome == DONE:
+        if not result.doc.reported:
+            remove_rating(result.doc)
+        invalidate(f"attraction:{result.doc.attractionID}")
+        flash("Review deleted", "success")
+    else:
+        _flash_review_outcome(result)
+    return redirect(url_for('admin.admin'))
+
+
+# past tense of each bulk action, for the flash summary
+BULK_DONE = {'approve': 'approved', 'reject': 'rejected', 'delete': 'deleted'}
+
+
+def _bulk_response(result, noun):
+    """
+    Reports the outcome of a bulk moderation action: JSON with per-item
+    results for API clients, otherwise a flash summary and one redirect to
+    the admin page.
+    """
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(result.to_dict())
+    flash(f"{len(result.done)} {noun} {BULK_DONE[result.action]}", "success" if result.done else "warning")
+    if result.skipped:
+        details = ", ".join(f"#{i}: {outcome}" for i, outcome in result.skipped.items())
+        flash(f"Skipped {details}", "warning")
+    return redirect(url_for('admin.admin'))
+
+
+def _bulk_ids():
+    ids = []
+    for value in request.form.getlist('ids'):
+        try:
+            ids.append(int(value))
+        except ValueError:
+            continue
+    return list(dict.fromkeys(ids))
+
+
+@bp.route("/bulk_attractions", methods=["POST"])
+def bulk_attractions_route():
+    """
+    This is the bulk attraction moderation route.
+    URL endpoint: /bulk_attractions
+    Methods: POST
+    Form fields: action - "approve" or "reject"; ids - one or more attraction IDs
+    Description: Approves or rejects every selected attraction with a single
+    update (see moderation.py), then flashes how many were changed and which
+    were skipped and why, and redirects back to the admin page once. Clients
+    that ask for JSON get the per-item results instead. Only admins may use it.
+    """
+    if not current_identity().is_admin:
+        flash("You are not authorised", "danger")
+        return redirect(url_for('main.home'))
+    try:
+        result = bulk_attractions(request.form.get('action'), _bulk_ids())
+    except ValueError as error:
+        flash(str(error), "danger")
+        return redirect(url_for('admin.admin'))
+    return _bulk_response(result, "attractions")
+
+
+@bp.route("/bulk_reviews", methods=["POST"])
+def bulk_reviews_route():
+    """
+    This is the bulk review moderation route.
+    URL endpoint: /bulk_reviews
+    Methods: POST
+    Form fields: action - "approve", "reject" or "delete"; ids - one or more review IDs
+    Description: Applies the action to every selected reported review with a
+    single update or delete (see moderation.py), then flashes a summary and
+    redirects back to the admin page once. Clients that ask for JSON get the
+    per-item results instead. Only admins may use it.
+    """
+    if not current_identity().is_admin:
+        flash("You are not authorised", "danger")
+        return redirect(url_for('main.home'))
+    try:
+        result = bulk_reviews(request.form.get('action'), _bulk_ids(), current_identity().user_id)
+    except ValueError as error:
+        flash(str(error), "danger")
+        return redirect(url_for('admin.admin'))
+    return _bulk_response(result, "reviews")
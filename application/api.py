@@ -0,0 +1,186 @@
+"""
+Api.py
+This file contains the versioned JSON API for the catalog, served under
+/api/v1 with flask-restx (interactive docs at /api/v1/docs). It exposes
+approved attractions and their visible reviews only, read-only.
+
+- Listings are cursor paged like the HTML pages (?after=, ?before=,
+  ?per_page=, see pagination.py) and return {"data": [...], "next": ...,
+  "prev": ...}.
+- ?fields=name,image returns only those fields, and only those are loaded
+  from the database.
+- /attractions/batch?ids=1,2,3 fetches many attractions in one query.
+- The "rating" field embeds the attraction's rating summary, so clients
+  need no extra request for it.
+- ?lat=&lng=&radius= (km) or ?bbox=west,south,east,north limit the listing
+  to an area, and ?sort=distance returns the attractions nearest lat/lng
+  (up to GEO_NEAR_LIMIT, unpaged), see geo.py.
+
+"""
+
+
+from flask import Blueprint, request, url_for
+from flask_restx import Api, Resource, abort
+
+from application.models import Attractions, Reviews
+from application.pagination import keyset_page
+from application.listing import fetch_rows
+from application.geo import geo_query, near_limit, GeoError
+
+
+blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
+api = Api(blueprint, version='1.0', title='Community Tourist Assistant API',
+          description='Read-only access to approved attractions and their reviews', doc='/docs')
+ns = api.namespace('attractions', description='Approved attractions')
+
+# public field name -> database fields it needs
+ATTRACTION_FIELDS = {
+    'id': ('attractionID',),
+    'name': ('name',),
+    'description': ('description',),
+    'location': ('location',),
+    'coordinates': ('point',),
+    'image': ('image', 'image_variants'),
+    'rating': ('rating_count', 'rating_mean', 'rating_histogram'),
+}
+REVIEW_FIELDS = {
+    'id': ('reviewID',),
+    'name': ('first_name',),
+    'rating': ('rating',),
+    'review': ('review',),
+}
+
+MAX_BATCH = 100
+
+
+def requested_fields(allowed):
+    """
+    Returns the public fields asked for with ?fields=a,b (always including
+    id), or all of them. Unknown names are a 400 error.
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return list(allowed)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(unknown)}")
+    return ['id'] + [name for name in names if name != 'id']
+
+
+def projection(fields, allowed):
+    return tuple(db_field for name in fields for db_field in allowed[name])
+
+
+def _image(row):
+    if not row.image:
+        return None
+    variants = row.image_variants or {}
+    return {
+        'url': url_for('static', filename=row.image, _external=True),
+        'variants': {k: url_for('static', filename=v, _external=True) for k, v in variants.items()},
+    }
+
+
+def serialize_attraction(row, fields):
+    out = {}
+    for name in fields:
+        if name == 'id':
+            out['id'] = row.attractionID
+        elif name == 'image':
+            out['image'] = _image(row)
+        elif name == 'coordinates':
+            point = row.get('point')
+            out['coordinates'] = {'lat': point['coordinates'][1], 'lng': point['coordinates'][0]} if point else None
+        elif name == 'rating':
+            out['rating'] = {'count': row.rating_count or 0, 'mean': row.rating_mean or 0,
+                             'histogram': row.rating_histogram or {}}
+        else:
+            out[name] = row.get(name)
+    return out
+
+
+def serialize_review(row, fields):
+    return {name: row.get(REVIEW_FIELDS[name][0]) for name in fields}
+
+
+def paged(page, serialize, fields):
+    return {
+        'data': [serialize(row, fields) for row in page.items],
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    }
+
+
+@ns.route('')
+class AttractionList(Resource):
+    @ns.doc(params={'after': 'cursor', 'before': 'cursor', 'per_page': 'page size',
+                    'fields': 'comma separated fields',
+                    'sort': '"rating" for highest rated first, "distance" for nearest to lat/lng first',
+                    'lat': 'latitude', 'lng': 'longitude', 'radius': 'km from lat/lng',
+                    'bbox': 'west,south,east,north'})
+    def get(self):
+        """List approved attractions, one page at a time."""
+        fields = requested_fields(ATTRACTION_FIELDS)
+        sort = request.args.get('sort')
+        try:
+            approved, by_distance = geo_query(Attractions.objects(status="approved"), request.args,
+                                              sort == 'distance')
+        except GeoError as error:
+            abort(400, str(error))
+        if by_distance:
+            rows = fetch_rows(approved.limit(near_limit()), projection(fields, ATTRACTION_FIELDS))
+            return {'data': [serialize_attraction(row, fields) for row in rows], 'next': None, 'prev': None}
+        page = keyset_page(approved, 'attractionID', sort='-rating_mean' if sort == 'rating' else None,
+                           fields=projection(fields, ATTRACTION_FIELDS))
+        return paged(page, serialize_attraction, fields)
+
+
+@ns.route('/batch')
+class AttractionBatch(Resource):
+    @ns.doc(params={'ids': f'comma separated attraction IDs (at most {MAX_BATCH})',
+                    'fields': 'comma separated fields'})
+    def get(self):
+        """Fetch many approved attractions by ID in one request."""
+        try:
+            ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+        except ValueError:
+            abort(400, "ids must be a comma separated list of integers")
+        if len(ids) > MAX_BATCH:
+            abort(400, f"At most {MAX_BATCH} ids per request")
+        fields = requested_fields(ATTRACTION_FIELDS)
+        rows = fetch_rows(Attractions.objects(status="approved", attractionID__in=ids),
+                          projection(fields, ATTRACTION_FIELDS)) if ids else []
+        found = {row.attractionID: row for row in rows}
+        return {
+            'data': [serialize_attraction(found[i], fields) for i in ids if i in found],
+            'missing': [i for i in ids if i not in found],
+        }
+
+
+@ns.route('/<int:attraction_id>')
+class AttractionItem(Resource):
+    @ns.doc(params={'fields': 'comma separated fields'})
+    def get(self, attraction_id):
+        """Fetch one approved attraction."""
+        fields = requested_fields(ATTRACTION_FIELDS)
+        rows = fetch_rows(Attractions.objects(status="approved", attractionID=attraction_id).limit(1),
+                          projection(fields, ATTRACTION_FIELDS))
+        if not rows:
+            abort(404, "Attraction not found")
+        return serialize_attraction(rows[0], fields)
+
+
+@ns.route('/<int:attraction_id>/reviews')
+class AttractionReviews(Resource):
+    @ns.doc(params={'after': 'cursor', 'before': 'cursor', 'per_page': 'page size',
+                    'fields': 'comma separated fields'})
+    def get(self, attraction_id):
+        """List the visible reviews of an approved attraction, one page at a time."""
+        if not Attractions.objects(status="approved", attractionID=attraction_id).only('attractionID').first():
+            abort(404, "Attraction not found")
+        fields = requested_fields(REVIEW_FIELDS)
+        page = keyset_page(Reviews.objects(attractionID=attraction_id, reported=False), 'reviewID',
+                           fields=projection(fields, REVIEW_FIELDS))
+        return paged(page, serialize_review, fields)
+
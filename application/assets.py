@@ -0,0 +1,196 @@
+"""
+Assets.py
+This file contains the static asset pipeline and response compression.
+
+"flask build-assets" copies every file in static/ (except uploaded images,
+which are already stored under their content hash, see uploads.py) to
+static/dist/ with a hash of its contents in the name, e.g.
+css/main.css -> dist/css/main.3fa9c1d2e4b5.css. Text files also get a
+gzip (.gz) and, if the brotli package is installed, a brotli (.br) copy.
+The mapping is written to static/dist/manifest.json.
+
+When the manifest exists, url_for('static', filename='css/main.css') builds
+the hashed URL, and the static route serves hashed files with an immutable
+one-year Cache-Control header, picking the precompressed copy the client's
+Accept-Encoding allows. A changed file gets a new name, so browsers never
+need to revalidate. Without a manifest (e.g. in development) URLs and
+headers are Flask's defaults.
+
+Dynamic HTML responses of at least COMPRESS_MIN_BYTES are gzipped on the
+fly for clients that accept it.
+
+"""
+
+
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+
+from flask import Blueprint, request, current_app, send_file
+from werkzeug.security import safe_join
+from werkzeug.exceptions import NotFound
+
+from application.uploads import BLOB_DIR
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is an optional dependency
+    brotli = None
+
+
+bp = Blueprint('assets', __name__)
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# generated directories that are not built: the output and uploaded images
+SKIP_DIRS = (DIST_DIR, BLOB_DIR, 'images/variants')
+# file types worth precompressing; images are compressed already
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.map')
+# precompressed copies are kept only if they save at least this much
+MIN_SAVING = 0.1
+HASH_LENGTH = 12
+
+# content codings in order of preference: (name, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _compressed_copies(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    copies = [('.gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        copies.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in copies:
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def build_assets(static_folder):
+    """
+    This function rebuilds static/dist/ from the files in static_folder and
+    writes the manifest. Returns the manifest: the path of each file
+    relative to static/ -> its hashed path relative to static/dist/.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    skip = {os.path.normpath(os.path.join(static_folder, d)) for d in SKIP_DIRS}
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.normpath(os.path.join(root, d)) not in skip)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = f"{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(dist, *hashed.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if ext.lower() in COMPRESSIBLE:
+                _compressed_copies(target)
+            manifest[logical] = hashed
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """
+    Reads the manifest written by build_assets(), or returns {} if the
+    assets have not been built.
+    """
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _manifest():
+    return current_app.extensions.get('assets', {})
+
+
+def hashed_static_url(endpoint, values):
+    """
+    URL defaults hook: points url_for('static', filename=...) at the hashed
+    copy of a built file. Other files (uploads) keep their plain URL.
+    """
+    if endpoint != 'static':
+        return
+    hashed = _manifest().get(values.get('filename'))
+    if hashed:
+        values['filename'] = f"{DIST_DIR}/{hashed}"
+
+
+def serve_static(filename):
+    """
+    Replaces Flask's static view. Hashed files are sent with an immutable
+    Cache-Control header, as the brotli or gzip copy when there is one and
+    the client accepts it; everything else is left to Flask.
+    """
+    if not filename.startswith(f"{DIST_DIR}/") or filename.endswith(f"/{MANIFEST}"):
+        return current_app.send_static_file(filename)
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    name, encoding = os.path.basename(path), None
+    for coding, suffix in ENCODINGS:
+        if request.accept_encodings[coding] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, coding
+            break
+    response = send_file(path, mimetype=mimetype, download_name=name, conditional=True, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def compress_response(response):
+    """
+    Gzips HTML responses of at least COMPRESS_MIN_BYTES for clients that
+    accept it. Streamed and file responses, and responses that are already
+    encoded, are left alone.
+    """
+    if (not current_app.config.get('COMPRESS_ENABLED', True) or response.direct_passthrough
+            or response.is_streamed or response.status_code != 200 or response.mimetype != 'text/html'
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config.get('COMPRESS_MIN_BYTES', 1024):
+        return response
+    response.set_data(gzip.compress(data, current_app.config.get('COMPRESS_LEVEL', 6)))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-gzip", weak)  # the encoded body is another representation
+    return response
+
+
+def _install(state):
+    state.app.extensions['assets'] = load_manifest(state.app.static_folder)
+    state.app.view_functions['static'] = serve_static
+
+
+bp.record_once(_install)
+bp.app_url_defaults(hashed_static_url)
+bp.after_app_request(compress_response)
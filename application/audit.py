@@ -0,0 +1,135 @@
+"""
+Audit.py
+This file contains the index management and query plan audit tools.
+ensure_indexes() builds every index declared in the models' meta (in the
+background) and is run by "flask ensure-indexes". audit_queries() runs the
+queries each route makes through explain() and reports the plan stage and
+how many documents were examined per document returned, so a new query
+that misses an index shows up as a COLLSCAN or a high ratio. It is run by
+"flask audit-queries", which seeds a small synthetic data set first if the
+database is empty.
+
+"""
+
+
+import random
+
+from application.models import User, Admin, Attractions, Reviews, Counter, ImageBlob, Job
+from application.reports import backfill_reports
+
+
+MODELS = (User, Admin, Attractions, Reviews, Counter, ImageBlob, Job)
+
+
+def ensure_indexes():
+    """
+    Builds the declared indexes of every model. Returns the model names.
+    """
+    for model in MODELS:
+        model.ensure_indexes()
+    return [model.__name__ for model in MODELS]
+
+
+def route_queries():
+    """
+    Returns (name, queryset) pairs covering the queries made by the routes
+    in route.py, using IDs that exist in the current database.
+    """
+    attraction = Attractions.objects(status="approved").only('attractionID', 'created_by').first()
+    attraction_id = attraction.attractionID if attraction else 1
+    user_id = attraction.created_by if attraction and attraction.created_by else 1
+
+    return [
+        ("browse", Attractions.objects(status="approved").order_by('attractionID').limit(25)),
+        ("browse next page", Attractions.objects(status="approved", attractionID__gt=attraction_id).order_by('attractionID').limit(25)),
+        ("browse by rating", Attractions.objects(status="approved", rating_mean__gte=5).order_by('-rating_mean', 'attractionID').limit(25)),
+        ("browse search", Attractions.objects(status="approved").search_text("park").order_by('$text_score').limit(200)),
+        ("attraction detail", Attractions.objects(attractionID=attraction_id, status="approved").limit(1)),
+        ("attraction reviews newest", Reviews.objects(attractionID=attraction_id, reported=False).order_by('-reviewID').limit(11)),
+        ("attraction reviews highest", Reviews.objects(attractionID=attraction_id, reported=False).order_by('-rating', 'reviewID').limit(11)),
+        ("attraction reviews lowest", Reviews.objects(attractionID=attraction_id, reported=False).order_by('rating', 'reviewID').limit(11)),
+        ("my_pending", Attractions.objects(created_by=user_id, status__ne="approved")),
+        ("admin users", User.objects(user_id__ne=user_id).order_by('user_id').limit(25)),
+        ("admin pending attractions", Attractions.objects(status="pending").order_by('attractionID').limit(25)),
+        ("admin review queue", Reviews.objects(report_count__gt=0).order_by('-report_count', 'reported_at', 'reviewID').limit(25)),
+        ("admin claimed reviews", Reviews.objects(report_count__gt=0, claimed_by=user_id, claimed_until__gt=0).order_by('-report_count', 'reported_at', 'reviewID')),
+        ("admin badges", Admin.objects(user_id__in=[user_id])),
+        ("admin attraction names", Attractions.objects(attractionID__in=[attraction_id]).only('attractionID', 'name')),
+        ("login", User.objects(email="user1@example.com").limit(1)),
+        ("make_admin", Admin.objects(user_id=user_id).limit(1)),
+        ("review by id", Reviews.objects(reviewID=1).limit(1)),
+    ]
+
+
+def _stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_stages(value))
+    return stages
+
+
+def explain_query(queryset):
+    """
+    Runs explain() on a queryset and returns a dict with the winning plan's
+    stages, whether it scans the collection, and the examined/returned
+    counts from the execution stats.
+    """
+    explained = queryset.explain()
+    winning = explained.get('queryPlanner', {}).get('winningPlan', {})
+    stats = explained.get('executionStats', {})
+    returned = stats.get('nReturned', 0)
+    examined = stats.get('totalDocsExamined', 0)
+    stages = _stages(winning)
+    return {
+        'stages': stages,
+        'collscan': 'COLLSCAN' in stages,
+        'returned': returned,
+        'docs_examined': examined,
+        'keys_examined': stats.get('totalKeysExamined', 0),
+        'ratio': examined / max(returned, 1),
+    }
+
+
+def audit_queries(max_ratio=10):
+    """
+    This function explains every route query and returns a list of
+    (name, result, problems) tuples. A query is a problem if it uses a
+    COLLSCAN or examines more than max_ratio documents per one returned.
+    """
+    report = []
+    for name, queryset in route_queries():
+        result = explain_query(queryset)
+        problems = []
+        if result['collscan']:
+            problems.append("COLLSCAN")
+        if result['ratio'] > max_ratio:
+            problems.append(f"examined/returned {result['ratio']:.1f}")
+        report.append((name, result, problems))
+    return report
+
+
+def seed_audit_data(users=200, attractions=500, reviews=2000, seed=1):
+    """
+    Inserts a small deterministic data set so the planner has something to
+    choose between. Only used when the database is empty.
+    """
+    rng = random.Random(seed)
+    User._get_collection().insert_many([
+        {'user_id': i, 'email': f"user{i}@example.com", 'first_name': f"User{i}"} for i in range(1, users + 1)])
+    Admin._get_collection().insert_many([{'adminID': 1, 'user_id': 1}])
+    Attractions._get_collection().insert_many([
+        {'attractionID': i, 'name': f"Attraction {i} park", 'description': "Somewhere to visit",
+         'location': "Devon", 'status': rng.choice(["approved", "approved", "pending", "rejected"]),
+         'created_by': rng.randint(1, users), 'rating_mean': rng.uniform(0, 10)}
+        for i in range(1, attractions + 1)])
+    Reviews._get_collection().insert_many([
+        {'reviewID': i, 'attractionID': rng.randint(1, attractions), 'first_name': "A",
+         'rating': rng.randint(1, 10), 'review': "Nice", 'reported': rng.random() < 0.05}
+        for i in range(1, reviews + 1)])
+    backfill_reports()
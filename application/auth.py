@@ -0,0 +1,182 @@
+"""
+Auth.py
+This file contains the authentication helpers used by the login, register
+and review routes.
+
+- Password hashes are checked on a bounded worker pool. The hash functions
+  release the GIL, so verification runs in parallel without tying up more
+  than AUTH_HASH_WORKERS cores, and once AUTH_HASH_QUEUE checks are waiting
+  new logins are turned away (AuthBusy) instead of piling up.
+- New hashes use PASSWORD_HASH_METHOD. When a user logs in with a hash made
+  with different parameters, it is transparently replaced: the new hash is
+  made on the same pool after the login has been answered.
+- current_identity() resolves who the request belongs to at most once per
+  request, from the session set at login, without going back to the DB.
+
+"""
+
+
+import logging
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import g, session, current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from application.models import User, Admin
+
+
+log = logging.getLogger(__name__)
+
+Identity = namedtuple('Identity', ['user_id', 'first_name', 'is_admin'])
+ANONYMOUS = Identity(None, None, False)
+
+_executor = None
+_slots = None
+_init_lock = threading.Lock()
+
+
+class AuthBusy(Exception):
+    """
+    Raised when too many password checks are already queued.
+    """
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                workers = current_app.config.get('AUTH_HASH_WORKERS', 4)
+                _slots = threading.BoundedSemaphore(workers + current_app.config.get('AUTH_HASH_QUEUE', 32))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+    return _executor, _slots
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # werkzeug fills in default parameters, so hash once to learn the full form
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def needs_rehash(stored_hash):
+    """
+    Returns True if a stored hash was made with different parameters than
+    PASSWORD_HASH_METHOD (compares the part of the hash before the first "$").
+    """
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    return stored_hash.split('$', 1)[0] != _method_prefix(method)
+
+
+def _submit(fn, *args):
+    """
+    Runs fn(*args) on the hashing pool and returns its future, or raises
+    AuthBusy straight away if the pool's queue is full.
+    """
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise AuthBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def verify_password(stored_hash, password):
+    """
+    This function checks a password against a stored hash on the hashing
+    pool and waits for the result. It raises AuthBusy straight away if the
+    pool's queue is full, or if the check does not finish within
+    AUTH_HASH_TIMEOUT seconds.
+    """
+    if not stored_hash:
+        return False
+    future = _submit(check_password_hash, stored_hash, password)
+    try:
+        return future.result(timeout=current_app.config.get('AUTH_HASH_TIMEOUT', 10))
+    except TimeoutError:
+        raise AuthBusy()
+
+
+def _rehash(user_id, stored_hash, password, method):
+    # only replaces the hash that was checked, in case the password changed since
+    User.objects(user_id=user_id, password=stored_hash).update_one(
+        set__password=generate_password_hash(password, method=method))
+
+
+def _rehash_done(future):
+    if future.exception() is not None:
+        log.error("Password rehash failed", exc_info=future.exception())
+
+
+def rehash_password(user_id, stored_hash, password):
+    """
+    This function replaces a user's hash with one made with
+    PASSWORD_HASH_METHOD on the hashing pool, without waiting for it, and
+    returns the future (None if the pool is busy; the next login tries
+    again).
+    """
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+    try:
+        future = _submit(_rehash, user_id, stored_hash, password, method)
+    except AuthBusy:
+        return None
+    future.add_done_callback(_rehash_done)
+    return future
+
+
+def authenticate(email, password):
+    """
+    This function looks up a user by email together with their admin record
+    in one aggregation ($lookup), checks the password and, if the hash
+    parameters have changed, has it rehashed in the background. Returns an Identity, or None if the
+    email or password is wrong. May raise AuthBusy.
+    """
+    rows = list(User.objects(email=email).aggregate([
+        {'$limit': 1},
+        {'$lookup': {'from': Admin._get_collection_name(), 'localField': 'user_id',
+                     'foreignField': 'user_id', 'as': 'admin'}},
+        {'$project': {'user_id': 1, 'first_name': 1, 'password': 1, 'admin': {'$size': '$admin'}}},
+    ]))
+    if not rows or not verify_password(rows[0].get('password'), password):
+        return None
+    row = rows[0]
+    if needs_rehash(row['password']):
+        rehash_password(row['user_id'], row['password'], password)
+    return Identity(row['user_id'], row.get('first_name'), row['admin'] > 0)
+
+
+def login_user(identity):
+    session['user_id'] = identity.user_id
+    session['username'] = identity.first_name
+    session['is_admin'] = identity.is_admin
+    g.identity = identity
+
+
+def logout_user():
+    session.pop('username', None)
+    session.pop('user_id', None)
+    session.pop('is_admin', None)
+    g.identity = ANONYMOUS
+
+
+def current_identity():
+    """
+    Returns the Identity of the current request, resolved once and kept on
+    flask.g. It comes from the session written at login, so routes that only
+    need the user's ID, first name or admin status make no query for it.
+    """
+    identity = g.get('identity')
+    if identity is None:
+        user_id = session.get('user_id')
+        if user_id:
+            identity = Identity(user_id, session.get('username'), bool(session.get('is_admin')))
+        else:
+            identity = ANONYMOUS
+        g.identity = identity
+    return identity
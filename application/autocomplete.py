@@ -0,0 +1,321 @@
+"""
+Autocomplete.py
+This file contains the in-process prefix index behind the /autocomplete
+typeahead endpoint. It holds the names of approved attractions in sorted
+arrays of keys (the name from each of its words onwards, so "cath" finds
+"Exeter Cathedral"), one per three letter start, searched with a binary
+search. The best matches for every prefix of up to three letters are
+precomputed, since those match too many names to rank on every keystroke;
+longer prefixes keep only the best few matches as they scan. Results are ranked by popularity (number of
+ratings), then by average rating. Lookups take no lock: an update copies
+only the few arrays and precomputed lists its keys fall in and swaps the
+copies in, so it costs the size of those arrays, not of the index.
+
+The index is built on first use and rebuilt in the background every
+AUTOCOMPLETE_REFRESH_SECONDS to pick up new ratings and other workers'
+changes; the approve, reject and edit routes update it straight away with
+update_attraction(). At most AUTOCOMPLETE_MAX_ENTRIES attractions (the most
+popular) are indexed, and stats() reports the memory used, which is also
+exported on /metrics.
+
+"""
+
+
+import sys
+import time
+import heapq
+import threading
+from collections import namedtuple
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+from application.models import Attractions
+from application.search import tokenize
+from application.metrics import metrics
+
+
+SHORT_PREFIX = 3
+MAX_KEY_WORDS = 6
+FIELDS = ('attractionID', 'name', 'status', 'rating_count', 'rating_mean')
+
+
+def normalise(text):
+    return ' '.join(tokenize(text))
+
+
+def _name_keys(name):
+    words = tokenize(name)
+    return tuple(sorted({' '.join(words[i:]) for i in range(min(len(words), MAX_KEY_WORDS))}))
+
+
+# a bucket holds the keys starting with the same SHORT_PREFIX letters, as
+# parallel sorted lists of (key, attractionID); it is never changed in place
+Bucket = namedtuple('Bucket', ['keys', 'ids'])
+
+
+class PrefixIndex(object):
+    """
+    Sorted array prefix index split into buckets by the first SHORT_PREFIX
+    letters of each key. names maps each attraction to (name, rank key, its
+    keys); top holds the best max_results IDs (a tuple) for each short
+    prefix. complete() takes no lock. add() and remove() copy only the
+    buckets and top entries the attraction's keys fall in, under the lock,
+    and put each copy in place with one dict assignment, so an update costs
+    O(size of those few buckets) rather than O(index size). A lookup running
+    meanwhile may see part of an update, but never a half-built bucket.
+    """
+
+    def __init__(self, max_results=20, max_entries=None):
+        self.buckets = {}
+        self.names = {}
+        self.top = {}
+        self.max_results = max_results
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.built_at = 0
+        self._stats = None
+
+    @staticmethod
+    def _rank(attraction_id, count, mean):
+        return (-(count or 0), -(mean or 0), attraction_id)
+
+    def add(self, attraction_id, name, count=0, mean=0):
+        with self.lock:
+            self._stats = None
+            if attraction_id not in self.names and self.max_entries and len(self.names) >= self.max_entries:
+                return
+            self._remove(attraction_id)
+            keys = _name_keys(name)
+            self.names[attraction_id] = (name, self._rank(attraction_id, count, mean), keys)
+            changed = {}
+            for key in keys:
+                bucket = self._copy_bucket(changed, key[:SHORT_PREFIX])
+                i = bisect_left(bucket.keys, key)
+                while i < len(bucket.keys) and bucket.keys[i] == key and bucket.ids[i] < attraction_id:
+                    i += 1
+                bucket.keys.insert(i, key)
+                bucket.ids.insert(i, attraction_id)
+            self.buckets.update(changed)
+            for prefix in self._short_prefixes(keys):
+                best = list(self.top.get(prefix, ()))
+                if attraction_id not in best:
+                    insort(best, attraction_id, key=lambda i: self.names[i][1])
+                    self.top[prefix] = tuple(best[:self.max_results])
+
+    def remove(self, attraction_id):
+        with self.lock:
+            self._stats = None
+            self._remove(attraction_id)
+
+    def _copy_bucket(self, changed, name):
+        if name not in changed:
+            bucket = self.buckets.get(name) or Bucket([], [])
+            changed[name] = Bucket(list(bucket.keys), list(bucket.ids))
+        return changed[name]
+
+    def _remove(self, attraction_id):
+        entry = self.names.get(attraction_id)
+        if entry is None:
+            return
+        keys = entry[2]
+        changed = {}
+        for key in keys:
+            bucket = self._copy_bucket(changed, key[:SHORT_PREFIX])
+            i = bisect_left(bucket.keys, key)
+            while bucket.ids[i] != attraction_id:
+                i += 1
+            del bucket.keys[i]
+            del bucket.ids[i]
+        for name, bucket in changed.items():
+            if bucket.keys:
+                self.buckets[name] = bucket
+            else:
+                del self.buckets[name]
+        for prefix in self._short_prefixes(keys):
+            if attraction_id in self.top.get(prefix, ()):
+                # it may have been hiding the next best match: rank the prefix again
+                best = self._scan(prefix, self.max_results)
+                if best:
+                    self.top[prefix] = tuple(best)
+                else:
+                    del self.top[prefix]
+        del self.names[attraction_id]
+
+    @staticmethod
+    def _short_prefixes(keys):
+        return {key[:n] for key in keys for n in range(1, SHORT_PREFIX + 1) if len(key) >= n}
+
+    def _scan(self, prefix, limit):
+        if len(prefix) >= SHORT_PREFIX:
+            buckets = [self.buckets.get(prefix[:SHORT_PREFIX])]
+        else:  # only under the lock: the bucket dict must not change while it is walked
+            buckets = [bucket for name, bucket in self.buckets.items() if name.startswith(prefix)]
+        found = set()
+        for bucket in buckets:
+            if bucket is None:
+                continue
+            i = bisect_left(bucket.keys, prefix)
+            while i < len(bucket.keys) and bucket.keys[i].startswith(prefix):
+                found.add(bucket.ids[i])
+                i += 1
+        ranked = []
+        for attraction_id in found:
+            entry = self.names.get(attraction_id)  # None if removed since the bucket was read
+            if entry is not None:
+                ranked.append((entry[1], attraction_id))
+        ranked = heapq.nsmallest(limit, ranked) if limit else sorted(ranked)
+        return [attraction_id for _, attraction_id in ranked]
+
+    def finish(self):
+        """
+        Ranks every short prefix after a bulk load, from the buckets whose
+        names start with it.
+        """
+        with self.lock:
+            found = {}
+            for name, bucket in self.buckets.items():
+                for n in range(1, len(name) + 1):
+                    found.setdefault(name[:n], set()).update(bucket.ids)
+            self.top = {prefix: tuple(heapq.nsmallest(self.max_results, ids, key=lambda i: self.names[i][1]))
+                        for prefix, ids in found.items()}
+            self._stats = None
+            self.built_at = time.time()
+
+    def complete(self, text, limit=8):
+        """
+        Returns up to limit (attractionID, name) pairs whose name has a word
+        starting with text, best ranked first.
+        """
+        prefix = normalise(text)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            ids = self.top.get(prefix, ())[:limit]
+        else:
+            ids = self._scan(prefix, limit)
+        matches = []
+        for attraction_id in ids:
+            entry = self.names.get(attraction_id)
+            if entry is not None:
+                matches.append((attraction_id, entry[0]))
+        return matches
+
+    def stats(self):
+        """
+        Returns the number of attractions and keys indexed and an estimate
+        of the memory they use in bytes (kept until the index changes).
+        """
+        with self.lock:
+            if self._stats is not None:
+                return self._stats
+            size = sys.getsizeof(self.buckets) + sys.getsizeof(self.names) + sys.getsizeof(self.top)
+            keys = 0
+            for name, bucket in self.buckets.items():
+                keys += len(bucket.keys)
+                size += sys.getsizeof(name) + sys.getsizeof(bucket) + sys.getsizeof(bucket.keys) \
+                    + sys.getsizeof(bucket.ids) + sum(sys.getsizeof(k) for k in bucket.keys)
+            size += sum(sys.getsizeof(name) + sys.getsizeof(rank) + sys.getsizeof(name_keys)
+                        for name, rank, name_keys in self.names.values())
+            size += sum(sys.getsizeof(p) + sys.getsizeof(best) for p, best in self.top.items())
+            self._stats = {'attractions': len(self.names), 'keys': keys, 'bytes': size}
+            return self._stats
+
+
+_index = PrefixIndex()
+_rebuilding = threading.Lock()
+
+
+def build_index():
+    """
+    Builds a fresh index from the approved attractions (the most popular
+    AUTOCOMPLETE_MAX_ENTRIES of them) and swaps it in.
+    """
+    limit = current_app.config.get('AUTOCOMPLETE_MAX_ENTRIES', 200000)
+    fresh = PrefixIndex(current_app.config.get('AUTOCOMPLETE_MAX_LIMIT', 20), limit)
+    queryset = (Attractions.objects(status="approved").order_by('-rating_count', 'attractionID')
+                .only(*FIELDS).limit(limit).no_cache().as_pymongo())
+    names, keys = {}, []
+    for doc in queryset:
+        attraction_id, name = doc['attractionID'], doc.get('name') or ''
+        rank = PrefixIndex._rank(attraction_id, doc.get('rating_count'), doc.get('rating_mean'))
+        names[attraction_id] = (name, rank, _name_keys(name))
+        keys.extend((key, attraction_id) for key in names[attraction_id][2])
+    keys.sort()
+    for key, attraction_id in keys:
+        bucket = fresh.buckets.setdefault(key[:SHORT_PREFIX], Bucket([], []))
+        bucket.keys.append(key)
+        bucket.ids.append(attraction_id)
+    fresh.names = names
+    fresh.finish()
+    global _index
+    _index = fresh
+    return fresh
+
+
+def reset_index():
+    """
+    Drops the index so the next request builds it again (e.g. in tests).
+    """
+    global _index
+    _index = PrefixIndex()
+
+
+def _refresh(app):
+    try:
+        with app.app_context():
+            build_index()
+    finally:
+        _rebuilding.release()
+
+
+def get_index():
+    """
+    Returns the index, building it on first use. Once it is older than
+    AUTOCOMPLETE_REFRESH_SECONDS a rebuild starts in a background thread and
+    the current index keeps serving until it is ready.
+    """
+    if not _index.built_at:
+        with _rebuilding:
+            if not _index.built_at:
+                build_index()
+    elif time.time() - _index.built_at > current_app.config.get('AUTOCOMPLETE_REFRESH_SECONDS', 300):
+        if _rebuilding.acquire(blocking=False):
+            threading.Thread(target=_refresh, args=(current_app._get_current_object(),), daemon=True).start()
+    return _index
+
+
+def index_gauges():
+    """
+    The index size for /metrics (zero until the index is first used).
+    """
+    stats = _index.stats()
+    return {'autocomplete_index_attractions': stats['attractions'],
+            'autocomplete_index_keys': stats['keys'],
+            'autocomplete_index_bytes': stats['bytes']}
+
+
+metrics.add_gauges(index_gauges)
+
+
+def update_attraction(attraction):
+    """
+    Keeps the index in step with a changed attraction: approved ones are
+    (re)added with their current name and rating, anything else is removed.
+    """
+    if not _index.built_at:
+        return
+    if attraction.status == "approved":
+        _index.add(attraction.attractionID, attraction.name or '', attraction.rating_count, attraction.rating_mean)
+    else:
+        _index.remove(attraction.attractionID)
+
+
+def update_attractions(attraction_ids):
+    """
+    update_attraction for many attractions at once, after a bulk change.
+    """
+    if not _index.built_at or not attraction_ids:
+        return
+    for a in Attractions.objects(attractionID__in=list(attraction_ids)).only(*FIELDS):
+        update_attraction(a)
@@ -0,0 +1,231 @@
+"""
+Benchmark.py
+This file contains the scale benchmarks for the routes in route.py.
+generate_catalog() seeds a deterministic synthetic catalog (the same seed
+always gives the same data) with a skewed number of reviews per attraction,
+in bounded-size insert_many batches so millions of rows fit in little
+memory. run_benchmarks() times every route through the Flask test client
+and records latency percentiles and DB commands per request, which are
+written to a JSON baseline file so later runs can be compared against it.
+
+Run with "flask bench-seed" then "flask bench" against a throwaway database
+(set MONGODB_DB), as seeding drops the existing collections.
+
+"""
+
+
+import json
+import time
+import random
+import platform
+from itertools import islice
+
+from flask import current_app
+
+from application import dbstats
+from application.models import User, Admin, Attractions, Reviews, Counter, ImageBlob
+from application.sequences import seed_sequences, reset_sequences
+from application.ratings import rebuild_ratings
+from application.audit import ensure_indexes
+from application.cache import clear_cache
+
+
+WORDS = ("park", "beach", "castle", "museum", "cathedral", "garden", "farm", "moor",
+         "harbour", "gallery", "abbey", "cliff", "river", "valley", "zoo", "pier")
+PLACES = ("Exeter", "Plymouth", "Torquay", "Dartmoor", "Woolacombe", "Barnstaple",
+          "Totnes", "Dartmouth", "Ilfracombe", "Sidmouth")
+
+ADMIN_USER_ID = 1
+
+
+def user_docs(count, seed):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        yield {'user_id': i, 'first_name': f"User{i}", 'last_name': rng.choice(PLACES),
+               'email': f"user{i}@example.com", 'password': None}
+
+
+def attraction_docs(count, users, seed):
+    """
+    Yields attractions: about 80% approved, 15% pending and 5% rejected.
+    """
+    rng = random.Random(seed + 1)
+    for i in range(1, count + 1):
+        words = rng.sample(WORDS, 2)
+        place = rng.choice(PLACES)
+        roll = rng.random()
+        status = "approved" if roll < 0.8 else "pending" if roll < 0.95 else "rejected"
+        yield {'attractionID': i, 'name': f"{place} {words[0].title()} {i}",
+               'description': f"A {words[0]} near the {words[1]} in {place}.",
+               'location': place, 'status': status, 'created_by': rng.randint(1, users),
+               'rating_count': 0, 'rating_sum': 0, 'rating_mean': 0, 'rating_histogram': {}}
+
+
+def review_docs(count, attractions, seed, skew=3.0):
+    """
+    Yields reviews. The attraction is drawn as attractions * u**skew, so low
+    IDs get most of the reviews, like a few popular attractions in a long
+    tail. About 2% of reviews are reported.
+    """
+    rng = random.Random(seed + 2)
+    for i in range(1, count + 1):
+        doc = {'reviewID': i, 'attractionID': 1 + int(attractions * rng.random() ** skew),
+               'first_name': f"Reviewer{rng.randint(1, 5000)}", 'rating': rng.randint(1, 10),
+               'review': "Synthetic review text " * rng.randint(1, 6), 'reported': rng.random() < 0.02}
+        if doc['reported']:
+            doc.update(report_count=rng.randint(1, 5), reported_at=float(i))
+        yield doc
+
+
+def _insert(model, docs, batch):
+    collection = model._get_collection()
+    while True:
+        chunk = list(islice(docs, batch))
+        if not chunk:
+            return
+        collection.insert_many(chunk, ordered=False)
+
+
+def generate_catalog(users=100000, attractions=50000, reviews=2000000, seed=1, batch=10000, echo=print):
+    """
+    This function drops the collections and seeds the synthetic catalog,
+    then builds indexes, seeds the ID counters and rebuilds the rating
+    summaries so the data looks like it was made through the routes.
+    User 1 is an admin.
+    """
+    for model in (User, Admin, Attractions, Reviews, Counter, ImageBlob):
+        model.drop_collection()
+    reset_sequences()
+    ensure_indexes()
+
+    echo(f"users: {users}")
+    _insert(User, user_docs(users, seed), batch)
+    Admin._get_collection().insert_one({'adminID': 1, 'user_id': ADMIN_USER_ID})
+    echo(f"attractions: {attractions}")
+    _insert(Attractions, attraction_docs(attractions, users, seed), batch)
+    echo(f"reviews: {reviews}")
+    _insert(Reviews, review_docs(reviews, attractions, seed), batch)
+
+    seed_sequences()
+    rebuild_ratings()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _scenarios(rng):
+    """
+    Returns (name, session, request) triples. request(client) makes one
+    request; IDs are drawn at random each call so writes don't repeat.
+    """
+    approved = [a['attractionID'] for a in Attractions.objects(status="approved").only('attractionID').limit(1000).as_pymongo()]
+    pending = [a['attractionID'] for a in Attractions.objects(status="pending").only('attractionID').limit(5000).as_pymongo()]
+    creator = Attractions.objects(status="pending").only('created_by').first()
+    visible = [r['reviewID'] for r in Reviews.objects(reported=False).only('reviewID').limit(5000).as_pymongo()]
+    anon = {}
+    admin = {'user_id': ADMIN_USER_ID, 'username': "User1", 'is_admin': True}
+    owner = {'user_id': creator.created_by if creator else ADMIN_USER_ID, 'username': "Owner"}
+
+    def pick(ids):
+        return rng.choice(ids) if ids else 1
+
+    def report_then_approve(client):
+        review_id = pick(visible)
+        client.post(f"/report_review/{review_id}")
+        return client.post(f"/approve_review/{review_id}")
+
+    return [
+        ("browse", anon, lambda c: c.get("/browse")),
+        ("browse_search", anon, lambda c: c.get(f"/browse?search={rng.choice(WORDS)}")),
+        ("browse_by_rating", anon, lambda c: c.get("/browse?sort=rating&min_rating=5")),
+        ("attraction_detail", anon, lambda c: c.get(f"/attraction/{pick(approved)}")),
+        ("admin", admin, lambda c: c.get("/admin")),
+        ("my_pending", owner, lambda c: c.get("/my_pending")),
+        ("add_review", anon, lambda c: c.post(f"/add_review/{pick(approved)}",
+                                              data={"name": "Bench", "rating": "7", "review": "Benchmark"})),
+        ("report_and_approve_review", admin, report_then_approve),
+        ("approve_attraction", admin, lambda c: c.post(f"/approve_attraction/{pick(pending)}")),
+        ("reject_attraction", admin, lambda c: c.post(f"/reject_attraction/{pick(pending)}")),
+    ]
+
+
+def run_benchmarks(iterations=200, seed=1, only=None, use_cache=False):
+    """
+    This function runs every scenario `iterations` times and returns a dict
+    of per-route results: p50/p95/p99/mean latency in milliseconds and the
+    mean number of DB commands and DB time per request. The page cache is
+    off by default so the numbers measure the routes themselves.
+    """
+    rng = random.Random(seed)
+    current_app.config['TESTING'] = True
+    current_app.config['WTF_CSRF_ENABLED'] = False
+    cache_setting = current_app.config.get('CACHE_ENABLED', True)
+    current_app.config['CACHE_ENABLED'] = use_cache
+    results = {}
+    try:
+        for name, session_data, make_request in _scenarios(rng):
+            if only and name not in only:
+                continue
+            clear_cache()
+            timings, commands, db_ms, errors = [], [], [], 0
+            with current_app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess.clear()
+                    sess.update(session_data)
+                for _ in range(iterations):
+                    dbstats.reset()
+                    start = time.perf_counter()
+                    response = make_request(client)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    count, ms = dbstats.snapshot()
+                    commands.append(count)
+                    db_ms.append(ms)
+                    if response.status_code >= 500:
+                        errors += 1
+            timings.sort()
+            results[name] = {
+                'n': iterations,
+                'p50_ms': round(_percentile(timings, 50), 3),
+                'p95_ms': round(_percentile(timings, 95), 3),
+                'p99_ms': round(_percentile(timings, 99), 3),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+                'db_ops_mean': round(sum(commands) / len(commands), 2),
+                'db_ops_max': max(commands),
+                'db_ms_mean': round(sum(db_ms) / len(db_ms), 3),
+                'errors': errors,
+            }
+    finally:
+        current_app.config['CACHE_ENABLED'] = cache_setting
+    return results
+
+
+def write_baseline(results, path):
+    counts = {model.__name__: model._get_collection().estimated_document_count()
+              for model in (User, Attractions, Reviews)}
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'collections': counts, 'routes': results},
+                  f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline_path, tolerance=0.2):
+    """
+    Compares results with a saved baseline. Returns a list of messages for
+    routes whose p95 latency grew by more than tolerance (20% by default) or
+    which now send more DB commands per request.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['routes']
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+        if now['db_ops_max'] > before['db_ops_max']:
+            regressions.append(f"{name}: db ops {before['db_ops_max']} -> {now['db_ops_max']}")
+    return regressions
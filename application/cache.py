@@ -0,0 +1,184 @@
+"""
+Cache.py
+This file contains the in-process cache for rendered pages and fragments.
+Entries are kept in an LRU bounded by CACHE_MAX_BYTES, expire after
+CACHE_TTL seconds and carry tags such as "browse" or "attraction:5". The
+routes that change what a page shows call invalidate() with the matching
+tags, so cached pages never outlive a change made through this worker;
+other workers see the change once their entry expires.
+
+Full responses are only cached for anonymous visitors with no pending flash
+messages, because the layout shows the logged-in user's name. Fragments
+(browse cards, review lists) hold no per-user content and are shared by
+everyone.
+
+"""
+
+
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, render_template, g, current_app
+from markupsafe import Markup
+
+
+class LRUCache(object):
+    """
+    Thread-safe LRU cache with a byte budget, per-entry TTL and tag-based
+    invalidation. The size of an entry is the length of its stored value.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size, tags=(), ttl=None):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            expires = time.monotonic() + (ttl or self.ttl)
+            self.entries[key] = (value, expires, size, tuple(tags))
+            self.size += size
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+            self.size = 0
+
+    def _drop(self, key):
+        value, expires, size, tags = self.entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+
+cache = LRUCache(64 * 1024 * 1024, 60)
+
+
+def configure_cache(config):
+    """
+    Applies CACHE_MAX_BYTES and CACHE_TTL from an app's config; called when
+    the main blueprint is registered.
+    """
+    cache.max_bytes = config.get('CACHE_MAX_BYTES', cache.max_bytes)
+    cache.ttl = config.get('CACHE_TTL', cache.ttl)
+
+
+def invalidate(*tags):
+    """
+    Drops every cached page and fragment carrying any of the given tags.
+    """
+    cache.invalidate(*tags)
+
+
+def clear_cache():
+    cache.clear()
+
+
+def session_role():
+    """
+    Returns "admin", "user" or "anon" for the current session; part of
+    every cache key.
+    """
+    if session.get('is_admin'):
+        return 'admin'
+    if session.get('user_id'):
+        return 'user'
+    return 'anon'
+
+
+def add_cache_tags(*tags):
+    """
+    Adds tags to the response being cached for this request, for tags only
+    known once the view has run (e.g. the attractions listed on a page).
+    """
+    g.cache_tags = g.get('cache_tags', []) + list(tags)
+
+
+def cache_response(*tags):
+    """
+    This decorator caches the full response of a GET view for anonymous
+    visitors. The key is the path with its query string plus the session
+    role. tags may use the view arguments, e.g. "attraction:{attraction_id}";
+    the view can add more with add_cache_tags(). Cached responses carry an
+    "X-Cache: HIT" header.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (not current_app.config.get('CACHE_ENABLED', True) or request.method != 'GET'
+                    or session_role() != 'anon' or session.get('username') or session.get('_flashes')):
+                return view(*args, **kwargs)
+
+            key = ('page', request.full_path, session_role())
+            hit = cache.get(key)
+            if hit is not None:
+                body, status, headers = hit
+                response = current_app.response_class(body, status=status, headers=headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                body = response.get_data()
+                headers = [(k, v) for k, v in response.headers if k.lower() != 'set-cookie']
+                entry_tags = [t.format(**kwargs) for t in tags] + g.get('cache_tags', [])
+                cache.set(key, (body, response.status_code, headers), len(body), entry_tags)
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_fragment(template, key, tags=(), **context):
+    """
+    Template helper that renders an include template once and serves the
+    HTML from the cache until one of its tags is invalidated, e.g.
+    {{ cached_fragment("includes/attraction_card.html", "card:5",
+    ["attraction:5"], attraction=attraction) }}.
+    """
+    if not current_app.config.get('CACHE_ENABLED', True):
+        return Markup(render_template(template, **context))
+    cache_key = ('fragment', key)
+    html = cache.get(cache_key)
+    if html is None:
+        html = render_template(template, **context)
+        cache.set(cache_key, html, len(html), tags)
+    return Markup(html)
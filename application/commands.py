@@ -0,0 +1,316 @@
+"""
+Commands.py
+This file contains the flask CLI commands used to maintain the database.
+Run them with "flask <command>" from the project root. They are on a
+blueprint with no command group, so they stay top-level commands.
+create_app() registers this blueprint in every process, so each command
+imports the modules it needs (the benchmark generator, import/export,
+the query audit...) only when it runs.
+
+"""
+
+
+import signal
+import threading
+from importlib import import_module
+
+import click
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Blueprint, current_app
+
+
+bp = Blueprint('commands', __name__, cli_group=None)
+
+
+class LazyChoice(click.Choice):
+    """
+    A click.Choice whose choices are a module attribute, read only when a
+    command line is checked or help is shown, so that module is not
+    imported when the app starts.
+    """
+
+    def __init__(self, module, attribute, case_sensitive=True):
+        self.module, self.attribute = module, attribute
+        self.case_sensitive = case_sensitive
+
+    @property
+    def choices(self):
+        return tuple(getattr(import_module(self.module), self.attribute))
+
+
+@bp.cli.command("seed-ids")
+def seed_ids():
+    """
+    Seeds the ID counters from the current max ID of each collection.
+    Run once when upgrading an existing database; safe to run again.
+    """
+    from application.sequences import seed_sequences
+    seed_sequences()
+    click.echo("ID counters seeded")
+
+
+@bp.cli.command("rebuild-ratings")
+def rebuild_ratings_command():
+    """
+    Recomputes every attraction's rating summary from its visible reviews.
+    """
+    from application.ratings import rebuild_ratings
+    count = rebuild_ratings()
+    click.echo(f"Rating summaries rebuilt for {count} attractions")
+
+
+@bp.cli.command("backfill-reports")
+def backfill_reports_command():
+    """
+    Puts reviews reported before report counting into the moderation queue.
+    Run once when upgrading an existing database; safe to run again.
+    """
+    from application.reports import backfill_reports
+    count = backfill_reports()
+    click.echo(f"{count} reported reviews added to the moderation queue")
+
+
+@bp.cli.command("backfill-images")
+def backfill_images():
+    """
+    Makes thumbnails and responsive variants for existing attraction images.
+    """
+    from application.images import backfill_variants
+    count = backfill_variants()
+    click.echo(f"Image variants made for {count} attractions")
+
+
+@bp.cli.command("build-assets")
+def build_assets_command():
+    """
+    Fingerprints and precompresses the files in static/ into static/dist/.
+    Run on each deploy, before starting the app.
+    """
+    from application import assets
+    manifest = assets.build_assets(current_app.static_folder)
+    click.echo(f"{len(manifest)} assets built")
+
+
+@bp.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """
+    Builds the indexes declared on every model (background builds).
+    """
+    from application.audit import ensure_indexes
+    for name in ensure_indexes():
+        click.echo(f"Indexes ensured for {name}")
+
+
+@bp.cli.command("audit-queries")
+@click.option("--seed/--no-seed", default=True, help="Seed synthetic data first if the database is empty.")
+@click.option("--max-ratio", default=10.0, help="Highest acceptable documents examined per document returned.")
+def audit_queries_command(seed, max_ratio):
+    """
+    Explains every route query and reports COLLSCANs and examined/returned
+    ratios. Exits with status 1 if any query has a problem.
+    """
+    from application.audit import ensure_indexes, audit_queries, seed_audit_data
+    from application.models import Attractions
+    if seed and not Attractions.objects.limit(1).first():
+        seed_audit_data()
+    ensure_indexes()
+
+    failed = False
+    for name, result, problems in audit_queries(max_ratio):
+        status = ", ".join(problems) if problems else "ok"
+        click.echo(f"{name:28} {'>'.join(result['stages']):40} "
+                   f"examined {result['docs_examined']:>6} returned {result['returned']:>6}  {status}")
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
+
+
+@bp.cli.command("bench-seed")
+@click.option("--users", default=100000)
+@click.option("--attractions", default=50000)
+@click.option("--reviews", default=2000000)
+@click.option("--seed", default=1, help="Same seed, same data.")
+@click.confirmation_option(prompt="This drops every collection in the configured database. Continue?")
+def bench_seed(users, attractions, reviews, seed):
+    """
+    Seeds a synthetic catalog for the benchmarks. Use a throwaway database.
+    """
+    from application import benchmark
+    benchmark.generate_catalog(users, attractions, reviews, seed, echo=click.echo)
+    click.echo("Catalog seeded")
+
+
+@bp.cli.command("bench")
+@click.option("--iterations", default=200)
+@click.option("--route", "routes", multiple=True, help="Only run these scenarios.")
+@click.option("--output", default="bench_baseline.json", help="Where to write the results.")
+@click.option("--compare", "baseline", default=None, help="Baseline file to compare against.")
+@click.option("--cache/--no-cache", default=False, help="Leave the page cache on.")
+def bench(iterations, routes, output, baseline, cache):
+    """
+    Times every route and writes p50/p95/p99 latency and DB ops per request.
+    Exits with status 1 if --compare finds a regression.
+    """
+    from application import benchmark
+    results = benchmark.run_benchmarks(iterations, only=routes, use_cache=cache)
+    for name, r in results.items():
+        click.echo(f"{name:28} p50 {r['p50_ms']:>8}ms  p95 {r['p95_ms']:>8}ms  p99 {r['p99_ms']:>8}ms  "
+                   f"db ops {r['db_ops_mean']:>6}  errors {r['errors']}")
+    benchmark.write_baseline(results, output)
+    click.echo(f"Results written to {output}")
+    if baseline:
+        regressions = benchmark.compare(results, baseline)
+        for line in regressions:
+            click.echo(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+@bp.cli.command("import-data")
+@click.argument("kind", type=LazyChoice('application.transfer', 'KINDS'))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=LazyChoice('application.transfer', 'FORMATS'), default=None,
+              help="Defaults to csv for .csv files and ndjson otherwise.")
+@click.option("--batch-size", default=1000)
+@click.option("--keep-ids", is_flag=True, help="Use the IDs in the file instead of assigning new ones.")
+@click.option("--status", type=LazyChoice('application.transfer', 'STATUSES'), default="approved",
+              help="Status of imported attractions that have none.")
+@click.option("--restart", is_flag=True, help="Ignore a saved checkpoint and start from the first line.")
+def import_data(kind, path, fmt, batch_size, keep_ids, status, restart):
+    """
+    Imports attractions or reviews from an NDJSON or CSV file in batches.
+    Run it again after an interruption to carry on from the last batch.
+    """
+    from application import transfer
+    try:
+        result = transfer.import_file(kind, path, fmt, batch_size, keep_ids, status,
+                                      restart=restart, echo=click.echo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f"{result.inserted} {kind} imported, {result.duplicates} already present, "
+               f"{result.invalid} invalid")
+
+
+@bp.cli.command("export-data")
+@click.argument("kind", type=LazyChoice('application.transfer', 'KINDS'))
+@click.option("--output", "-o", type=click.File("w"), default="-", help="Defaults to standard output.")
+@click.option("--format", "fmt", type=LazyChoice('application.transfer', 'FORMATS'), default="ndjson")
+@click.option("--batch-size", default=1000)
+def export_data(kind, output, fmt, batch_size):
+    """
+    Streams the approved attractions, or their visible reviews, as NDJSON or CSV.
+    """
+    from application import transfer
+    for line in transfer.export_lines(kind, fmt, batch_size):
+        output.write(line)
+
+
+@bp.cli.command("geocode")
+@click.argument("gazetteer", type=click.Path(exists=True, dir_okay=False))
+@click.option("--overwrite", is_flag=True, help="Also replace coordinates that are already set.")
+def geocode(gazetteer, overwrite):
+    """
+    Fills in attraction coordinates from their location text using a local
+    gazetteer file (a name,latitude,longitude CSV or a GeoNames dump).
+    """
+    from application import geo
+    places = geo.load_gazetteer(gazetteer)
+    click.echo(f"{len(places)} place names loaded")
+    geocoded, missing = geo.backfill_points(places, overwrite=overwrite)
+    click.echo(f"{geocoded} attractions geocoded, {missing} locations not found")
+
+
+@bp.cli.command("profile-startup")
+@click.option("--target", type=LazyChoice('application.startup', 'TARGETS'), default="app",
+              help="Time importing the package only, or creating the whole app.")
+@click.option("--limit", default=15, help="How many of the slowest modules to list.")
+def profile_startup(target, limit):
+    """
+    Reports the import time of every module at cold start, measured in a
+    fresh interpreter with python -X importtime.
+    """
+    from application import startup
+    rows = startup.profile_startup(target)
+    total, count, slowest, own = startup.summarise(rows, limit)
+    click.echo(f"{count} modules imported in {total * 1000:.1f}ms")
+    click.echo("Slowest modules (own time):")
+    for row in slowest:
+        click.echo(f"  {row.self_us / 1000:8.1f}ms  {row.module}")
+    click.echo("Application modules (including their imports):")
+    for row in own:
+        click.echo(f"  {row.cumulative_us / 1000:8.1f}ms  {row.module}")
+
+
+@bp.cli.group("jobs")
+def jobs_group():
+    """
+    Background job queue commands.
+    """
+
+
+@jobs_group.command("worker")
+@click.option("--threads", default=None, type=int, help="Worker threads (defaults to JOBS_THREADS).")
+def jobs_worker(threads):
+    """
+    Runs jobs until interrupted (Ctrl+C or SIGTERM), then lets the jobs in
+    progress finish. Use with JOBS_MODE=worker to keep jobs out of the web
+    processes.
+    """
+    from application import jobs
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    pool = jobs.start_workers(current_app._get_current_object(), threads)
+    click.echo(f"Running jobs with {pool.size} threads")
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    click.echo("Finishing the jobs in progress")
+    jobs.stop_workers(timeout=current_app.config.get('JOBS_LEASE_SECONDS', 300))
+
+
+@jobs_group.command("run")
+@click.option("--limit", default=None, type=int, help="Stop after this many jobs.")
+def jobs_run(limit):
+    """
+    Runs the jobs that are due now in this process, then exits.
+    """
+    from application import jobs
+    succeeded, failed = jobs.work_off(limit)
+    click.echo(f"{succeeded} jobs done, {failed} failed")
+
+
+@jobs_group.command("stats")
+def jobs_stats():
+    """
+    Shows the queue depth and recent job latency.
+    """
+    from application import jobs
+    for name, value in jobs.queue_stats().items():
+        click.echo(f"{name:22} {value}")
+
+
+@jobs_group.command("retry")
+@click.argument("job_ids", nargs=-1)
+def jobs_retry(job_ids):
+    """
+    Queues failed jobs again: the given IDs, or every failed job.
+    """
+    from application import jobs
+    try:
+        ids = [ObjectId(i) for i in job_ids]
+    except InvalidId as error:
+        raise click.BadParameter(str(error))
+    click.echo(f"{jobs.retry_failed(ids)} jobs queued again")
+
+
+@jobs_group.command("purge")
+@click.option("--days", default=7.0, help="Delete finished jobs older than this.")
+def jobs_purge(days):
+    """
+    Deletes finished (done or failed) jobs.
+    """
+    from application import jobs
+    click.echo(f"{jobs.purge(days * 24 * 3600)} jobs deleted")
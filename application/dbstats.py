@@ -0,0 +1,100 @@
+"""
+Dbstats.py
+This file counts the MongoDB commands sent by the current thread, using
+pymongo command monitoring. create_app() installs the listener before the
+database connection is made (pymongo only attaches listeners to clients
+created after registration). Code that wants to know how many commands a
+piece of work sends calls reset() before and snapshot() after; the
+benchmarks and metrics.py use it to report DB operations per request.
+
+"""
+
+
+import threading
+
+from pymongo import monitoring
+
+
+_local = threading.local()
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Adds every command that finishes (successfully or not) to the calling
+    thread's count and total time. Commands slower than slow_ms are passed
+    to each of slow_handlers as (milliseconds, shape).
+    """
+
+    slow_ms = None
+    slow_handlers = []
+
+    def started(self, event):
+        if self.slow_ms is not None:
+            pending = getattr(_local, 'pending', None)
+            if pending is None:
+                pending = _local.pending = {}
+            pending[event.request_id] = (event.command_name, event.command)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        _local.count = getattr(_local, 'count', 0) + 1
+        _local.micros = getattr(_local, 'micros', 0) + event.duration_micros
+        pending = getattr(_local, 'pending', None)
+        started = pending.pop(event.request_id, None) if pending else None
+        if started and self.slow_ms is not None and event.duration_micros >= self.slow_ms * 1000:
+            shape = query_shape(*started)
+            for handler in self.slow_handlers:
+                handler(event.duration_micros / 1000.0, shape)
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(value[0])] if value else []
+    return '?'
+
+
+def query_shape(command_name, command):
+    """
+    Returns a short description of a command with its values replaced by
+    "?", e.g. "find attractions filter={'status': '?'} sort={'attractionID': '?'}",
+    so the same query with different values is logged the same way.
+    """
+    parts = [command_name, str(command.get(command_name, ''))]
+    for key in ('filter', 'query', 'sort', 'pipeline', 'updates', 'deletes'):
+        if key in command:
+            parts.append(f"{key}={_shape(command[key])}")
+    return ' '.join(parts)
+
+
+def reset():
+    _local.count = 0
+    _local.micros = 0
+
+
+def snapshot():
+    """
+    Returns (commands, milliseconds) recorded on this thread since reset().
+    """
+    return getattr(_local, 'count', 0), getattr(_local, 'micros', 0) / 1000.0
+
+
+listener = CommandCounter()
+_installed = []
+
+
+def install(slow_ms=None):
+    """
+    Registers the listener with pymongo (once per process) and sets the
+    slow command threshold in milliseconds.
+    """
+    listener.slow_ms = slow_ms
+    if not _installed:
+        monitoring.register(listener)
+        _installed.append(listener)
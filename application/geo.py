@@ -0,0 +1,202 @@
+"""
+Geo.py
+This file contains the location queries for attractions. Attractions can
+have optional coordinates, stored in Attractions.point as a GeoJSON point
+([longitude, latitude]) with a 2dsphere index (see models.py). On top of
+the approved status filter this allows:
+
+- nearest(): the closest attractions to a point, sorted by distance ($near)
+- within_radius(): attractions within a distance of a point ($centerSphere)
+- within_box(): attractions inside a longitude/latitude box
+
+geo_query() maps the lat, lng, radius (km) and bbox (west,south,east,north)
+request parameters used by the browse page and the API onto these.
+backfill_points() fills in the coordinates of existing attractions from
+their free-text location using a local gazetteer file, not an online
+geocoding service; run it with "flask geocode <file>".
+
+"""
+
+
+import csv
+
+from pymongo import UpdateOne
+from flask import current_app
+
+from application.models import Attractions
+from application.search import tokenize
+
+
+EARTH_RADIUS_KM = 6378.1
+
+
+class GeoError(ValueError):
+    """
+    Raised for coordinates or geo parameters that are missing or out of range.
+    """
+
+
+def _float(value, name, low, high):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise GeoError(f"{name} must be a number")
+    if not low <= value <= high:
+        raise GeoError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def make_point(lat, lng):
+    """
+    Returns the GeoJSON point for a latitude and longitude (numbers or
+    strings), or raises GeoError.
+    """
+    return {'type': 'Point', 'coordinates': [_float(lng, 'longitude', -180, 180),
+                                             _float(lat, 'latitude', -90, 90)]}
+
+
+def point_from_form(form):
+    """
+    Returns the point for the optional latitude/longitude fields of the
+    attraction forms: None if both are blank, GeoError if only one is given
+    or either is invalid.
+    """
+    lat, lng = (form.get('latitude') or '').strip(), (form.get('longitude') or '').strip()
+    if not lat and not lng:
+        return None
+    if not lat or not lng:
+        raise GeoError("Give both a latitude and a longitude, or neither")
+    return make_point(lat, lng)
+
+
+def nearest(queryset, lat, lng, max_km=None):
+    """
+    Orders queryset by distance from (lat, lng), nearest first, keeping only
+    attractions within max_km if given. Limit the result yourself.
+    """
+    point = make_point(lat, lng)
+    if max_km:
+        return queryset.filter(point__near=point, point__max_distance=max_km * 1000)
+    return queryset.filter(point__near=point)
+
+
+def within_radius(queryset, lat, lng, km):
+    point = make_point(lat, lng)
+    return queryset.filter(point__geo_within_sphere=[point['coordinates'], km / EARTH_RADIUS_KM])
+
+
+def within_box(queryset, west, south, east, north):
+    west, east = _float(west, 'west', -180, 180), _float(east, 'east', -180, 180)
+    south, north = _float(south, 'south', -90, 90), _float(north, 'north', -90, 90)
+    if south >= north or west >= east:
+        raise GeoError("bbox must be west,south,east,north")
+    ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+    return queryset.filter(point__geo_within={'type': 'Polygon', 'coordinates': [ring]})
+
+
+def geo_query(queryset, args, by_distance=False):
+    """
+    This function applies the geo request parameters in args to an
+    Attractions queryset and returns (queryset, sorted_by_distance).
+    bbox=west,south,east,north keeps attractions inside the box. lat and lng
+    with radius (km) keep attractions within that distance; with
+    by_distance they also sort nearest first, in which case the caller must
+    limit the results instead of keyset paging them (and cannot combine
+    them with a text search or a bbox). Raises GeoError for bad parameters.
+    """
+    bbox = args.get('bbox')
+    if bbox:
+        if by_distance:
+            raise GeoError("bbox cannot be combined with sorting by distance")
+        parts = bbox.split(',')
+        if len(parts) != 4:
+            raise GeoError("bbox must be west,south,east,north")
+        queryset = within_box(queryset, *parts)
+
+    lat, lng = args.get('lat'), args.get('lng')
+    if not lat and not lng:
+        return queryset, False
+    radius = _float(args.get('radius'), 'radius', 0, 20000) if args.get('radius') else None
+    if by_distance:
+        return nearest(queryset, lat, lng, radius), True
+    if radius:
+        queryset = within_radius(queryset, lat, lng, radius)
+    else:
+        make_point(lat, lng)
+    return queryset, False
+
+
+def near_limit():
+    return current_app.config.get('GEO_NEAR_LIMIT', 50)
+
+
+def _normalise(name):
+    return ' '.join(tokenize(name))
+
+
+def load_gazetteer(path):
+    """
+    This function reads a gazetteer file into {normalised place name:
+    (latitude, longitude)}. Two layouts are accepted: a CSV file with a
+    header row containing name, latitude and longitude columns, or a
+    GeoNames dump (tab separated, no header, e.g. GB.txt from
+    download.geonames.org), where alternate names are indexed too and the
+    most populous place wins when several share a name.
+    """
+    places = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                places.setdefault(_normalise(row['name']), (float(row['latitude']), float(row['longitude'])))
+            return places
+
+        population = {}
+        for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if len(row) < 15:
+                continue
+            coords, people = (float(row[4]), float(row[5])), int(row[14] or 0)
+            for name in [row[1], row[2]] + row[3].split(','):
+                key = _normalise(name)
+                if key and people >= population.get(key, -1):
+                    places[key], population[key] = coords, people
+    return places
+
+
+def geocode(location, places):
+    """
+    Looks a free-text location up in a gazetteer from load_gazetteer: first
+    the whole string, then each comma separated part in turn, so
+    "Torquay, Devon" finds Torquay. Returns (lat, lng) or None.
+    """
+    if not location:
+        return None
+    for candidate in [location] + location.split(','):
+        found = places.get(_normalise(candidate))
+        if found:
+            return found
+    return None
+
+
+def backfill_points(places, batch=1000, overwrite=False):
+    """
+    This function geocodes every attraction without coordinates (or every
+    attraction, with overwrite) from its location string, streaming the
+    attractions through a projected cursor and writing the points with one
+    bulk_write per batch. Returns (geocoded, not found).
+    """
+    queryset = Attractions.objects if overwrite else Attractions.objects(point=None)
+    collection = Attractions._get_collection()
+    requests, geocoded, missing = [], 0, 0
+    for doc in queryset.only('attractionID', 'location').batch_size(batch).no_cache().as_pymongo():
+        found = geocode(doc.get('location'), places)
+        if not found:
+            missing += 1
+            continue
+        requests.append(UpdateOne({'_id': doc['_id']}, {'$set': {'point': make_point(*found)}}))
+        geocoded += 1
+        if len(requests) >= batch:
+            collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+    return geocoded, missing
@@ -0,0 +1,143 @@
+"""
+Images.py
+This file contains the image processing stage for attraction images.
+After an image is uploaded, a background job (see jobs.py) resizes it into
+a fixed size card thumbnail and a few responsive widths in WebP, and stores the
+variant paths on the attraction. Templates then use image_srcset() so the
+browser downloads the smallest variant that fits instead of the original.
+Pillow is optional: without it, no variants are made and the original
+image is served as before.
+
+"""
+
+
+import os
+import logging
+
+from flask import url_for, current_app
+
+from application.models import Attractions
+from application.cache import invalidate
+from application.jobs import task, enqueue
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is an optional dependency
+    Image = None
+
+
+log = logging.getLogger(__name__)
+
+
+def _images_root():
+    return os.path.join(current_app.root_path, 'static')
+
+
+def _save(image, path, size=None, crop=False):
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    elif size:
+        image = image.copy()
+        image.thumbnail(size, Image.LANCZOS)
+    image.save(path, current_app.config.get('IMAGE_FORMAT', 'WEBP'), quality=current_app.config.get('IMAGE_QUALITY', 80), method=4)
+
+
+def make_variants(image):
+    """
+    This function makes the thumbnail and responsive variants for one image.
+    image is the path relative to static/ as stored on Attractions.image
+    (e.g. "images/beach.jpg"). It returns a dict mapping "thumb" and each
+    width (as a string) to the variant path relative to static/, or an empty
+    dict if Pillow is missing or the file cannot be read. Widths larger than
+    the original are skipped.
+    """
+    if Image is None or not image:
+        return {}
+    source = os.path.join(_images_root(), image)
+    stem = os.path.splitext(os.path.basename(image))[0]
+    ext = current_app.config.get('IMAGE_FORMAT', 'WEBP').lower()
+    variants_dir = os.path.join(_images_root(), 'images', 'variants')
+    os.makedirs(variants_dir, exist_ok=True)
+
+    try:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original).convert('RGB')
+            variants = {}
+            thumb = f"images/variants/{stem}-thumb.{ext}"
+            _save(original, os.path.join(_images_root(), thumb), current_app.config['IMAGE_THUMBNAIL_SIZE'], crop=True)
+            variants['thumb'] = thumb
+            for width in current_app.config['IMAGE_WIDTHS']:
+                if width > original.width:
+                    continue
+                path = f"images/variants/{stem}-{width}.{ext}"
+                _save(original, os.path.join(_images_root(), path), (width, original.height))
+                variants[str(width)] = path
+            return variants
+    except (OSError, ValueError):
+        log.warning("could not make variants for %s", image, exc_info=True)
+        return {}
+
+
+@task("images.variants", max_attempts=3)
+def process_attraction_image(attraction_id, image):
+    """
+    Makes the variants for an attraction's image and stores them on the
+    attraction. The update only applies while the attraction still has the
+    same image, so a slow job can't overwrite the variants of a newer upload.
+    """
+    variants = make_variants(image)
+    Attractions.objects(attractionID=attraction_id, image=image).update(set__image_variants=variants)
+    invalidate(f"attraction:{attraction_id}")
+    return variants
+
+
+def schedule_variants(attraction):
+    """
+    Queues variant generation for an attraction's current image as a
+    background job so the upload request returns straight away. The job is
+    keyed on the attraction and image, so saving the same upload twice
+    queues it once. With IMAGE_PROCESSING = "sync" (used by the tests) the
+    work is done inline.
+    """
+    if not attraction.image or Image is None:
+        return
+    if current_app.config.get('IMAGE_PROCESSING', 'async') == 'sync':
+        process_attraction_image(attraction.attractionID, attraction.image)
+        return
+    enqueue("images.variants", key=f"variants:{attraction.attractionID}:{attraction.image}",
+            attraction_id=attraction.attractionID, image=attraction.image)
+
+
+def backfill_variants():
+    """
+    Makes variants for every attraction that has an image but no variants
+    yet. Returns the number of attractions processed.
+    """
+    count = 0
+    for a in Attractions.objects(image__ne=None, image_variants__in=[None, {}]).only('attractionID', 'image'):
+        process_attraction_image(a.attractionID, a.image)
+        count += 1
+    return count
+
+
+def image_srcset(attraction):
+    """
+    Template helper returning the srcset for an attraction's variants
+    ("... 440w, ... 640w"), or an empty string if there are none. The
+    thumbnail is included at its own width, so small slots such as the
+    browse cards pick it.
+    """
+    variants = attraction.image_variants or {}
+    candidates = {int(k): v for k, v in variants.items() if k.isdigit()}
+    if 'thumb' in variants:
+        candidates.setdefault(current_app.config['IMAGE_THUMBNAIL_SIZE'][0], variants['thumb'])
+    return ', '.join(f"{url_for('static', filename=candidates[w])} {w}w" for w in sorted(candidates))
+
+
+def image_src(attraction, variant='thumb'):
+    """
+    Template helper returning the URL of one variant of an attraction's
+    image, falling back to the original upload when it has not been made.
+    """
+    variants = attraction.image_variants or {}
+    return url_for('static', filename=variants.get(variant) or attraction.image)
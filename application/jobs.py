@@ -0,0 +1,333 @@
+"""
+Jobs.py
+This file contains the background job queue, for work that should not
+hold up the request that caused it (e.g. making image variants). A route
+calls enqueue() and returns; a worker thread picks the job up later.
+
+Jobs are documents in the "jobs" collection (models.Job), so they survive a
+restart and can be run by any process:
+
+- enqueue() inserts a job. A job may carry an idempotency key: while a job
+  with the same key is queued or running, enqueueing it again does nothing.
+- Workers claim the oldest job that is due with one find_one_and_update,
+  which marks it running with a lease. A job that fails is retried with
+  exponential backoff up to its task's max_attempts, then marked failed.
+  A job whose worker died is queued again once its lease runs out, so
+  tasks must be safe to run twice.
+- With JOBS_MODE = "thread" each web process starts JOBS_THREADS worker
+  threads when it warms up (server.warm_up()), or else on its first
+  enqueue; with "worker" jobs are only run by
+  "flask jobs worker" processes. "flask jobs stats" and /metrics report
+  the queue depth and how long jobs wait and run.
+
+Tasks are plain functions registered with @task("name") and called with
+the keyword arguments given to enqueue(), inside an app context.
+
+"""
+
+
+import os
+import time
+import random
+import socket
+import logging
+import threading
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from flask import current_app
+
+from application.models import Job
+from application.metrics import metrics
+
+
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# task name -> (function, max attempts)
+TASKS = {}
+
+_wake = threading.Event()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def task(name, max_attempts=5):
+    """
+    Decorator registering a function as the task run for jobs called name.
+    """
+    def decorator(func):
+        TASKS[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def _collection():
+    return Job._get_collection()
+
+
+def enqueue(name, key=None, delay=0, **args):
+    """
+    This function queues a job running the task name with args (which must
+    be BSON-serialisable) and returns its ID, or None if a job with the same
+    key is already queued or running. delay postpones it by that many
+    seconds. Raises ValueError for unknown tasks.
+    """
+    if name not in TASKS:
+        raise ValueError(f"Unknown task {name}")
+    now = time.time()
+    job = {'name': name, 'args': args, 'status': QUEUED, 'attempts': 0,
+           'max_attempts': TASKS[name][1], 'run_at': now + delay, 'created_at': now}
+    if key:
+        job.update(key=key, active_key=key)
+    try:
+        job_id = _collection().insert_one(job).inserted_id
+    except DuplicateKeyError:
+        return None
+    if current_app.config.get('JOBS_MODE', 'thread') == 'thread':
+        start_workers(current_app._get_current_object())
+    _wake.set()
+    return job_id
+
+
+def _claim(worker_id):
+    now = time.time()
+    return _collection().find_one_and_update(
+        {'status': QUEUED, 'run_at': {'$lte': now}},
+        {'$set': {'status': RUNNING, 'started_at': now, 'worker': worker_id,
+                  'lease_until': now + current_app.config.get('JOBS_LEASE_SECONDS', 300)},
+         '$inc': {'attempts': 1}},
+        sort=[('run_at', 1)], return_document=ReturnDocument.AFTER)
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before retrying a job that has failed attempts times:
+    JOBS_BACKOFF_SECONDS doubled for every further attempt, capped at
+    JOBS_BACKOFF_MAX_SECONDS, with jitter so failed jobs don't retry in step.
+    """
+    base = current_app.config.get('JOBS_BACKOFF_SECONDS', 5)
+    delay = min(base * 2 ** (attempts - 1), current_app.config.get('JOBS_BACKOFF_MAX_SECONDS', 3600))
+    return delay * random.uniform(0.5, 1)
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records the outcome. The updates only apply
+    while the job is still on this attempt, so a worker that overran its
+    lease can't overwrite a newer attempt. Returns True on success.
+    """
+    current = {'_id': job['_id'], 'status': RUNNING, 'attempts': job['attempts']}
+    entry = TASKS.get(job['name'])
+    try:
+        if entry is None:
+            raise LookupError(f"Unknown task {job['name']}")
+        entry[0](**job.get('args', {}))
+    except Exception as error:
+        now = time.time()
+        message = f"{type(error).__name__}: {error}"[:1000]
+        if job['attempts'] >= job.get('max_attempts', 1):
+            log.exception("job %s (%s) failed for good", job['_id'], job['name'])
+            _collection().update_one(current, {'$set': {'status': FAILED, 'finished_at': now, 'error': message},
+                                               '$unset': {'active_key': '', 'lease_until': ''}})
+        else:
+            log.warning("job %s (%s) failed, will retry: %s", job['_id'], job['name'], message)
+            _collection().update_one(current, {'$set': {'status': QUEUED, 'run_at': now + backoff(job['attempts']),
+                                                        'error': message},
+                                               '$unset': {'lease_until': ''}})
+        return False
+    _collection().update_one(current, {'$set': {'status': DONE, 'finished_at': time.time()},
+                                       '$unset': {'active_key': '', 'lease_until': ''}})
+    return True
+
+
+def requeue_stale():
+    """
+    Queues running jobs whose lease has run out again (their worker died or
+    hung), or marks them failed if they have no attempts left. Returns how
+    many were queued again.
+    """
+    now = time.time()
+    stale = {'status': RUNNING, 'lease_until': {'$lt': now}}
+    _collection().update_many(dict(stale, **{'$expr': {'$gte': ['$attempts', '$max_attempts']}}),
+                              {'$set': {'status': FAILED, 'finished_at': now, 'error': "lease expired"},
+                               '$unset': {'active_key': '', 'lease_until': ''}})
+    return _collection().update_many(stale, {'$set': {'status': QUEUED, 'run_at': now},
+                                             '$unset': {'lease_until': ''}}).modified_count
+
+
+def work_off(limit=None, worker_id=None):
+    """
+    Runs due jobs one after another in this thread until there are none
+    left (or limit have run). Returns (succeeded, failed). Used by the tests
+    and "flask jobs run".
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        job = _claim(worker_id)
+        if job is None:
+            break
+        if run_job(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+class WorkerPool(object):
+    """
+    Worker threads running jobs for one app. Idle threads poll every
+    JOBS_POLL_SECONDS, or sooner when this process enqueues a job. Once per
+    lease period one of them also requeues stale jobs and deletes finished
+    jobs older than JOBS_KEEP_SECONDS.
+    """
+
+    def __init__(self, app, threads):
+        self.app = app
+        self.threads = []
+        self.size = threads
+        self.pid = os.getpid()
+        self.stopping = threading.Event()
+        self.reaped_at = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self._run, args=(i,), name=f"jobs-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def _run(self, number):
+        worker_id = f"{socket.gethostname()}:{self.pid}:{number}"
+        with self.app.app_context():
+            poll = current_app.config.get('JOBS_POLL_SECONDS', 1)
+            lease = current_app.config.get('JOBS_LEASE_SECONDS', 300)
+            while not self.stopping.is_set():
+                try:
+                    self._reap(lease)
+                    job = _claim(worker_id)
+                except PyMongoError:
+                    log.warning("could not claim a job", exc_info=True)
+                    self.stopping.wait(poll)
+                    continue
+                if job is None:
+                    _wake.wait(poll)
+                    _wake.clear()
+                    continue
+                try:
+                    run_job(job)
+                except PyMongoError:
+                    # the outcome was not recorded; the lease runs out and it is retried
+                    log.warning("could not record the outcome of job %s", job['_id'], exc_info=True)
+
+    def _reap(self, lease):
+        with self.lock:
+            if time.time() - self.reaped_at < lease:
+                return
+            self.reaped_at = time.time()
+        requeue_stale()
+        purge(current_app.config.get('JOBS_KEEP_SECONDS', 7 * 24 * 3600))
+
+    def stop(self, timeout=None):
+        """
+        Stops the threads once their current job is done, waiting up to
+        timeout seconds for each.
+        """
+        self.stopping.set()
+        _wake.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+def start_workers(app, threads=None):
+    """
+    Starts this process's worker pool for app if it isn't running yet (or
+    was inherited from a parent process across a fork) and returns it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid() or _pool.stopping.is_set():
+            _pool = WorkerPool(app, threads or app.config.get('JOBS_THREADS', 2)).start()
+        return _pool
+
+
+def stop_workers(timeout=None):
+    """
+    Stops this process's worker pool, if any (on shutdown).
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and pool.pid == os.getpid():
+        pool.stop(timeout)
+
+
+def queue_stats(window=300):
+    """
+    This function returns the state of the queue: the number of jobs
+    queued, ready to run (queued and due), running and failed, how long the
+    oldest ready job has waited, and for the jobs finished in the last
+    window seconds how many there were and their mean wait and run times.
+    """
+    now = time.time()
+    collection = _collection()
+    stats = {status: collection.count_documents({'status': status}) for status in (QUEUED, RUNNING, FAILED)}
+    ready = {'status': QUEUED, 'run_at': {'$lte': now}}
+    stats['ready'] = collection.count_documents(ready)
+    oldest = collection.find_one(ready, {'run_at': 1}, sort=[('run_at', 1)])
+    stats['oldest_ready_seconds'] = round(now - oldest['run_at'], 3) if oldest else 0
+
+    recent = list(collection.aggregate([
+        {'$match': {'status': DONE, 'finished_at': {'$gte': now - window}}},
+        {'$group': {'_id': None, 'count': {'$sum': 1},
+                    'wait': {'$avg': {'$subtract': ['$started_at', '$run_at']}},
+                    'run': {'$avg': {'$subtract': ['$finished_at', '$started_at']}}}},
+    ]))
+    recent = recent[0] if recent else {}
+    stats['done_recently'] = recent.get('count', 0)
+    stats['wait_seconds'] = round(recent.get('wait') or 0, 3)
+    stats['run_seconds'] = round(recent.get('run') or 0, 3)
+    return stats
+
+
+def job_gauges():
+    """
+    The queue stats for /metrics.
+    """
+    return {f"jobs_{name}": value for name, value in queue_stats().items()}
+
+
+metrics.add_gauges(job_gauges)
+
+
+def retry_failed(job_ids=None):
+    """
+    Queues failed jobs (all of them, or those in job_ids) again with a
+    fresh set of attempts. Returns how many.
+    """
+    query = {'status': FAILED}
+    if job_ids:
+        query['_id'] = {'$in': list(job_ids)}
+    requeued = 0
+    for job in _collection().find(query, {'key': 1}):
+        update = {'$set': {'status': QUEUED, 'attempts': 0, 'run_at': time.time()}, '$unset': {'finished_at': ''}}
+        if job.get('key'):
+            update['$set']['active_key'] = job['key']
+        try:
+            requeued += _collection().update_one({'_id': job['_id'], 'status': FAILED}, update).modified_count
+        except DuplicateKeyError:
+            continue  # a newer job with the same key is already queued
+    return requeued
+
+
+def purge(older_than):
+    """
+    Deletes finished jobs (done or failed) that finished more than
+    older_than seconds ago. Returns how many.
+    """
+    cutoff = time.time() - older_than
+    return _collection().delete_many({'status': {'$in': [DONE, FAILED]},
+                                      'finished_at': {'$lt': cutoff}}).deleted_count
@@ -0,0 +1,44 @@
+"""
+Listing.py
+This file contains the lightweight read path used by the listing pages.
+Instead of building a full MongoEngine Document per row, a listing asks the
+server for only the fields its template uses (only()) and takes the raw
+documents (as_pymongo()), wrapped in Row so that templates and Python code
+can still write row.name. Field sets for each listing live here so routes
+and templates agree on what is loaded.
+
+"""
+
+
+class Row(dict):
+    """
+    A raw document with attribute access; missing fields read as None.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+# fields used by includes/attraction_card.html
+CARD_FIELDS = ('attractionID', 'name', 'image', 'image_variants', 'rating_count', 'rating_mean')
+# admin users tab and users.html; never the password hash
+USER_FIELDS = ('user_id', 'first_name', 'last_name', 'email')
+# admin pending attractions tab
+PENDING_FIELDS = ('attractionID', 'name')
+# admin reported reviews tab
+REPORTED_REVIEW_FIELDS = ('reviewID', 'attractionID', 'first_name', 'rating', 'review', 'report_count',
+                          'reported_at', 'claimed_by', 'claimed_until')
+# includes/review_list.html, the review feed on the attraction detail page
+REVIEW_FIELDS = ('reviewID', 'first_name', 'rating', 'review')
+# my_pending.html
+MY_PENDING_FIELDS = ('attractionID', 'name', 'description', 'location', 'image', 'status')
+
+
+def fetch_rows(queryset, fields):
+    """
+    Runs queryset with a server-side projection on fields and returns the
+    results as a list of Row objects.
+    """
+    return [Row(doc) for doc in queryset.only(*fields).as_pymongo()]
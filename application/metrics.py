@@ -0,0 +1,188 @@
+"""
+Metrics.py
+This file contains the request and database metrics exposed on /metrics in
+the Prometheus text format. For every endpoint it records a latency
+histogram, request counts by status, the number of requests in flight, a
+response size histogram and the MongoDB commands sent and time spent in
+them (counted by the listener in dbstats.py). MongoDB commands slower than
+SLOW_QUERY_MS are logged to the "application.slow_queries" logger with the
+query shape (values replaced by "?") and counted per command.
+
+Everything is plain in-memory counters updated under one lock, cheap enough
+to leave on in production. Each worker process reports its own numbers.
+Other modules can add gauges with metrics.add_gauges(source), where source()
+returns {metric name: value} when /metrics is read.
+
+"""
+
+
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+from flask import Blueprint, g, request, current_app
+
+from application import dbstats
+
+
+slow_log = logging.getLogger('application.slow_queries')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152)
+DB_OPS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram(object):
+    """
+    Cumulative histogram with fixed bucket bounds, as Prometheus expects.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.total}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class Metrics(object):
+    """
+    All metrics for one process, keyed by endpoint name.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.sizes = {}
+        self.db_ops = {}
+        self.requests = {}
+        self.in_flight = {}
+        self.db_commands = {}
+        self.db_seconds = {}
+        self.slow_commands = {}
+        self.gauge_sources = []
+
+    def started(self, endpoint):
+        with self.lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def finished(self, endpoint):
+        with self.lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 1) - 1
+
+    def observe(self, endpoint, method, status, seconds, size, commands, db_ms):
+        with self.lock:
+            key = (endpoint, method)
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.sizes.setdefault(endpoint, Histogram(SIZE_BUCKETS)).observe(size)
+            self.db_ops.setdefault(endpoint, Histogram(DB_OPS_BUCKETS)).observe(commands)
+            status_key = (endpoint, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self.db_commands[endpoint] = self.db_commands.get(endpoint, 0) + commands
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0) + db_ms / 1000.0
+
+    def slow_command(self, ms, shape):
+        command = shape.split(' ', 1)[0]
+        with self.lock:
+            self.slow_commands[command] = self.slow_commands.get(command, 0) + 1
+        slow_log.warning("slow mongodb command %.1fms: %s", ms, shape)
+
+    def add_gauges(self, source):
+        self.gauge_sources.append(source)
+
+    def render(self):
+        out = []
+        for source in self.gauge_sources:
+            for name, value in sorted(source().items()):
+                out.append(f'# TYPE {name} gauge')
+                out.append(f'{name} {value}')
+        with self.lock:
+            out.append('# TYPE http_request_duration_seconds histogram')
+            for (endpoint, method), hist in sorted(self.latency.items()):
+                out.extend(hist.lines('http_request_duration_seconds', f'endpoint="{endpoint}",method="{method}"'))
+            out.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                out.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            out.append('# TYPE http_requests_in_flight gauge')
+            for endpoint, count in sorted(self.in_flight.items()):
+                out.append(f'http_requests_in_flight{{endpoint="{endpoint}"}} {count}')
+            out.append('# TYPE http_response_size_bytes histogram')
+            for endpoint, hist in sorted(self.sizes.items()):
+                out.extend(hist.lines('http_response_size_bytes', f'endpoint="{endpoint}"'))
+            out.append('# TYPE mongodb_commands_per_request histogram')
+            for endpoint, hist in sorted(self.db_ops.items()):
+                out.extend(hist.lines('mongodb_commands_per_request', f'endpoint="{endpoint}"'))
+            out.append('# TYPE mongodb_commands_total counter')
+            for endpoint, count in sorted(self.db_commands.items()):
+                out.append(f'mongodb_commands_total{{endpoint="{endpoint}"}} {count}')
+            out.append('# TYPE mongodb_command_seconds_total counter')
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                out.append(f'mongodb_command_seconds_total{{endpoint="{endpoint}"}} {seconds}')
+            out.append('# TYPE mongodb_slow_commands_total counter')
+            for command, count in sorted(self.slow_commands.items()):
+                out.append(f'mongodb_slow_commands_total{{command="{command}"}} {count}')
+        return '\n'.join(out) + '\n'
+
+
+metrics = Metrics()
+bp = Blueprint('metrics', __name__)
+
+dbstats.listener.slow_handlers.append(metrics.slow_command)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+@bp.before_app_request
+def start_request_metrics():
+    if not current_app.config.get('METRICS_ENABLED', True):
+        return
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = _endpoint()
+    dbstats.reset()
+    metrics.started(g.metrics_endpoint)
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    start = g.get('metrics_start')
+    if start is not None:
+        commands, db_ms = dbstats.snapshot()
+        size = response.calculate_content_length() or 0
+        metrics.observe(g.metrics_endpoint, request.method, response.status_code,
+                        time.perf_counter() - start, size, commands, db_ms)
+    return response
+
+
+@bp.teardown_app_request
+def finish_request_metrics(error=None):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        metrics.finished(endpoint)
+
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    """
+    This is the metrics route.
+    URL endpoint: /metrics
+    Methods: GET
+    Description: Returns this worker's request and database metrics in the
+    Prometheus text exposition format.
+    """
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
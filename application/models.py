@@ -1,8 +1,14 @@
 import flask
+from flask import current_app
 from application import db
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
+def hash_password(password):
+    # PASSWORD_HASH_METHOD sets the hash cost; see auth.py for rehash on login
+    return generate_password_hash(password, method=current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+
+
 class User(db.Document):
     user_id = db.IntField(unique=True)
     first_name = db.StringField(max_length=50)
@@ -11,7 +17,7 @@ class User(db.Document):
     password = db.StringField()
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def get_password(self, password):
         return check_password_hash(self.password, password)
@@ -21,15 +27,42 @@ class Admin(db.Document):
     adminID = db.IntField(unique=True)
     user_id = db.IntField()
 
+    meta = {
+        'index_background': True,
+        'indexes': ['user_id'],
+    }
+
 
 class Attractions(db.Document):
     attractionID = db.IntField(unique=True)
     name = db.StringField(max_length=100)
     description = db.StringField(max_length=1000)
     location = db.StringField(max_length=100)
+    point = db.PointField()
     image = db.StringField(max_length=255)
+    image_variants = db.DictField()
     status = db.StringField(max_length=20, default="pending")
     created_by = db.IntField()
+    rating_count = db.IntField(default=0)
+    rating_sum = db.IntField(default=0)
+    rating_mean = db.FloatField(default=0)
+    rating_histogram = db.DictField()
+    moderation_token = db.StringField()  # marks a bulk action's changes, see moderation.py
+
+    meta = {
+        'index_background': True,
+        'indexes': [
+            ('status', 'attractionID'),
+            ('status', '-rating_mean', 'attractionID'),
+            ('created_by', 'status'),
+            ('(point', 'status'),
+            {
+                'fields': ['$name', '$location', '$description'],
+                'default_language': 'english',
+                'weights': {'name': 10, 'location': 5, 'description': 1},
+            },
+        ],
+    }
 
 
 class Reviews(db.Document):
@@ -39,3 +72,65 @@ class Reviews(db.Document):
     rating = db.IntField()
     review = db.StringField(max_length=1000)
     reported = db.BooleanField(default=False)
+    status = db.StringField(max_length=20)
+    # moderation queue, see reports.py
+    report_count = db.IntField(default=0)
+    reporters = db.ListField(db.StringField())
+    reported_at = db.FloatField()
+    claimed_by = db.IntField()
+    claimed_until = db.FloatField()
+    moderation_token = db.StringField()  # marks a bulk action's changes, see moderation.py
+
+    meta = {
+        'index_background': True,
+        'indexes': [
+            # the review feed on the detail page (see REVIEW_SORTS in route.py)
+            ('attractionID', 'reported', 'reviewID'),
+            ('attractionID', 'reported', '-rating', 'reviewID'),
+            ('attractionID', 'reported', 'rating', 'reviewID'),
+            ('-report_count', 'reported_at', 'reviewID'),
+            ('claimed_by', 'claimed_until'),
+        ],
+    }
+
+
+class Counter(db.Document):
+    name = db.StringField(primary_key=True)
+    value = db.IntField(default=0)
+
+    meta = {'collection': 'counters'}
+
+
+class ImageBlob(db.Document):
+    path = db.StringField(primary_key=True)
+    size = db.IntField()
+    refs = db.IntField(default=0)
+
+
+class Job(db.Document):
+    # background jobs, see jobs.py; times are Unix timestamps
+    name = db.StringField(required=True)
+    args = db.DictField()
+    key = db.StringField()
+    active_key = db.StringField()  # key while queued or running, unique
+    status = db.StringField(default="queued")
+    attempts = db.IntField(default=0)
+    max_attempts = db.IntField(default=5)
+    run_at = db.FloatField()
+    created_at = db.FloatField()
+    started_at = db.FloatField()
+    finished_at = db.FloatField()
+    lease_until = db.FloatField()
+    worker = db.StringField()
+    error = db.StringField()
+
+    meta = {
+        'collection': 'jobs',
+        'index_background': True,
+        'indexes': [
+            ('status', 'run_at'),
+            ('status', 'lease_until'),
+            ('status', 'finished_at'),
+            {'fields': ['active_key'], 'unique': True, 'sparse': True},
+        ],
+    }
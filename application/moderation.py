@@ -0,0 +1,172 @@
+"""
+Moderation.py
+This file contains the bulk moderation actions used by the admin page.
+Each action takes a list of IDs and returns a per-item outcome so the admin
+can see what happened to each one. Attractions are changed with a single
+conditional update_many that stamps what it changed with a token, then
+read back once to tell which items this call really changed. Reviews are
+handled the same way, with the state conditions from states.py, so their
+rating counts only change for reviews this call really changed. Rating summaries, the search index and the page cache are updated in bulk
+afterwards.
+
+"""
+
+
+import time
+import uuid
+
+from application.models import Attractions, Reviews
+from application.listing import Row
+from application.reports import unclaimed, claimed_by_other
+from application.ratings import apply_ratings
+from application.search import index_attractions
+from application.autocomplete import update_attractions
+from application.cache import invalidate
+from application.states import (ATTRACTION_TRANSITIONS, REVIEW_TRANSITIONS, REVIEW_UPDATES, REVIEW_FIELDS,
+                                review_states_query, review_state)
+
+
+ATTRACTION_ACTIONS = ('approve', 'reject')
+REVIEW_ACTIONS = ('approve', 'reject', 'delete')
+# how long reviews stamped for deletion stay claimed, should the delete not follow
+DELETE_LEASE_SECONDS = 60
+
+
+class BulkResult(object):
+    """
+    Outcome of a bulk action: outcomes maps each requested ID to "done",
+    "not found" or a reason it was skipped.
+    """
+
+    def __init__(self, action, outcomes):
+        self.action = action
+        self.outcomes = outcomes
+
+    @property
+    def done(self):
+        return [i for i, outcome in self.outcomes.items() if outcome == "done"]
+
+    @property
+    def skipped(self):
+        return {i: outcome for i, outcome in self.outcomes.items() if outcome != "done"}
+
+    def to_dict(self):
+        return {'action': self.action, 'done': len(self.done),
+                'results': {str(i): outcome for i, outcome in self.outcomes.items()}}
+
+
+def _clear_token(collection, id_field, ids, token):
+    if ids:
+        collection.update_many({id_field: {'$in': ids}, 'moderation_token': token},
+                               {'$unset': {'moderation_token': ''}})
+
+
+def bulk_attractions(action, ids):
+    """
+    This function approves or rejects many attractions with one update_many,
+    conditioned on each being in a state the action applies to (see
+    ATTRACTION_TRANSITIONS), that stamps the ones it changes with a token
+    for this call. One read afterwards tells which changed ("done") and why
+    the others were skipped, so an attraction another admin changed in the
+    meantime is never reported, re-indexed or invalidated as done. Raises
+    ValueError for unknown actions.
+    """
+    if action not in ATTRACTION_ACTIONS:
+        raise ValueError(f"Unknown action {action}")
+    starts, target = ATTRACTION_TRANSITIONS[action]
+    token = uuid.uuid4().hex
+    collection = Attractions._get_collection()
+    collection.update_many({'attractionID': {'$in': ids}, 'status': {'$in': list(starts)}},
+                           {'$set': {'status': target, 'moderation_token': token}})
+    current = {a['attractionID']: a for a in collection.find(
+        {'attractionID': {'$in': ids}}, {'attractionID': 1, 'status': 1, 'moderation_token': 1})}
+
+    outcomes, changed = {}, []
+    for i in ids:
+        status = current[i].get('status') if i in current else None
+        if i not in current:
+            outcomes[i] = "not found"
+        elif current[i].get('moderation_token') == token:
+            outcomes[i] = "done"
+            changed.append(i)
+        elif status == target:
+            outcomes[i] = f"already {target}"
+        else:
+            outcomes[i] = f"cannot {action} a {status} attraction"
+
+    if changed:
+        _clear_token(collection, 'attractionID', changed, token)
+        index_attractions(changed)
+        update_attractions(changed)
+        invalidate("browse", "home", *[f"attraction:{i}" for i in changed])
+    return BulkResult(action, outcomes)
+
+
+def bulk_reviews(action, ids, moderator_id=None):
+    """
+    This function approves, rejects or deletes many reviews. Approve and
+    reject only apply to reported reviews (reject keeps the review hidden,
+    see REVIEW_TRANSITIONS) and take them out of the moderation queue;
+    delete applies to any review.
+    Reviews that another moderator has claimed (see reports.py) are skipped.
+    Approve and reject are one update_many with the same state and claim
+    conditions as the single actions, stamping what it changes with a
+    token; delete first stamps the reviews it may delete (hiding and
+    claiming them, so their rating can no longer change) and then deletes
+    them with one delete_many. One read tells which reviews this call
+    changed, so ratings are only counted for those, in one apply_ratings
+    call, even if another admin acts on the same reviews at the same time.
+    Raises ValueError for unknown actions.
+    """
+    if action not in REVIEW_ACTIONS:
+        raise ValueError(f"Unknown action {action}")
+    token = uuid.uuid4().hex
+    now = time.time()
+    collection = Reviews._get_collection()
+    selected = {'reviewID': {'$in': ids}}
+
+    if action == 'delete':
+        # tokens record whether each review was visible (its rating counted)
+        tokens = {f"{token}:visible": True, f"{token}:hidden": False}
+        # not already stamped by a delete that is still running
+        free = {'$or': [{'moderation_token': None}, {'claimed_until': {'$not': {'$gt': now}}}]}
+        collection.update_many({'$and': [selected, unclaimed(moderator_id, now), free]}, [{'$set': {
+            'moderation_token': {'$cond': [{'$eq': ['$reported', True]}, f"{token}:hidden", f"{token}:visible"]},
+            'reported': True, 'claimed_by': moderator_id, 'claimed_until': now + DELETE_LEASE_SECONDS}}])
+    else:
+        starts, target = REVIEW_TRANSITIONS[action]
+        tokens = {token: False}
+        update = REVIEW_UPDATES[target]
+        collection.update_many({'$and': [selected, review_states_query(starts), unclaimed(moderator_id, now)]},
+                               dict(update, **{'$set': dict(update['$set'], moderation_token=token)}))
+    current = {r['reviewID']: Row(r) for r in collection.find(
+        selected, dict.fromkeys(REVIEW_FIELDS + ('moderation_token',), 1))}
+
+    outcomes, changed = {}, []
+    for i in ids:
+        review = current.get(i)
+        if review is None:
+            outcomes[i] = "not found"
+        elif review.get('moderation_token') in tokens:
+            outcomes[i] = "done"
+            changed.append(review)
+        elif claimed_by_other(review, moderator_id, now):
+            outcomes[i] = "claimed by another admin"
+        elif review_state(review) == 'visible':
+            outcomes[i] = "not reported"
+        else:
+            outcomes[i] = f"already {review_state(review)}"
+
+    if action == 'delete':
+        if changed:
+            collection.delete_many({'reviewID': {'$in': [r.reviewID for r in changed]},
+                                    'moderation_token': {'$in': list(tokens)}})
+        apply_ratings([(r.attractionID, r.rating, -1) for r in changed if tokens[r.moderation_token]])
+    else:
+        if changed:
+            _clear_token(collection, 'reviewID', [r.reviewID for r in changed], token)
+        if action == 'approve':
+            apply_ratings([(r.attractionID, r.rating, 1) for r in changed])
+    if changed:
+        invalidate(*{f"attraction:{r.attractionID}" for r in changed})
+    return BulkResult(action, outcomes)
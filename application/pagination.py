@@ -0,0 +1,184 @@
+"""
+Pagination.py
+This file contains the keyset (cursor) pagination used by the listing pages.
+Instead of skip/limit, each page is fetched with a range condition on an
+indexed, unique ID field (e.g. attractionID > last ID shown) plus a limit,
+so every page costs the same no matter how deep it is. IDs come from the
+counters in sequences.py and only ever grow, so rows inserted while someone
+is paging appear at the end and never shift or duplicate earlier pages.
+
+"""
+
+
+from flask import request, url_for, current_app
+from mongoengine.queryset.visitor import Q
+
+from application.listing import fetch_rows
+
+
+# cursor value of a row whose sort field is missing or null
+NULL = 'null'
+
+
+class Page(object):
+    """
+    One page of results. items is a list of documents; next_cursor and
+    prev_cursor are the values to pass as "after" / "before" to get the
+    neighbouring pages, or None when there is no such page. A cursor is the
+    row's sort key values joined with ":", e.g. "42" or "7.5:42", with
+    "null" for a missing sort value (e.g. "null:42").
+    """
+
+    def __init__(self, items, keys, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = self._cursor_for(items[-1], keys) if has_next and items else None
+        self.prev_cursor = self._cursor_for(items[0], keys) if has_prev and items else None
+
+    @staticmethod
+    def _cursor_for(item, keys):
+        return _encode(getattr(item, name) for name, _ in keys)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _int_arg(name):
+    try:
+        return int(request.args.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _cursor(name):
+    """
+    Decodes a cursor argument such as "42", "7.5:42" or "null:42" into a
+    tuple of numbers or None (one per sort key), or None if it is missing
+    or malformed.
+    """
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        return tuple(None if v == NULL else float(v) if '.' in v else int(v) for v in raw.split(':'))
+    except ValueError:
+        return None
+
+
+def _encode(values):
+    return ':'.join(NULL if v is None else str(v) for v in values)
+
+
+def _keys(field, sort):
+    """
+    Returns [(name, descending), ...]: the optional leading sort keys
+    followed by the unique field, which breaks ties so the order is total.
+    sort is one key such as "-rating_mean" or a tuple of them. A sort of
+    field or "-field" just sets the direction of the unique field.
+    """
+    sorts = (sort,) if isinstance(sort, str) else tuple(sort or ())
+    if len(sorts) == 1 and sorts[0].lstrip('-') == field:
+        return [(field, sorts[0].startswith('-'))]
+    return [(s.lstrip('-'), s.startswith('-')) for s in sorts] + [(field, False)]
+
+
+def _compare(name, op, value):
+    """
+    The Q condition for name op value ("lt" or "gt"), with a missing or
+    null field below every number, as MongoDB sorts it. Returns None when
+    nothing can match (below null).
+    """
+    if value is None:
+        return Q(**{name + '__ne': None}) if op == 'gt' else None
+    term = Q(**{name + '__' + op: value})
+    return term | Q(**{name: None}) if op == 'lt' else term
+
+
+def _beyond(keys, values, backwards=False):
+    """
+    Builds the Q condition selecting rows strictly after (or, with
+    backwards, strictly before) the given cursor in keys order, i.e.
+    a > va OR (a == va AND b > vb) with each comparison flipped for
+    descending keys. Null sort values are handled by _compare.
+    """
+    condition = None
+    for i, (name, descending) in enumerate(keys):
+        op = 'lt' if descending != backwards else 'gt'
+        term = _compare(name, op, values[i])
+        if term is None:
+            continue
+        for j, (prev_name, _) in enumerate(keys[:i]):
+            term &= Q(**{prev_name: values[j]})
+        condition = term if condition is None else condition | term
+    return condition
+
+
+def page_size(prefix=''):
+    """
+    Returns the page size for a listing: the "per_page" query argument if
+    given, otherwise PAGE_SIZE, capped at MAX_PAGE_SIZE.
+    """
+    size = _int_arg(prefix + 'per_page') or current_app.config.get('PAGE_SIZE', 24)
+    return max(1, min(size, current_app.config.get('MAX_PAGE_SIZE', 100)))
+
+
+def keyset_page(queryset, field, prefix='', per_page=None, sort=None, fields=None):
+    """
+    This function returns the page of queryset selected by the current
+    request's "<prefix>after" or "<prefix>before" argument. Rows are ordered
+    by field ascending, or by the optional numeric sort key (e.g.
+    "-rating_mean", or a tuple of keys) with field breaking ties; all should
+    be covered by an index. prefix lets one page (e.g. admin) paginate several lists
+    independently. One query is made, fetching per_page + 1 rows to find
+    out whether another page follows. If fields is given, only those fields
+    are loaded and the items are Row objects (see listing.py) instead of
+    Documents; the sort keys are always included.
+    """
+    per_page = per_page or page_size(prefix)
+    keys = _keys(field, sort)
+    if fields:
+        projection = tuple(fields) + tuple(name for name, _ in keys if name not in fields)
+
+        def run(qs):
+            return fetch_rows(qs, projection)
+    else:
+        run = list
+
+    order = ['-' + name if descending else name for name, descending in keys]
+    reverse = ['+' + name if descending else '-' + name for name, descending in keys]
+    after = _cursor(prefix + 'after')
+    before = _cursor(prefix + 'before')
+
+    if before is not None and len(before) == len(keys):
+        rows = run(queryset.filter(_beyond(keys, before, backwards=True)).order_by(*reverse).limit(per_page + 1))
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return Page(items, keys, has_next=True, has_prev=has_prev)
+
+    if after is not None and len(after) == len(keys):
+        queryset = queryset.filter(_beyond(keys, after))
+    else:
+        after = None
+    rows = run(queryset.order_by(*order).limit(per_page + 1))
+    return Page(rows[:per_page], keys, has_next=len(rows) > per_page, has_prev=after is not None)
+
+
+def page_url(prefix='', **cursor):
+    """
+    Template helper that builds the URL of the current page with the given
+    cursor argument swapped in, keeping every other query argument (search
+    terms, other lists' cursors). Usage: page_url('users_', after=page.next_cursor)
+    """
+    args = request.args.to_dict()
+    args.pop(prefix + 'after', None)
+    args.pop(prefix + 'before', None)
+    for key, value in cursor.items():
+        args[prefix + key] = value
+    return url_for(request.endpoint, **dict(request.view_args or {}, **args))
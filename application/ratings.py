@@ -0,0 +1,112 @@
+"""
+Ratings.py
+This file maintains the rating summary stored on each attraction:
+rating_count, rating_sum, rating_mean and rating_histogram (rating -> number
+of reviews). Only visible reviews (not reported) are counted. The routes
+that change what is visible call add_rating / remove_rating, which apply an
+atomic $inc, so the browse and detail pages can show, sort and filter by
+rating without touching the Reviews collection. rebuild_ratings recomputes
+everything from scratch and is exposed as "flask rebuild-ratings".
+
+"""
+
+
+from pymongo import ReturnDocument, UpdateOne
+
+from application.models import Attractions, Reviews
+
+
+def _apply(attraction_id, rating, delta):
+    """
+    Adds (delta=1) or removes (delta=-1) one rating from an attraction's
+    summary. Count, sum and histogram are updated in one atomic $inc; the
+    mean is then set with a second update that only applies while count and
+    sum are still the values it was computed from, so a concurrent change
+    can never leave a stale mean behind (the later update sets its own).
+    """
+    if rating is None:
+        return
+    collection = Attractions._get_collection()
+    doc = collection.find_one_and_update(
+        {'attractionID': int(attraction_id)},
+        {'$inc': {'rating_count': delta, 'rating_sum': delta * rating,
+                  'rating_histogram.%d' % rating: delta}},
+        projection={'rating_count': 1, 'rating_sum': 1},
+        return_document=ReturnDocument.AFTER)
+    if doc is None:
+        return
+    count, total = doc['rating_count'], doc['rating_sum']
+    collection.update_one(
+        {'_id': doc['_id'], 'rating_count': count, 'rating_sum': total},
+        {'$set': {'rating_mean': round(total / count, 2) if count else 0}})
+
+
+def add_rating(review):
+    """
+    Counts a review that has just become visible (added or approved).
+    """
+    _apply(review.attractionID, review.rating, 1)
+
+
+def remove_rating(review):
+    """
+    Uncounts a review that has just stopped being visible (reported or deleted).
+    """
+    _apply(review.attractionID, review.rating, -1)
+
+
+def apply_ratings(changes):
+    """
+    This function applies many rating changes at once, for the bulk
+    moderation actions. changes is a list of (attractionID, rating, delta)
+    tuples. The increments are summed per attraction and written with one
+    bulk_write of $inc updates; the means of the touched attractions are
+    then recomputed server-side with one pipeline update_many.
+    """
+    totals = {}
+    for attraction_id, rating, delta in changes:
+        if rating is None:
+            continue
+        inc = totals.setdefault(int(attraction_id), {})
+        for key, value in (('rating_count', delta), ('rating_sum', delta * rating),
+                           ('rating_histogram.%d' % rating, delta)):
+            inc[key] = inc.get(key, 0) + value
+    if not totals:
+        return
+    collection = Attractions._get_collection()
+    collection.bulk_write([UpdateOne({'attractionID': a}, {'$inc': inc}) for a, inc in totals.items()], ordered=False)
+    collection.update_many({'attractionID': {'$in': list(totals)}}, [{'$set': {'rating_mean': {
+        '$cond': [{'$gt': ['$rating_count', 0]},
+                  {'$round': [{'$divide': ['$rating_sum', '$rating_count']}, 2]}, 0]}}}])
+
+
+def rebuild_ratings():
+    """
+    This function rebuilds every attraction's rating summary from the
+    visible reviews with one aggregation, then writes the results with a
+    single bulk_write. Attractions without visible reviews are reset to
+    zero. Use it to repair drift, or after importing reviews directly.
+    Returns the number of attractions updated.
+    """
+    pipeline = [
+        {'$match': {'reported': False, 'rating': {'$ne': None}}},
+        {'$group': {'_id': {'a': '$attractionID', 'r': '$rating'}, 'n': {'$sum': 1}}},
+    ]
+    summaries = {}
+    for row in Reviews._get_collection().aggregate(pipeline, allowDiskUse=True):
+        attraction_id, rating, n = row['_id']['a'], row['_id']['r'], row['n']
+        summary = summaries.setdefault(attraction_id, {'rating_count': 0, 'rating_sum': 0, 'rating_histogram': {}})
+        summary['rating_count'] += n
+        summary['rating_sum'] += n * rating
+        summary['rating_histogram'][str(rating)] = n
+
+    collection = Attractions._get_collection()
+    collection.update_many({'rating_count': {'$ne': 0}},
+                           {'$set': {'rating_count': 0, 'rating_sum': 0, 'rating_mean': 0, 'rating_histogram': {}}})
+    requests = []
+    for attraction_id, summary in summaries.items():
+        summary['rating_mean'] = round(summary['rating_sum'] / summary['rating_count'], 2)
+        requests.append(UpdateOne({'attractionID': attraction_id}, {'$set': summary}))
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+    return len(requests)
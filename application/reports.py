@@ -0,0 +1,161 @@
+"""
+Reports.py
+This file contains review reports and the moderation queue built on them.
+
+A report is one atomic find_one_and_update: it adds the reporter to the
+review's reporters list and increments report_count, but only if that
+reporter is not in the list yet, so reporting the same review twice is
+a no-op. The first report hides the review (reported=True) and records
+when it was reported (reported_at).
+
+The queue is every review with report_count > 0, most reported first and
+then oldest report first, read with keyset_page over the
+(-report_count, reported_at, reviewID) index. Moderators claim the next
+batch with claim_batch(): each claimed review carries the moderator's ID
+and a lease expiry, other moderators skip it until then, and approving,
+rejecting or deleting it takes it out of the queue.
+
+"""
+
+
+import time
+import hashlib
+
+from flask import session, request, current_app
+
+from application.models import Reviews
+from application.listing import Row
+from application.ratings import remove_rating
+
+
+# queue order for keyset_page, reviewID breaks ties
+QUEUE_SORT = ('-report_count', 'reported_at')
+# reporters remembered per review; past this the oldest can report again
+MAX_REPORTERS = 500
+
+# outcomes of report()
+REPORTED, ALREADY_REPORTED, NOT_FOUND = "reported", "already reported", "not found"
+
+# fields set or removed when a review leaves the queue
+LEAVE_QUEUE_SET = {'report_count': 0}
+LEAVE_QUEUE_UNSET = {'reported_at': '', 'claimed_by': '', 'claimed_until': ''}
+
+
+def reporter_key():
+    """
+    Identifies who is reporting: the user ID for logged-in users, otherwise
+    a salted hash of the client address (the address itself is not stored).
+    Behind a proxy, set PROXY_FIX_HOPS, or every visitor has the proxy's
+    address and only one of them can report each review.
+    """
+    if session.get('user_id'):
+        return f"user:{session['user_id']}"
+    salt = str(current_app.config.get('SECRET_KEY', ''))
+    digest = hashlib.sha256((salt + (request.remote_addr or '')).encode()).hexdigest()
+    return f"ip:{digest[:16]}"
+
+
+def report(review_id, reporter):
+    """
+    This function records a report of a review by reporter. Returns
+    (outcome, attractionID): REPORTED, ALREADY_REPORTED (this reporter has
+    reported it before, or it was rejected) or NOT_FOUND, with the review's
+    attraction when counted. When the report hides a visible review, its
+    rating is taken out of the attraction's summary.
+    """
+    before = Reviews._get_collection().find_one_and_update(
+        {'reviewID': review_id, 'reporters': {'$ne': reporter}, 'status': {'$ne': "rejected"}},
+        {'$inc': {'report_count': 1},
+         '$push': {'reporters': {'$each': [reporter], '$slice': -MAX_REPORTERS}},
+         '$set': {'reported': True},
+         '$min': {'reported_at': time.time()}},
+        projection={'attractionID': 1, 'rating': 1, 'reported': 1})
+    if before is None:
+        exists = Reviews.objects(reviewID=review_id).only('reviewID').first()
+        return (ALREADY_REPORTED if exists else NOT_FOUND), None
+    if not before.get('reported'):
+        remove_rating(Row(before))
+    return REPORTED, before.get('attractionID')
+
+
+def queue():
+    """
+    The moderation queue as a queryset: reviews with open reports.
+    """
+    return Reviews.objects(report_count__gt=0)
+
+
+def unclaimed(moderator_id=None, now=None):
+    """
+    A filter matching reviews that no moderator other than moderator_id
+    holds an unexpired claim on.
+    """
+    now = now or time.time()
+    return {'$or': [{'claimed_until': None}, {'claimed_until': {'$lte': now}}, {'claimed_by': moderator_id}]}
+
+
+def claimed_by_other(review, moderator_id, now=None):
+    """
+    True if another moderator holds an unexpired claim on review (a Reviews
+    document or a Row).
+    """
+    holder, until = getattr(review, 'claimed_by', None), getattr(review, 'claimed_until', None)
+    return bool(holder) and holder != moderator_id and (until or 0) > (now or time.time())
+
+
+def claim_batch(moderator_id, size=None, lease=None):
+    """
+    This function hands the moderator the next batch of the queue to work
+    on, and returns it in queue order. Reviews the moderator already holds
+    count towards the batch; the rest are the highest priority reviews no
+    one else holds. Claims are made with update_many conditioned on the
+    review still being unclaimed (or its lease having run out), so two
+    moderators claiming at once never get the same review. Claims last
+    MODERATION_LEASE_SECONDS and are renewed by claiming again.
+    """
+    size = size or current_app.config.get('MODERATION_BATCH_SIZE', 10)
+    lease = lease or current_app.config.get('MODERATION_LEASE_SECONDS', 900)
+    now = time.time()
+    until = now + lease
+    collection = Reviews._get_collection()
+
+    mine = {'report_count': {'$gt': 0}, 'claimed_by': moderator_id, 'claimed_until': {'$gt': now}}
+    collection.update_many(mine, {'$set': {'claimed_until': until}})
+    held = collection.count_documents({'report_count': {'$gt': 0}, 'claimed_by': moderator_id,
+                                       'claimed_until': until})
+
+    free = {'report_count': {'$gt': 0},
+            '$or': [{'claimed_until': None}, {'claimed_until': {'$lte': now}}]}
+    if held < size:
+        # twice as many candidates as needed, in case others claim some first
+        candidates = [doc['_id'] for doc in collection.find(free, {'_id': 1})
+                      .sort([('report_count', -1), ('reported_at', 1), ('reviewID', 1)]).limit(2 * (size - held))]
+        start = 0
+        while held < size and start < len(candidates):
+            chunk = candidates[start:start + size - held]
+            start += len(chunk)
+            result = collection.update_many(dict(free, _id={'$in': chunk}),
+                                            {'$set': {'claimed_by': moderator_id, 'claimed_until': until}})
+            held += result.modified_count
+
+    return list(Reviews.objects(report_count__gt=0, claimed_by=moderator_id, claimed_until=until)
+                .order_by('-report_count', 'reported_at', 'reviewID'))
+
+
+def release_claims(moderator_id):
+    """
+    Gives up the moderator's claims so others can take those reviews.
+    Returns how many were released.
+    """
+    return Reviews._get_collection().update_many(
+        {'claimed_by': moderator_id}, {'$unset': {'claimed_by': '', 'claimed_until': ''}}).modified_count
+
+
+def backfill_reports():
+    """
+    Puts reviews reported before report counting existed into the queue
+    with one report each. Returns how many were updated.
+    """
+    return Reviews._get_collection().update_many(
+        {'reported': True, 'status': {'$ne': "rejected"}, 'report_count': {'$in': [None, 0]}},
+        {'$set': {'report_count': 1, 'reported_at': time.time()}}).modified_count
@@ -0,0 +1,249 @@
+"""
+Search.py
+This file contains the attraction search used by the browse page.
+Queries are parsed into plain terms and "quoted phrases" and run against a
+weighted MongoDB text index over name, location and description (see the
+Attractions meta in models.py), ranked by text score. Deployments without
+text index support can set SEARCH_BACKEND = "memory" to use an in-process
+inverted index with the same parsing, stemming and field weights instead.
+
+"""
+
+
+import re
+import threading
+import time
+import logging
+
+from pymongo.errors import OperationFailure
+from flask import current_app
+
+from application.models import Attractions
+
+
+log = logging.getLogger(__name__)
+
+# same weights as the text index declared on Attractions
+FIELD_WEIGHTS = {'name': 10, 'location': 5, 'description': 1}
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+# endings after which a plural takes "es" rather than "s"
+_SIBILANTS = ('ss', 'x', 'z', 'ch', 'sh')
+
+
+def stem(word):
+    """
+    A small suffix-stripping stemmer so that "beaches", "beach" and
+    "walking", "walk" match each other. It is not a full Snowball stemmer
+    like the one MongoDB uses, but covers the common English plurals and
+    verb endings. Only the in-memory index uses it: MongoDB stems $text
+    queries itself. "es" is only removed after a sibilant ("beaches",
+    "boxes"); elsewhere it is the plural of an e-ending word ("lakes",
+    "places", "houses") and only the "s" goes. "ly" is left alone, as
+    stripping it breaks nouns ("family", "Italy").
+    """
+    if len(word) <= 3:
+        return word
+    for suffix, replacement in (('sses', 'ss'), ('ies', 'y'), ('ing', ''),
+                                ('edly', ''), ('ed', ''), ('es', ''), ('s', '')):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix == 'es' and not word[:-2].endswith(_SIBILANTS):
+                continue
+            if suffix == 's' and word.endswith('ss'):
+                return word
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    """
+    Lower-cases the text and splits it into words, without stemming.
+    """
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def analyze(text):
+    """
+    Turns text into the list of stemmed index terms, dropping stop words.
+    """
+    return [stem(w) for w in tokenize(text) if w not in STOP_WORDS]
+
+
+def parse_query(query, stemmed=True):
+    """
+    This function parses a search box query into (terms, phrases).
+    Words outside quotes become terms, any of which may match: stemmed for
+    the in-memory index, or as typed (minus stop words) with
+    stemmed=False, for MongoDB's $text, which stems them itself.
+    Text inside double quotes becomes a phrase, all of which must match.
+    For example 'dartmoor "national park"' gives (["dartmoor"],
+    ["national park"]).
+    """
+    terms, phrases = [], []
+    for phrase, word in _QUERY_RE.findall(query or ''):
+        if phrase:
+            words = tokenize(phrase)
+            if words:
+                phrases.append(' '.join(words))
+        elif stemmed:
+            terms.extend(analyze(word))
+        else:
+            terms.extend(w for w in tokenize(word) if w not in STOP_WORDS)
+    return terms, phrases
+
+
+def to_text_search(terms, phrases):
+    """
+    Builds the $search string for a MongoDB $text query from unstemmed
+    terms (parse_query(query, stemmed=False)) and phrases. MongoDB stems
+    the terms itself; phrases are quoted.
+    """
+    return ' '.join(terms + ['"%s"' % p for p in phrases])
+
+
+class InvertedIndex(object):
+    """
+    In-process inverted index over approved attractions, used when the
+    database has no text index support. Postings map a stemmed term to
+    {attractionID: weighted term frequency}; terms maps each attraction to
+    the terms it is posted under, so removing it only touches those
+    postings. Phrases are checked against the stored normalised text of each
+    attraction.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.terms = {}
+        self.texts = {}
+        self.lock = threading.Lock()
+        self.built_at = 0
+
+    def add(self, attraction_id, name, location, description):
+        fields = {'name': name, 'location': location, 'description': description}
+        with self.lock:
+            self._remove(attraction_id)
+            terms = self.terms[attraction_id] = set()
+            for field, value in fields.items():
+                for term in analyze(value):
+                    docs = self.postings.setdefault(term, {})
+                    docs[attraction_id] = docs.get(attraction_id, 0) + FIELD_WEIGHTS[field]
+                    terms.add(term)
+            self.texts[attraction_id] = ' '.join(tokenize(' '.join(v or '' for v in fields.values())))
+
+    def remove(self, attraction_id):
+        with self.lock:
+            self._remove(attraction_id)
+
+    def _remove(self, attraction_id):
+        self.texts.pop(attraction_id, None)
+        for term in self.terms.pop(attraction_id, ()):
+            docs = self.postings[term]
+            del docs[attraction_id]
+            if not docs:
+                del self.postings[term]
+
+    def search(self, terms, phrases, limit=None):
+        """
+        Returns attraction IDs ordered by score (highest first). A document
+        scores the sum of the weights of the terms it contains; when phrases
+        are given, only documents containing every phrase are returned.
+        """
+        with self.lock:
+            scores = {}
+            for term in terms:
+                for doc_id, weight in self.postings.get(term, {}).items():
+                    scores[doc_id] = scores.get(doc_id, 0) + weight
+            if phrases:
+                candidates = scores if terms else self.texts
+                padded = {d: ' %s ' % self.texts[d] for d in candidates}
+                scores = {
+                    d: scores.get(d, 0) + 1 for d in candidates
+                    if all(' %s ' % p in padded[d] for p in phrases)
+                }
+        ranked = sorted(scores, key=lambda d: (-scores[d], d))
+        return ranked[:limit] if limit else ranked
+
+
+_index = InvertedIndex()
+
+
+def rebuild_index():
+    """
+    Rebuilds the in-memory index from every approved attraction.
+    """
+    fresh = InvertedIndex()
+    for a in Attractions.objects(status="approved").only('attractionID', 'name', 'location', 'description'):
+        fresh.add(a.attractionID, a.name, a.location, a.description)
+    fresh.built_at = time.time()
+    global _index
+    _index = fresh
+
+
+def _memory_index():
+    refresh = current_app.config.get('SEARCH_REFRESH_SECONDS', 300)
+    if not _index.built_at or time.time() - _index.built_at > refresh:
+        rebuild_index()
+    return _index
+
+
+def index_attraction(attraction):
+    """
+    Keeps the in-memory index in step with a changed attraction: approved
+    attractions are (re)indexed, anything else is removed. Called by the
+    routes that approve, reject or edit an attraction. Other workers pick
+    the change up on their next periodic rebuild.
+    """
+    if not _index.built_at:
+        return
+    if attraction.status == "approved":
+        _index.add(attraction.attractionID, attraction.name, attraction.location, attraction.description)
+    else:
+        _index.remove(attraction.attractionID)
+
+
+def index_attractions(attraction_ids):
+    """
+    index_attraction for many attractions at once, after a bulk change.
+    """
+    if not _index.built_at or not attraction_ids:
+        return
+    for a in Attractions.objects(attractionID__in=list(attraction_ids)).only(
+            'attractionID', 'name', 'location', 'description', 'status'):
+        index_attraction(a)
+
+
+def _search_memory(base, terms, phrases):
+    ids = _memory_index().search(terms, phrases, current_app.config.get('SEARCH_MAX_RESULTS', 200))
+    found = {a.attractionID: a for a in base.filter(attractionID__in=ids)}
+    return [found[i] for i in ids if i in found]
+
+
+def search_attractions(query, base=None):
+    """
+    This function returns approved attractions matching the query, most
+    relevant first. base can be a pre-filtered Attractions queryset; it
+    defaults to all approved attractions. An empty query (or one made only
+    of stop words) returns an empty list.
+    """
+    if base is None:
+        base = Attractions.objects(status="approved")
+    terms, phrases = parse_query(query)
+    if not terms and not phrases:
+        return []
+
+    if current_app.config.get('SEARCH_BACKEND', 'text') == 'memory':
+        return _search_memory(base, terms, phrases)
+
+    try:
+        words, _ = parse_query(query, stemmed=False)
+        results = base.search_text(to_text_search(words, phrases)).order_by('$text_score')
+        return list(results.limit(current_app.config.get('SEARCH_MAX_RESULTS', 200)))
+    except OperationFailure:
+        log.warning("text search failed, falling back to in-memory index", exc_info=True)
+        return _search_memory(base, terms, phrases)
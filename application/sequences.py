@@ -0,0 +1,126 @@
+"""
+Sequences.py
+This file contains the ID allocator used by every insert in the application.
+Each model has a named counter stored in the "counters" collection. A new ID
+is taken with a single atomic find-and-modify ($inc) on that counter, so the
+cost of an insert does not depend on the size of the collection and two
+concurrent requests can never be handed the same ID.
+
+"""
+
+
+import threading
+
+from pymongo import ReturnDocument
+from flask import current_app
+
+from application.models import User, Admin, Attractions, Reviews, Counter
+
+
+# counter name -> (model, ID field) for every model that gets sequential IDs
+SEQUENCES = {
+    'user_id': (User, 'user_id'),
+    'adminID': (Admin, 'adminID'),
+    'attractionID': (Attractions, 'attractionID'),
+    'reviewID': (Reviews, 'reviewID'),
+}
+
+_lock = threading.Lock()
+_seeded = set()
+_blocks = {}
+
+
+def _current_max(name):
+    """
+    Returns the highest ID currently stored for the given sequence, or 0 if
+    the collection is empty. This is a single indexed query (sort on the
+    unique ID field, limit 1) rather than a scan of the whole collection.
+    """
+    model, field = SEQUENCES[name]
+    doc = model.objects.order_by('-' + field).only(field).first()
+    return int(doc[field]) if doc and doc[field] is not None else 0
+
+
+def seed_sequence(name, value=None):
+    """
+    This function seeds a counter from the current max ID of its collection
+    (or from value, when given, e.g. the highest ID about to be imported).
+    It uses $max so it is safe to run at any time, from any number of workers:
+    the counter only ever moves forwards and is never set below an ID that
+    has already been handed out.
+    """
+    seeded = value is None
+    if seeded:
+        value = _current_max(name)
+    Counter._get_collection().update_one(
+        {'_id': name}, {'$max': {'value': value}}, upsert=True)
+    if seeded:
+        _seeded.add(name)
+
+
+def seed_sequences():
+    """
+    Seeds every counter in SEQUENCES. This is the one-time migration step for
+    databases created before the counters collection existed, and is exposed
+    as the "flask seed-ids" command.
+    """
+    for name in SEQUENCES:
+        seed_sequence(name)
+
+
+def reset_sequences():
+    """
+    Forgets the per-process seeding state and any pre-allocated ID blocks.
+    Used after the counters collection has been dropped (e.g. in tests).
+    """
+    with _lock:
+        _seeded.clear()
+        _blocks.clear()
+
+
+def _reserve(name, count):
+    """
+    Atomically advances the named counter by count and returns the last ID
+    of the reserved range. This is the only database round trip on the
+    normal allocation path.
+    """
+    doc = Counter._get_collection().find_one_and_update(
+        {'_id': name}, {'$inc': {'value': count}},
+        upsert=True, return_document=ReturnDocument.AFTER)
+    return doc['value']
+
+
+def reserve_ids(name, count):
+    """
+    Reserves count consecutive IDs for the named sequence with one $inc and
+    returns the first of them. Used by bulk imports to number a whole batch
+    in a single round trip.
+    """
+    if name not in _seeded:
+        seed_sequence(name)
+    return _reserve(name, count) - count + 1
+
+
+def next_id(name):
+    """
+    This function returns the next free ID for the named sequence.
+    The first call in a process seeds the counter from the existing data.
+    If ID_BLOCK_SIZE is greater than 1, a block of IDs is reserved with one
+    $inc and handed out from memory until it runs out, so a busy worker only
+    touches the counters collection once per block. IDs are never reused,
+    and with blocks they are unique but not strictly ordered across workers.
+    """
+    if name not in _seeded:
+        seed_sequence(name)
+
+    block_size = current_app.config.get('ID_BLOCK_SIZE', 1)
+    if block_size <= 1:
+        return _reserve(name, 1)
+
+    with _lock:
+        start, end = _blocks.get(name, (1, 0))
+        if start > end:
+            end = _reserve(name, block_size)
+            start = end - block_size + 1
+        _blocks[name] = (start + 1, end)
+        return start
@@ -0,0 +1,145 @@
+"""
+Server.py
+This file contains the pieces the production launchers need: gunicorn.conf.py
+(Linux, several preloaded worker processes) and "python main.py" (waitress,
+one process, for Windows hosts) both use it.
+
+- worker_counts() picks the number of worker processes and threads from the
+  CPU count, unless WEB_CONCURRENCY / WEB_THREADS are set.
+- reconnect() throws away the MongoDB client inherited from the parent
+  process and opens a new one. pymongo clients are not fork-safe, so every
+  gunicorn worker calls it right after the fork.
+- warm_up() compiles every template, opens as many database connections as
+  the worker has threads and builds the in-memory indexes, so the first
+  requests a worker takes are as fast as the rest. Until it has run
+  /readyz answers 503, so a load balancer only sends traffic to warm
+  workers; /healthz only says the process is up. With JOBS_MODE = "thread"
+  warm_up() also starts the worker's job threads, so jobs left from before
+  a restart and retries that fall due run without waiting for this
+  process to enqueue something.
+
+"""
+
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+from pymongo.errors import PyMongoError
+from mongoengine.connection import connect, disconnect_all, get_db
+from flask import Blueprint, current_app
+
+from application import autocomplete, jobs
+
+
+log = logging.getLogger(__name__)
+
+bp = Blueprint('server', __name__)
+
+_state = {'ready': False}
+
+
+def worker_counts(cores=None):
+    """
+    Returns (workers, threads). The app mostly waits on MongoDB, so each
+    worker runs several threads, and there is one worker per core plus one
+    (at least two, so one can restart while the other serves). Each worker
+    holds its own caches and indexes, which is why this is lower than the
+    usual 2 * cores + 1 for single-threaded workers.
+    """
+    cores = cores or os.cpu_count() or 1
+    workers = int(os.environ.get('WEB_CONCURRENCY', max(2, cores + 1)))
+    threads = int(os.environ.get('WEB_THREADS', 4))
+    return workers, threads
+
+
+def _connection_settings():
+    return {key.lower(): value for key, value in current_app.config.get('MONGODB_SETTINGS', {}).items()}
+
+
+def disconnect():
+    """
+    Closes every MongoDB client in this process (the gunicorn master does
+    this after loading the app, so it holds no sockets while forking).
+    """
+    disconnect_all()
+
+
+def reconnect():
+    """
+    Opens a fresh MongoDB client for this process. Called in each worker
+    after the fork; the listener from dbstats.py is attached again because
+    pymongo adds registered listeners to every new client.
+    """
+    disconnect_all()
+    connect(**_connection_settings())
+
+
+def warm_templates():
+    """
+    Compiles every template into the Jinja cache. Done in the gunicorn
+    master before forking, so the workers share the compiled code.
+    """
+    for name in current_app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            current_app.jinja_env.get_template(name)
+
+
+def warm_up(threads=1):
+    """
+    This function gets a worker ready for traffic: it compiles the
+    templates, opens `threads` database connections in parallel so the
+    pool is full before the first request, and builds the autocomplete
+    index. With JOBS_MODE = "thread" it starts the job worker threads. It
+    then marks the worker ready for /readyz.
+    """
+    warm_templates()
+    database = get_db()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: database.command('ping'), range(threads)))
+    autocomplete.get_index()
+    if current_app.config.get('JOBS_MODE', 'thread') == 'thread':
+        jobs.start_workers(current_app._get_current_object())
+    _state['ready'] = True
+    log.info("worker %s warmed up", os.getpid())
+
+
+def stopping():
+    """
+    Marks the worker as not ready, when it starts a graceful shutdown.
+    """
+    _state['ready'] = False
+
+
+@bp.route("/healthz")
+def healthz():
+    """
+    This is the liveness route.
+    URL endpoint: /healthz
+    Methods: GET
+    Description: Returns 200 while the process can serve requests at all.
+    It does not touch the database.
+    """
+    return "ok", 200, {'Content-Type': 'text/plain'}
+
+
+@bp.route("/readyz")
+def readyz():
+    """
+    This is the readiness route.
+    URL endpoint: /readyz
+    Methods: GET
+    Description: Returns 200 once the worker has warmed up and MongoDB
+    answers a ping within two seconds, and 503 otherwise (still warming up,
+    shutting down or the database is unreachable).
+    """
+    if not _state['ready']:
+        return "warming up", 503, {'Content-Type': 'text/plain'}
+    try:
+        with pymongo.timeout(2):
+            get_db().command('ping')
+    except PyMongoError:
+        log.warning("readiness check failed", exc_info=True)
+        return "database unavailable", 503, {'Content-Type': 'text/plain'}
+    return "ready", 200, {'Content-Type': 'text/plain'}
@@ -0,0 +1,68 @@
+"""
+Startup.py
+This file measures the cold start of the application, for "flask
+profile-startup". It runs a fresh interpreter with "python -X importtime"
+(so nothing is imported yet and nothing is cached in memory) on either
+"import application" or "create_app()", and parses the time Python reports
+for every module it imports. Worker boots and CLI commands both pay this
+cost, so it is worth keeping an eye on after adding a dependency.
+
+"""
+
+
+import os
+import sys
+import subprocess
+from collections import namedtuple
+
+
+TARGETS = {
+    'package': "import application",
+    'app': "from application import create_app; create_app()",
+}
+
+# one line of -X importtime output, times in microseconds
+ImportTime = namedtuple('ImportTime', ['module', 'self_us', 'cumulative_us', 'depth'])
+
+
+def parse_importtime(output):
+    """
+    Parses the "import time: self [us] | cumulative | imported package"
+    lines printed by -X importtime. depth is how deeply nested the import
+    was (0 for modules imported directly by the profiled code).
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        stripped = name.lstrip()
+        rows.append(ImportTime(stripped.strip(), int(self_us), int(cumulative_us),
+                               (len(name) - len(stripped) - 1) // 2))
+    return rows
+
+
+def profile_startup(target='app'):
+    """
+    This function runs the target in a fresh interpreter from the project
+    root and returns the parsed import times. Raises RuntimeError with the
+    interpreter's output if the target fails.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', TARGETS[target]],
+                            cwd=root, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return parse_importtime(result.stderr)
+
+
+def summarise(rows, limit=15):
+    """
+    Returns (total seconds, modules imported, slowest modules by their own
+    time, application modules with their cumulative time).
+    """
+    total = sum(row.self_us for row in rows) / 1e6
+    slowest = sorted(rows, key=lambda row: -row.self_us)[:limit]
+    own = sorted((row for row in rows if row.module.split('.')[0] == 'application'),
+                 key=lambda row: -row.cumulative_us)
+    return total, len(rows), slowest, own
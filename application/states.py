@@ -0,0 +1,162 @@
+"""
+States.py
+This file contains the status transitions of attractions and reviews.
+The allowed moves are listed in ATTRACTION_TRANSITIONS and
+REVIEW_TRANSITIONS as action -> (states it may start from, new state).
+
+Each transition is one conditional find_one_and_update: the filter only
+matches the document while it is in one of the allowed states, so there is
+no read before the write, and when two admins act on the same item at once
+exactly one of them wins and the other is told what happened. Only when
+the update matches nothing is the document read, to say why (not found,
+already in that state, claimed by another moderator...).
+
+"""
+
+
+import time
+from collections import namedtuple
+
+from pymongo import ReturnDocument
+
+from application.models import Attractions, Reviews
+from application.listing import Row
+from application.reports import claimed_by_other, unclaimed, LEAVE_QUEUE_SET, LEAVE_QUEUE_UNSET, NOT_FOUND
+
+
+# outcomes of a transition (and NOT_FOUND, shared with reports.report())
+DONE, NOT_ALLOWED, FORBIDDEN, CLAIMED = "done", "not allowed", "forbidden", "claimed"
+
+# outcome, the document (a Row: after an attraction transition, before a
+# review one, or as found when it failed) and its state
+Transition = namedtuple('Transition', ['outcome', 'doc', 'state'])
+
+# an attraction's state is its status field
+ATTRACTION_TRANSITIONS = {
+    'approve': (('pending', 'rejected'), 'approved'),
+    'reject': (('pending', 'approved'), 'rejected'),
+    'edit': (('pending', 'rejected'), 'pending'),  # by its creator; edits go back for approval
+}
+
+# fields the routes need after an attraction transition (flash message,
+# search and autocomplete indexes)
+ATTRACTION_FIELDS = ('attractionID', 'name', 'location', 'description', 'status', 'rating_count',
+                     'rating_mean', 'image', 'created_by')
+
+# a review's state is derived from its reported flag and status
+REVIEW_STATES = {
+    'visible': {'reported': {'$ne': True}},
+    'reported': {'reported': True, 'status': {'$ne': "rejected"}},
+    'rejected': {'reported': True, 'status': "rejected"},
+}
+
+REVIEW_TRANSITIONS = {
+    'report': (('visible', 'reported'), 'reported'),  # see reports.report()
+    'approve': (('reported', 'rejected'), 'visible'),
+    'reject': (('reported',), 'rejected'),
+}
+
+# what entering a state writes; both take the review out of the moderation queue
+REVIEW_UPDATES = {
+    'visible': {'$set': dict(LEAVE_QUEUE_SET, reported=False, status="approved"), '$unset': LEAVE_QUEUE_UNSET},
+    'rejected': {'$set': dict(LEAVE_QUEUE_SET, status="rejected"), '$unset': LEAVE_QUEUE_UNSET},
+}
+
+REVIEW_FIELDS = ('reviewID', 'attractionID', 'rating', 'reported', 'status', 'claimed_by', 'claimed_until')
+
+
+def review_state(review):
+    """
+    The state name of a review document or Row.
+    """
+    if not review.get('reported'):
+        return 'visible'
+    return 'rejected' if review.get('status') == "rejected" else 'reported'
+
+
+def review_states_query(states):
+    """
+    A filter matching reviews in any of the named states.
+    """
+    return {'$or': [REVIEW_STATES[state] for state in states]}
+
+
+def _projection(fields):
+    return dict.fromkeys(fields, 1)
+
+
+def transition_attraction(attraction_id, action, user_id=None, changes=None):
+    """
+    This function applies an attraction action from ATTRACTION_TRANSITIONS
+    with one conditional update and returns a Transition. changes are extra
+    fields to $set (None values are unset) in the same write. With user_id
+    the attraction must also have been created by that user (FORBIDDEN
+    otherwise). On success doc is the attraction after the change, with the
+    fields in ATTRACTION_FIELDS plus "old_image", its image before it.
+    """
+    starts, target = ATTRACTION_TRANSITIONS[action]
+    query = {'attractionID': attraction_id, 'status': {'$in': list(starts)}}
+    if user_id is not None:
+        query['created_by'] = user_id
+    update = {'$set': {'status': target}}
+    for name, value in (changes or {}).items():
+        if value is None:
+            update.setdefault('$unset', {})[name] = ''
+        else:
+            update['$set'][name] = value
+
+    collection = Attractions._get_collection()
+    before = collection.find_one_and_update(query, update, projection=_projection(ATTRACTION_FIELDS),
+                                            return_document=ReturnDocument.BEFORE)
+    if before is not None:
+        after = Row(before, old_image=before.get('image'), status=target)
+        after.update((k, v) for k, v in (changes or {}).items() if k in ATTRACTION_FIELDS)
+        return Transition(DONE, after, target)
+
+    current = collection.find_one({'attractionID': attraction_id}, _projection(ATTRACTION_FIELDS))
+    if current is None:
+        return Transition(NOT_FOUND, None, None)
+    if user_id is not None and current.get('created_by') != user_id:
+        return Transition(FORBIDDEN, Row(current), current.get('status'))
+    return Transition(NOT_ALLOWED, Row(current), current.get('status'))
+
+
+def transition_review(review_id, action, moderator_id=None):
+    """
+    This function applies a review action from REVIEW_TRANSITIONS (approve
+    or reject; reports go through reports.report()) with one conditional
+    update and returns a Transition whose doc is the review before the
+    change. Reviews another moderator has claimed are left alone (CLAIMED).
+    """
+    starts, target = REVIEW_TRANSITIONS[action]
+    now = time.time()
+    query = {'reviewID': review_id, '$and': [review_states_query(starts), unclaimed(moderator_id, now)]}
+    collection = Reviews._get_collection()
+    before = collection.find_one_and_update(query, REVIEW_UPDATES[target], projection=_projection(REVIEW_FIELDS),
+                                            return_document=ReturnDocument.BEFORE)
+    if before is not None:
+        return Transition(DONE, Row(before), review_state(before))
+
+    current = collection.find_one({'reviewID': review_id}, _projection(REVIEW_FIELDS))
+    if current is None:
+        return Transition(NOT_FOUND, None, None)
+    current = Row(current)
+    if claimed_by_other(current, moderator_id, now):
+        return Transition(CLAIMED, current, review_state(current))
+    return Transition(NOT_ALLOWED, current, review_state(current))
+
+
+def remove_review(review_id, moderator_id=None):
+    """
+    Deletes a review with one find_one_and_delete, unless another moderator
+    has claimed it. Returns a Transition whose doc is the deleted review.
+    """
+    collection = Reviews._get_collection()
+    deleted = collection.find_one_and_delete(dict(unclaimed(moderator_id), reviewID=review_id),
+                                             projection=_projection(REVIEW_FIELDS))
+    if deleted is not None:
+        return Transition(DONE, Row(deleted), review_state(deleted))
+    current = collection.find_one({'reviewID': review_id}, _projection(REVIEW_FIELDS))
+    if current is None:
+        return Transition(NOT_FOUND, None, None)
+    return Transition(CLAIMED, Row(current), review_state(current))
@@ -1,6 +1,10 @@
 import pytest
-from application import app, db
-from application.models import User, Admin, Attractions, Reviews
+from config import Config
+from application import create_app
+from application.models import User, Admin, Attractions, Reviews, Counter, ImageBlob, Job
+from application.sequences import reset_sequences
+from application.cache import clear_cache
+from application.autocomplete import reset_index
 
 import warnings
 
@@ -8,14 +12,34 @@ import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
-@pytest.fixture
-def client():
-    app.config["TESTING"] = True
-    app.config["WTF_CSRF_ENABLED"] = False
-    app.config["MONGODB_SETTINGS"] = {
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    IMAGE_PROCESSING = "sync"
+    JOBS_MODE = "worker"  # tests run jobs themselves with work_off()
+    MONGODB_SETTINGS = {
         "db": "test_database"
     }
 
+
+@pytest.fixture(scope="session")
+def app():
+    return create_app(TestConfig)
+
+
+@pytest.fixture(autouse=True)
+def app_context(request, app):
+    # tests without the client get an app context for current_app; tests
+    # with it don't, so every request gets its own context (and its own g)
+    if "client" in request.fixturenames:
+        yield
+        return
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
     with app.test_client() as client:
         with app.app_context():
             # Clean database before each test
@@ -23,4 +47,10 @@ def client():
             Admin.drop_collection()
             Attractions.drop_collection()
             Reviews.drop_collection()
+            Counter.drop_collection()
+            ImageBlob.drop_collection()
+            Job.drop_collection()
+            reset_sequences()
+            clear_cache()
+            reset_index()
         yield client
@@ -22,7 +22,7 @@ def test_register_and_login(client):
     assert b"Home Page" in response.data
 
 
-def test_add_attraction(client):
+def test_add_attraction(client, app):
     """
     This test verifies the functionality of adding a new attraction to the
     application. It ensures that a user can successfully submit an attract
@@ -30,7 +30,8 @@ def test_add_attraction(client):
     """
     from application.models import User
     user = User(user_id=1, email="u@test.com", first_name="U", last_name="Test")
-    user.set_password("pass")
+    with app.app_context():
+        user.set_password("pass")
     user.save()
 
     with client.session_transaction() as sess:
@@ -72,3 +73,579 @@ def test_add_review(client):
     }, follow_redirects=True)
 
     assert b"Review added successfully" in response.data
+
+
+def test_browse_is_paginated_by_cursor(client):
+    """
+    This test verifies that the browse page only renders one page of
+    approved attractions and that following the "after" cursor returns
+    the next page without repeating any attraction.
+    """
+    from application.models import Attractions
+
+    for i in range(1, 6):
+        Attractions(attractionID=i, name=f"Place{i}", status="approved", created_by=1).save()
+
+    first = client.get("/browse?per_page=2")
+    assert b"Place1" in first.data and b"Place2" in first.data
+    assert b"Place3" not in first.data
+    assert b"after=2" in first.data
+
+    second = client.get("/browse?per_page=2&after=2")
+    assert b"Place3" in second.data and b"Place4" in second.data
+    assert b"Place2" not in second.data
+
+
+def test_rating_order_pages_past_attractions_without_a_rating(client):
+    """
+    This test verifies that paging the browse page by rating reaches every
+    attraction once, including ones with no rating_mean stored yet, whose
+    cursor is encoded as "null".
+    """
+    import re
+    from urllib.parse import unquote
+    from application.models import Attractions
+
+    for i, mean in enumerate([9, 7, 7, 5], start=1):
+        Attractions(attractionID=i, name=f"Place{i}", status="approved", created_by=1, rating_mean=mean).save()
+    for i in (5, 6, 7):
+        Attractions(attractionID=i, name=f"Place{i}", status="approved", created_by=1).save()
+    Attractions._get_collection().update_many({'attractionID': {'$gt': 4}}, {'$unset': {'rating_mean': ''}})
+
+    seen, url = [], "/browse?sort=rating&per_page=2"
+    while url:
+        data = client.get(url).data
+        seen += re.findall(rb"Place(\d)", data)
+        cursor = re.search(rb'after=([^"&]+)', data)
+        url = cursor and f"/browse?sort=rating&per_page=2&after={unquote(cursor.group(1).decode())}"
+    assert seen == [b"1", b"2", b"3", b"4", b"5", b"6", b"7"]
+
+
+def test_review_events_update_rating_summary(client):
+    """
+    This test verifies that adding, reporting and approving a review keeps
+    the attraction's rating summary in step with the visible reviews.
+    """
+    from application.models import Attractions, Reviews
+
+    Attractions(attractionID=1, name="Park", status="approved", created_by=1).save()
+
+    client.post("/add_review/1", data={"name": "A", "rating": "8", "review": "Good"})
+    client.post("/add_review/1", data={"name": "B", "rating": "4", "review": "Meh"})
+    attraction = Attractions.objects(attractionID=1).first()
+    assert attraction.rating_count == 2
+    assert attraction.rating_mean == 6
+    assert attraction.rating_histogram == {"8": 1, "4": 1}
+
+    review = Reviews.objects(rating=4).first()
+    client.post(f"/report_review/{review.reviewID}")
+    client.post(f"/report_review/{review.reviewID}")
+    attraction.reload()
+    assert attraction.rating_count == 1
+    assert attraction.rating_mean == 8
+
+    client.post(f"/approve_review/{review.reviewID}")
+    attraction.reload()
+    assert attraction.rating_count == 2
+
+
+def test_admin_page_shows_attraction_names_for_reported_reviews(client):
+    """
+    This test verifies that the admin moderation list shows the attraction
+    name for each reported review, resolved with one batched lookup, and
+    "Unknown" when the attraction no longer exists.
+    """
+    from application.models import Attractions, Reviews
+
+    Attractions(attractionID=1, name="Castle", status="approved", created_by=1).save()
+    Reviews(reviewID=1, attractionID=1, first_name="A", rating=2, review="Bad", reported=True, report_count=1).save()
+    Reviews(reviewID=2, attractionID=99, first_name="B", rating=1, review="Gone", reported=True, report_count=1).save()
+
+    response = client.get("/admin")
+    assert b"on Castle" in response.data
+    assert b"on Unknown" in response.data
+
+
+def test_uploads_are_deduplicated_and_validated(client):
+    """
+    This test verifies that two attractions uploading the same image share
+    one content-addressed file, and that a file that is not an image is
+    rejected with an error message.
+    """
+    import io
+    from application.models import Attractions, ImageBlob
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+        sess["username"] = "U"
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+    for name in ("One", "Two"):
+        client.post("/add_attraction", data={
+            "attraction_name": name,
+            "description": "D",
+            "location": "L",
+            "image": (io.BytesIO(png), "beach.png"),
+        }, content_type="multipart/form-data")
+
+    images = {a.image for a in Attractions.objects}
+    assert len(images) == 1
+    assert images.pop().startswith("images/blobs/")
+    assert ImageBlob.objects.first().refs == 2
+
+    response = client.post("/add_attraction", data={
+        "attraction_name": "Bad",
+        "description": "D",
+        "location": "L",
+        "image": (io.BytesIO(b"not an image"), "beach.png"),
+    }, content_type="multipart/form-data", follow_redirects=True)
+    assert b"Only JPEG, PNG, GIF or WebP" in response.data
+    assert Attractions.objects(name="Bad").count() == 0
+
+
+def test_browse_cache_is_invalidated_on_approval(client):
+    """
+    This test verifies that anonymous browse pages are served from the cache
+    and that approving an attraction invalidates them.
+    """
+    from application.models import Attractions
+
+    Attractions(attractionID=1, name="Museum", status="approved", created_by=1).save()
+    Attractions(attractionID=2, name="Gallery", status="pending", created_by=1).save()
+
+    assert client.get("/browse").headers["X-Cache"] == "MISS"
+    cached = client.get("/browse")
+    assert cached.headers["X-Cache"] == "HIT"
+    assert b"Gallery" not in cached.data
+
+    client.post("/approve_attraction/2")
+    with client.session_transaction() as sess:
+        sess.pop("_flashes", None)
+
+    response = client.get("/browse")
+    assert response.headers["X-Cache"] == "MISS"
+    assert b"Gallery" in response.data
+
+
+def test_login_rehashes_password_when_method_changes(client, app):
+    """
+    This test verifies that logging in with a password hashed under old
+    parameters upgrades the stored hash to the configured method, and that
+    the user can still log in afterwards.
+    """
+    import time
+    from application.models import User
+    from werkzeug.security import generate_password_hash
+
+    User(user_id=1, email="old@test.com", first_name="Old", last_name="Hash",
+         password=generate_password_hash("password123", method="pbkdf2:sha256:1000")).save()
+
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+    try:
+        response = client.post("/login", data={"email": "old@test.com", "password": "password123"}, follow_redirects=True)
+        assert b"successfully logged in" in response.data
+        for _ in range(50):  # the new hash is made on the hashing pool after the response
+            if User.objects(user_id=1).first().password.startswith("pbkdf2:sha256:2000$"):
+                break
+            time.sleep(0.1)
+        assert User.objects(user_id=1).first().password.startswith("pbkdf2:sha256:2000$")
+    finally:
+        app.config["PASSWORD_HASH_METHOD"] = "scrypt"
+
+
+def test_metrics_endpoint_reports_requests(client):
+    """
+    This test verifies that requests are counted per endpoint and exposed
+    on /metrics together with the MongoDB commands they sent.
+    """
+    client.get("/browse")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert b'http_requests_total{endpoint="main.browse",method="GET",status="200"}' in response.data
+    assert b'mongodb_commands_total{endpoint="main.browse"}' in response.data
+    assert b'http_request_duration_seconds_bucket{endpoint="main.browse",method="GET",le="+Inf"}' in response.data
+
+
+def test_user_listing_does_not_load_password_hashes(client, app):
+    """
+    This test verifies that the users listing is served from projected rows
+    and never renders a user's password hash.
+    """
+    from application.models import User
+
+    user = User(user_id=1, email="p@test.com", first_name="Pat", last_name="Doe")
+    with app.app_context():
+        user.set_password("secret123")
+    user.save()
+
+    response = client.get("/user")
+    assert b"p@test.com" in response.data
+    assert user.password.encode() not in response.data
+
+
+def test_bulk_review_moderation_reports_per_item_results(client):
+    """
+    This test verifies that the bulk review endpoint approves every
+    selected reported review in one request and reports the items it
+    skipped, such as unknown or unreported reviews.
+    """
+    from application.models import Attractions, Reviews
+
+    Attractions(attractionID=1, name="Park", status="approved", created_by=1).save()
+    Reviews(reviewID=1, attractionID=1, first_name="A", rating=6, review="x", reported=True).save()
+    Reviews(reviewID=2, attractionID=1, first_name="B", rating=8, review="y", reported=True).save()
+    Reviews(reviewID=3, attractionID=1, first_name="C", rating=2, review="z", reported=False).save()
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+        sess["is_admin"] = True
+
+    response = client.post("/bulk_reviews", data={"action": "approve", "ids": ["1", "2", "3", "9"]},
+                           headers={"Accept": "application/json"})
+    results = response.get_json()["results"]
+    assert results == {"1": "done", "2": "done", "3": "not reported", "9": "not found"}
+    assert Reviews.objects(reported=True).count() == 0
+    attraction = Attractions.objects(attractionID=1).first()
+    assert attraction.rating_count == 2
+    assert attraction.rating_mean == 7
+
+    client.post("/approve_review/1")
+    again = client.post("/bulk_reviews", data={"action": "approve", "ids": ["1"]},
+                        headers={"Accept": "application/json"})
+    assert again.get_json()["results"] == {"1": "not reported"}
+    assert Attractions.objects(attractionID=1).first().rating_count == 2
+
+    response = client.post("/bulk_reviews", data={"action": "delete", "ids": ["3"]}, follow_redirects=True)
+    assert b"1 reviews deleted" in response.data
+
+
+def test_bulk_attraction_moderation_reports_only_its_own_changes(client):
+    """
+    This test verifies that bulk approving attractions reports as done only
+    the attractions the request changed, explains the others, and leaves
+    no bulk action token behind.
+    """
+    from application.models import Attractions
+
+    Attractions(attractionID=1, name="Fort", status="pending", created_by=1).save()
+    Attractions(attractionID=2, name="Pier", status="approved", created_by=1).save()
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+        sess["is_admin"] = True
+
+    response = client.post("/bulk_attractions", data={"action": "approve", "ids": ["1", "2", "9"]},
+                           headers={"Accept": "application/json"})
+    assert response.get_json()["results"] == {"1": "done", "2": "already approved", "9": "not found"}
+    assert Attractions.objects(status="approved").count() == 2
+    assert Attractions.objects(moderation_token__ne=None).count() == 0
+
+
+def test_api_sparse_fieldsets_and_batch(client):
+    """
+    This test verifies that the JSON API returns only the requested fields,
+    embeds the rating summary, and fetches several attractions by ID in one
+    request while reporting IDs that are missing or not approved. Reviews
+    of attractions that are not approved are not served.
+    """
+    from application.models import Attractions
+
+    Attractions(attractionID=1, name="Park", description="Green", status="approved", created_by=1,
+                rating_count=2, rating_sum=14, rating_mean=7).save()
+    Attractions(attractionID=2, name="Hidden", status="pending", created_by=1).save()
+
+    listing = client.get("/api/v1/attractions?fields=name,rating").get_json()
+    assert listing["data"] == [{"id": 1, "name": "Park", "rating": {"count": 2, "mean": 7, "histogram": {}}}]
+    assert listing["next"] is None
+
+    batch = client.get("/api/v1/attractions/batch?ids=1,2,3&fields=name").get_json()
+    assert batch == {"data": [{"id": 1, "name": "Park"}], "missing": [2, 3]}
+
+    assert client.get("/api/v1/attractions?fields=password").status_code == 400
+    assert client.get("/api/v1/attractions/1/reviews").status_code == 200
+    assert client.get("/api/v1/attractions/2/reviews").status_code == 404
+
+
+def test_import_resumes_without_duplicates_and_exports(client, tmp_path):
+    """
+    This test verifies that a bulk import inserts the valid records with new
+    IDs, and that re-running a batch that was cut short reuses the IDs
+    reserved for it, so nothing is inserted twice. The export then streams
+    the imported attractions back out.
+    """
+    import json
+    from application.models import Attractions
+    from application.transfer import import_file, export_lines
+
+    path = tmp_path / "attractions.ndjson"
+    path.write_text('{"name": "Park", "location": "Exeter"}\n'
+                    '{"name": "Beach", "location": "Woolacombe"}\n'
+                    '{"name": "No location"}\n')
+    messages = []
+    result = import_file("attractions", str(path), batch_size=2, echo=messages.append)
+    assert (result.inserted, result.duplicates, result.invalid) == (2, 0, 1)
+    assert "line 3: location is required" in messages
+    assert not (tmp_path / "attractions.ndjson.checkpoint").exists()
+
+    # pretend the first run died after inserting its first batch
+    (tmp_path / "attractions.ndjson.checkpoint").write_text(json.dumps(
+        {"kind": "attractions", "batch_size": 2, "line": 0, "pending": 1}))
+    result = import_file("attractions", str(path), echo=messages.append)
+    assert (result.inserted, result.duplicates) == (0, 2)
+    assert Attractions.objects.count() == 2
+
+    exported = [json.loads(line) for line in export_lines("attractions")]
+    assert [(a["attractionID"], a["name"]) for a in exported] == [(1, "Park"), (2, "Beach")]
+
+
+def test_browse_and_api_filter_by_distance(client):
+    """
+    This test verifies that attractions can be listed nearest first and
+    filtered by radius and bounding box, that only approved attractions are
+    returned, and that attractions without coordinates are left out.
+    """
+    from application.models import Attractions
+
+    Attractions(attractionID=1, name="Exeter Cathedral", status="approved", point=[-3.5301, 50.7225]).save()
+    Attractions(attractionID=2, name="Torquay Harbour", status="approved", point=[-3.5253, 50.4619]).save()
+    Attractions(attractionID=3, name="Plymouth Hoe", status="pending", point=[-4.1427, 50.3649]).save()
+    Attractions(attractionID=4, name="Nowhere", status="approved").save()
+
+    near_exeter = client.get("/api/v1/attractions?lat=50.72&lng=-3.53&sort=distance&fields=name").get_json()
+    assert [a["id"] for a in near_exeter["data"]] == [1, 2]
+
+    within = client.get("/api/v1/attractions?lat=50.72&lng=-3.53&radius=10&fields=coordinates").get_json()
+    assert within["data"] == [{"id": 1, "coordinates": {"lat": 50.7225, "lng": -3.5301}}]
+
+    boxed = client.get("/api/v1/attractions?bbox=-4.5,50.3,-3.52,50.5").get_json()
+    assert [a["id"] for a in boxed["data"]] == [2]
+
+    assert client.get("/api/v1/attractions?lat=95&lng=0").status_code == 400
+    response = client.get("/browse?lat=50.72&lng=-3.53&sort=distance")
+    assert response.data.index(b"Exeter Cathedral") < response.data.index(b"Torquay Harbour")
+    assert b"Nowhere" not in response.data
+
+
+def test_autocomplete_follows_approval(client):
+    """
+    This test verifies that the autocomplete endpoint suggests approved
+    attractions only, and picks up an attraction as soon as an admin
+    approves it.
+    """
+    from application.models import Attractions
+
+    Attractions(attractionID=1, name="Exeter Cathedral", status="approved", rating_count=3).save()
+    Attractions(attractionID=2, name="Exmouth Beach", status="pending").save()
+
+    assert client.get("/autocomplete?q=ex").get_json() == [{"id": 1, "name": "Exeter Cathedral"}]
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+        sess["is_admin"] = True
+    client.post("/approve_attraction/2")
+    names = [m["name"] for m in client.get("/autocomplete?q=ex").get_json()]
+    assert names == ["Exeter Cathedral", "Exmouth Beach"]
+
+
+def test_readiness_waits_for_warm_up(client, app):
+    """
+    This test verifies that /readyz reports 503 until the worker has warmed
+    up and 200 afterwards, while /healthz is always 200.
+    """
+    from application.server import warm_up, stopping
+
+    stopping()
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/readyz").status_code == 503
+    with app.app_context():
+        warm_up(threads=2)
+    assert client.get("/readyz").status_code == 200
+    stopping()
+    assert client.get("/readyz").status_code == 503
+
+
+def test_review_feed_is_sorted_and_paged(client):
+    """
+    This test verifies that the attraction page shows the first page of
+    reviews in the chosen order, hides reported reviews, and that the
+    "load more" fragment continues from the cursor without repeating a
+    review. The fragment is not served for attractions that are not
+    approved.
+    """
+    import re
+    from application.models import Attractions, Reviews
+
+    Attractions(attractionID=1, name="Castle", status="approved", created_by=1).save()
+    for i in range(1, 16):
+        Reviews(reviewID=i, attractionID=1, first_name=f"R{i}", rating=i % 10 + 1,
+                review="ok", reported=(i == 9)).save()
+
+    response = client.get("/attraction/1?sort=highest")
+    names = re.findall(rb"<strong>(R\d+)</strong>", response.data)
+    assert names[:5] == [b"R8", b"R7", b"R6", b"R5", b"R15"]  # R9 (rating 10) is reported
+    assert len(names) == 10
+
+    more = re.search(rb'data-more="([^"]+)"', response.data).group(1).replace(b"&amp;", b"&")
+    fragment = client.get(more.decode())
+    rest = re.findall(rb"<strong>(R\d+)</strong>", fragment.data)
+    assert len(rest) == 4
+    assert not set(names) & set(rest)
+    assert b"load-more" not in fragment.data
+
+    client.get("/attraction/1?before=5")  # a mid-feed page must not be reused for the first one
+    newest = client.get("/attraction/1")
+    assert re.findall(rb"<strong>(R\d+)</strong>", newest.data)[0] == b"R15"
+
+    Attractions(attractionID=2, name="Hidden", status="pending", created_by=1).save()
+    Reviews(reviewID=16, attractionID=2, first_name="R16", rating=5, review="ok").save()
+    assert client.get("/attraction/2/reviews").status_code == 404
+
+
+def test_reports_are_counted_once_per_user_and_claimed_in_batches(client, app):
+    """
+    This test verifies that repeat reports from one user are not counted,
+    that the moderation queue lists the most reported review first, and
+    that two admins claiming batches never get the same review and cannot
+    moderate each other's claimed reviews.
+    """
+    import re
+    from application.models import Attractions, Reviews
+    from application.reports import claim_batch
+
+    Attractions(attractionID=1, name="Castle", status="approved", created_by=1).save()
+    for i in (1, 2, 3):
+        Reviews(reviewID=i, attractionID=1, first_name=f"R{i}", rating=5, review="x").save()
+
+    for user_id, review_id in [(1, 2), (1, 1), (1, 1), (2, 1), (3, 3)]:
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+        client.post(f"/report_review/{review_id}")
+
+    assert [r.report_count for r in Reviews.objects.order_by("reviewID")] == [2, 1, 1]
+    page = client.get("/admin")
+    assert re.findall(rb"<strong>(R\d)</strong> on", page.data) == [b"R1", b"R2", b"R3"]
+
+    with app.app_context():
+        first = claim_batch(10, size=2)
+        second = claim_batch(11, size=2)
+    assert [r.reviewID for r in first] == [1, 2]
+    assert [r.reviewID for r in second] == [3]
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 11
+        sess["is_admin"] = True
+    response = client.post("/bulk_reviews", data={"action": "approve", "ids": ["1", "3"]},
+                           headers={"Accept": "application/json"})
+    assert response.get_json()["results"] == {"1": "claimed by another admin", "3": "done"}
+    assert Reviews.objects(reviewID=3).first().report_count == 0
+
+
+def test_jobs_are_deduplicated_retried_and_failed(client, app):
+    """
+    This test verifies that a job with an idempotency key is only queued
+    once while it is pending, that a failing job is retried until it
+    succeeds, and that a job which keeps failing is marked failed after
+    its last attempt.
+    """
+    from application.models import Job
+    from application.jobs import task, enqueue, work_off, queue_stats
+
+    calls = []
+
+    @task("test.flaky", max_attempts=3)
+    def flaky(n):
+        calls.append(n)
+        if len(calls) < 2:
+            raise RuntimeError("try again")
+
+    @task("test.broken", max_attempts=2)
+    def broken():
+        raise RuntimeError("always")
+
+    app.config["JOBS_BACKOFF_SECONDS"] = 0
+    try:
+        with app.app_context():
+            job_id = enqueue("test.flaky", key="flaky:1", n=1)
+            assert enqueue("test.flaky", key="flaky:1", n=1) is None
+            assert queue_stats()["ready"] == 1
+            assert work_off() == (1, 1)
+            assert calls == [1, 1]
+            assert Job.objects(id=job_id).first().status == "done"
+            assert enqueue("test.flaky", key="flaky:1", n=1) is not None
+
+            broken_id = enqueue("test.broken")
+            work_off()
+            job = Job.objects(id=broken_id).first()
+            assert (job.status, job.attempts) == ("failed", 2)
+            assert "always" in job.error
+            assert queue_stats()["failed"] == 1
+    finally:
+        app.config["JOBS_BACKOFF_SECONDS"] = 5
+
+
+def test_status_changes_only_apply_in_allowed_states(client):
+    """
+    This test verifies that approving a missing attraction is reported
+    instead of failing, that approving twice only changes it once, that an
+    approved attraction can no longer be edited by its creator, and that a
+    review can't be rejected before it has been reported.
+    """
+    from application.models import Attractions, Reviews
+
+    Attractions(attractionID=1, name="Museum", status="pending", created_by=5).save()
+    Reviews(reviewID=1, attractionID=1, first_name="Ann", rating=4, review="Nice").save()
+
+    response = client.post("/approve_attraction/9", follow_redirects=True)
+    assert b"Attraction not found" in response.data
+
+    client.post("/approve_attraction/1")
+    response = client.post("/approve_attraction/1", follow_redirects=True)
+    assert b"already approved" in response.data
+
+    with client.session_transaction() as sess:
+        sess["user_id"] = 5
+    response = client.post("/edit_attraction/1", data={"attraction_name": "Changed", "description": "D",
+                                                       "location": "L"}, follow_redirects=True)
+    assert b"You can only edit pending or rejected attractions" in response.data
+    attraction = Attractions.objects(attractionID=1).first()
+    assert (attraction.name, attraction.status) == ("Museum", "approved")
+
+    response = client.post("/reject_review/1", follow_redirects=True)
+    assert b"Review has not been reported" in response.data
+    assert Reviews.objects(reviewID=1).first().status != "rejected"
+
+
+def test_static_assets_are_hashed_cached_and_compressed(client, app, tmp_path):
+    """
+    This test verifies that once the assets are built, url_for('static')
+    links to the hashed file, which is served as the gzip copy with an
+    immutable Cache-Control header, and that HTML pages are gzipped for
+    clients that accept it.
+    """
+    import gzip
+    from flask import url_for
+    from application.assets import build_assets
+
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "main.css").write_text("body { color: #333; }\n" * 100)
+    static_folder, manifest = app.static_folder, app.extensions["assets"]
+    app.static_folder = str(tmp_path)
+    app.extensions["assets"] = build_assets(str(tmp_path))
+    try:
+        with app.test_request_context():
+            url = url_for("static", filename="css/main.css")
+        assert url.startswith("/static/dist/css/main.") and url.endswith(".css")
+
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "immutable" in response.headers["Cache-Control"]
+        assert gzip.decompress(response.data) == (tmp_path / "css" / "main.css").read_bytes()
+        response.close()
+
+        page = client.get("/browse", headers={"Accept-Encoding": "gzip"})
+        assert page.headers["Content-Encoding"] == "gzip"
+        assert url.encode() in gzip.decompress(page.data)
+        assert "Content-Encoding" not in client.get("/browse").headers
+    finally:
+        app.static_folder, app.extensions["assets"] = static_folder, manifest
@@ -1,5 +1,12 @@
-from application.models import Reviews
+from application.models import Reviews, Counter
 from application.route import get_next_available_review_id
+from application.sequences import reset_sequences
+
+
+def reset_reviews():
+    Reviews.drop_collection()
+    Counter.drop_collection()
+    reset_sequences()
 
 
 def test_next_review_id_empty_db():
@@ -8,7 +15,7 @@ def test_next_review_id_empty_db():
     sp next available review ID starts at 1. It ensures that the function
     correctly identifies the starting point for review IDs.
     """
-    Reviews.drop_collection()
+    reset_reviews()
     next_id = get_next_available_review_id()
     assert next_id == 1
 
@@ -17,10 +24,10 @@ def test_next_review_id_with_existing():
     """
     This test checks that the get_next_available_review_id function correctly
     identifies the next review ID when there are existing reviews in the 
-    database. It ensures that the function can handle a populated database 
+    database. It ensures that the counter is seeded from the existing reviews
     and returns the correct next ID.
     """
-    Reviews.objects.delete()
+    reset_reviews()
     Reviews(reviewID=1, attractionID=1, first_name="A", rating=5, review="Good", reported=False).save()
     Reviews(reviewID=2, attractionID=1, first_name="B", rating=4, review="Nice", reported=False).save()
 
@@ -31,16 +38,232 @@ def test_next_review_id_with_existing():
 def test_next_review_id_gap():
     """
     This test verifies that the get_next_available_review_id function
-    correctly identifies the next review ID when there is a gap in the
-    existing review IDs. It ensures that the function can handle
-    non-sequential IDs and returns the correct next ID, which should
-    be the smallest available ID that is not currently in use such as
-    when review ID 2 is missing, the next available ID should be 2 instead of 3.
+    does not reuse IDs when there is a gap in the existing review IDs.
+    The counter is seeded from the highest existing ID, so when review ID 2
+    is missing the next ID is still 4, and a second call returns 5.
 
     """
-    Reviews.objects.delete()
+    reset_reviews()
     Reviews(reviewID=1, attractionID=1, first_name="A", rating=5, review="Good", reported=False).save()
     Reviews(reviewID=3, attractionID=1, first_name="B", rating=4, review="Nice", reported=False).save()
 
-    next_id = get_next_available_review_id()
-    assert next_id == 2
+    assert get_next_available_review_id() == 4
+    assert get_next_available_review_id() == 5
+
+
+def test_next_review_id_block_allocation(app):
+    """
+    This test verifies that with ID_BLOCK_SIZE set, IDs are handed out from
+    a reserved block in memory and the counter is advanced once per block.
+    """
+    reset_reviews()
+    app.config["ID_BLOCK_SIZE"] = 10
+    try:
+        ids = [get_next_available_review_id() for _ in range(3)]
+    finally:
+        app.config["ID_BLOCK_SIZE"] = 1
+        reset_sequences()
+
+    assert ids == [1, 2, 3]
+    assert Counter.objects(name="reviewID").first().value == 10
+
+
+def test_parse_query_terms_and_phrases():
+    """
+    This test verifies that the search query parser splits a query into
+    stemmed terms and quoted phrases, and drops stop words.
+    """
+    from application.search import parse_query
+
+    terms, phrases = parse_query('the Beaches "National Park"')
+    assert terms == ["beach"]
+    assert phrases == ["national park"]
+
+
+def test_stemming_matches_plurals_of_words_ending_in_e():
+    """
+    This test verifies that the stemmer maps plurals of words ending in e
+    ("lakes", "places") to their singular, still strips "es" after ch or
+    x, and that $text queries get the words unstemmed, since MongoDB
+    stems them itself.
+    """
+    from application.search import stem, parse_query, to_text_search
+
+    for plural, singular in (("lakes", "lake"), ("places", "place"), ("houses", "house"),
+                             ("beaches", "beach"), ("boxes", "box"), ("families", "family")):
+        assert stem(plural) == stem(singular)
+    assert to_text_search(*parse_query('the family places "National Park"', stemmed=False)) == \
+        'family places "national park"'
+
+
+def test_inverted_index_ranks_by_field_weight():
+    """
+    This test verifies that the in-memory search index ranks a match in the
+    name above a match in the description, that phrases must match, and
+    that removing an attraction drops the postings only it had.
+    """
+    from application.search import InvertedIndex, parse_query
+
+    index = InvertedIndex()
+    index.add(1, "Exeter Cathedral", "Exeter", "Gothic cathedral near the beach")
+    index.add(2, "Woolacombe Beach", "Woolacombe", "Sandy beaches")
+    index.add(3, "Dartmoor National Park", "Dartmoor", "Moorland park")
+
+    assert index.search(*parse_query("beach")) == [2, 1]
+    assert index.search(*parse_query('"national park"')) == [3]
+    index.remove(2)
+    assert index.search(*parse_query("beach")) == [1]
+    assert 2 not in index.terms and "woolacombe" not in index.postings
+
+
+def test_benchmark_catalog_is_deterministic():
+    """
+    This test verifies that the benchmark data generator gives the same
+    documents for the same seed, and that reviews are skewed towards a few
+    popular attractions.
+    """
+    from application.benchmark import attraction_docs, review_docs
+
+    assert list(attraction_docs(50, 10, seed=7)) == list(attraction_docs(50, 10, seed=7))
+    reviews = list(review_docs(2000, 100, seed=7))
+    assert reviews == list(review_docs(2000, 100, seed=7))
+    top_ten = sum(1 for r in reviews if r["attractionID"] <= 10)
+    assert top_ten > len(reviews) / 3
+
+
+def test_import_records_are_read_and_validated():
+    """
+    This test verifies that import files are read record by record with
+    their line numbers, and that invalid records are rejected with a reason
+    while valid ones are turned into documents.
+    """
+    import io
+    import pytest
+    from application.transfer import read_records, validate_review, RecordError
+
+    ndjson = io.StringIO('{"attractionID": 1, "rating": 7, "review": "Lovely"}\n\nnot json\n'
+                         '{"attractionID": 1, "rating": 11, "review": "Too good"}\n')
+    records = list(read_records(ndjson, 'ndjson'))
+    assert [number for number, _ in records] == [1, 3, 4]
+
+    doc = validate_review(records[0][1])
+    assert doc["first_name"] == "Anonymous" and doc["rating"] == 7 and doc["reported"] is False
+    for _, record in records[1:]:
+        with pytest.raises(RecordError):
+            validate_review(record)
+
+    csv_file = io.StringIO("attractionID,rating,review,reported\n2,3,\"Meh, ok\",true\n")
+    [(number, record)] = read_records(csv_file, 'csv')
+    assert number == 2
+    assert validate_review(record) == {"attractionID": 2, "first_name": "Anonymous", "rating": 3,
+                                       "review": "Meh, ok", "reported": True}
+
+
+def test_gazetteer_geocodes_location_text(tmp_path):
+    """
+    This test verifies that location strings are looked up in a local
+    gazetteer by their whole text or by any comma separated part, and that
+    coordinates are checked and stored as GeoJSON [longitude, latitude].
+    """
+    import pytest
+    from application.geo import load_gazetteer, geocode, make_point, GeoError
+
+    path = tmp_path / "places.csv"
+    path.write_text("name,latitude,longitude\nExeter,50.7184,-3.5339\nTorquay,50.4619,-3.5253\n")
+    places = load_gazetteer(str(path))
+
+    assert geocode("exeter", places) == (50.7184, -3.5339)
+    assert geocode("Torquay, Devon", places) == (50.4619, -3.5253)
+    assert geocode("Atlantis", places) is None
+    assert make_point("50.5", "-3.5") == {"type": "Point", "coordinates": [-3.5, 50.5]}
+    with pytest.raises(GeoError):
+        make_point(91, 0)
+
+
+def test_prefix_index_ranks_and_updates():
+    """
+    This test verifies that the autocomplete index matches a prefix of any
+    word in a name, ranks matches by popularity, and that removing an
+    attraction from a short prefix's precomputed top list lets the next
+    best match take its place. A change replaces the buckets it touches
+    rather than changing the ones readers may still be using.
+    """
+    from application.autocomplete import PrefixIndex
+
+    index = PrefixIndex(max_results=2)
+    index.add(1, "Exeter Cathedral", count=5, mean=8)
+    index.add(2, "Exmouth Beach", count=20, mean=6)
+    index.add(3, "Exe Estuary")
+    index.finish()
+
+    assert index.complete("ex") == [(2, "Exmouth Beach"), (1, "Exeter Cathedral")]
+    assert index.complete("cath") == [(1, "Exeter Cathedral")]
+    before = index.buckets["exm"]
+    index.remove(2)
+    assert before.ids == [2] and "exm" not in index.buckets
+    assert index.complete("ex") == [(1, "Exeter Cathedral"), (3, "Exe Estuary")]
+    assert index.complete("Exe", limit=1) == [(1, "Exeter Cathedral")]
+    assert index.complete("exet") == [(1, "Exeter Cathedral")]
+    assert index.stats()["attractions"] == 2
+
+
+def test_importing_the_package_does_not_load_the_routes():
+    """
+    This test verifies that importing the application package in a fresh
+    interpreter only loads what it needs: the blueprint modules are
+    imported by create_app(), not by the package, while creating the app
+    does show them in the profile.
+    """
+    from application.startup import profile_startup
+
+    modules = {row.module for row in profile_startup("package")}
+    app_modules = {row.module for row in profile_startup("app")}
+    blueprints = {"application.route", "application.account", "application.admin", "application.api"}
+
+    assert {"application", "config"} <= modules
+    assert not blueprints & modules
+    assert blueprints <= app_modules
+
+
+def test_the_app_does_not_load_the_maintenance_tools():
+    """
+    This test verifies that creating the app (as every web worker and
+    flask command does) registers the public, account and admin blueprints
+    without importing the benchmark, import/export and audit code, which
+    the CLI commands only import when they run.
+    """
+    from application.startup import profile_startup
+
+    modules = {row.module for row in profile_startup("app")}
+
+    assert {"application.route", "application.account", "application.admin", "application.api",
+            "application.server", "application.commands"} <= modules
+    assert not {"application.benchmark", "application.transfer", "application.audit"} & modules
+
+
+def test_assets_are_fingerprinted_and_precompressed(tmp_path):
+    """
+    This test verifies that build_assets copies static files under a name
+    containing a hash of their contents, keeps a gzip copy of text files
+    only, skips uploaded images and gives a changed file a new name.
+    """
+    import gzip
+    from application.assets import build_assets, load_manifest
+
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "main.css").write_text("body { color: #333; }\n" * 100)
+    (tmp_path / "images" / "blobs").mkdir(parents=True)
+    (tmp_path / "images" / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 100)
+    (tmp_path / "images" / "blobs" / "upload.jpg").write_bytes(b"\xff\xd8\xff")
+
+    manifest = build_assets(str(tmp_path))
+
+    assert sorted(manifest) == ["css/main.css", "images/logo.png"]
+    hashed = tmp_path / "dist" / manifest["css/main.css"]
+    assert hashed.name.startswith("main.") and hashed.name != "main.css"
+    assert gzip.decompress((tmp_path / "dist" / (manifest["css/main.css"] + ".gz")).read_bytes()) == hashed.read_bytes()
+    assert not (tmp_path / "dist" / (manifest["images/logo.png"] + ".gz")).exists()
+    assert load_manifest(str(tmp_path)) == manifest
+
+    (tmp_path / "css" / "main.css").write_text("body { color: #000; }\n")
+    assert build_assets(str(tmp_path))["css/main.css"] != manifest["css/main.css"]
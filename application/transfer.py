@@ -0,0 +1,340 @@
+"""
+Transfer.py
+This file contains the streaming bulk import and export of attractions and
+reviews, used by the "flask import-data" and "flask export-data" commands.
+Files are NDJSON (one JSON object per line) or CSV with a header row.
+
+Imports read the file one record at a time and write it in insert_many
+batches, so memory use depends on the batch size and not on the size of the
+file. Every record is validated the way the add forms validate it; bad
+records are reported with their line number and skipped. New IDs are
+reserved a whole batch at a time from the counters collection (see
+sequences.py). After every batch a checkpoint file records how far the
+import got, so an interrupted import run again on the same file carries on
+from there without inserting anything twice.
+
+Exports are generators: approved content is read in ID order through
+projected, uncached cursors and yielded one output line at a time.
+
+"""
+
+
+import os
+import io
+import csv
+import json
+from itertools import islice
+
+from pymongo.errors import BulkWriteError
+
+from application.models import Attractions, Reviews
+from application.sequences import reserve_ids, seed_sequence
+from application.ratings import rebuild_ratings
+from application.reports import backfill_reports
+from application.geo import point_from_form, GeoError
+
+
+FORMATS = ('ndjson', 'csv')
+STATUSES = ('pending', 'approved', 'rejected')
+DUPLICATE_KEY = 11000
+
+# fields written by export, in CSV column order; import accepts the same
+EXPORT_FIELDS = {
+    'attractions': ('attractionID', 'name', 'description', 'location', 'latitude', 'longitude', 'created_by'),
+    'reviews': ('reviewID', 'attractionID', 'first_name', 'rating', 'review'),
+}
+
+
+class RecordError(ValueError):
+    """
+    Raised for a record that fails validation.
+    """
+
+
+def _text(record, field, max_length, required=True):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise RecordError(f"{field} is required")
+        return None
+    if len(value) > max_length:
+        raise RecordError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def _int(record, field, low=1, high=None, required=True):
+    value = record.get(field)
+    if value in (None, '') and not required:
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RecordError(f"{field} must be a whole number")
+    if value < low or (high is not None and value > high):
+        raise RecordError(f"{field} must be between {low} and {high}" if high else f"{field} must be at least {low}")
+    return value
+
+
+def _bool(record, field):
+    value = record.get(field)
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in ('1', 'true', 'yes')
+
+
+def validate_attraction(record, keep_ids=False, status="approved"):
+    """
+    Returns the Attractions document for an import record, or raises
+    RecordError. name and location are required; latitude and longitude
+    are optional. Records without a status get the given one.
+    """
+    if not isinstance(record, dict):
+        raise RecordError("not a JSON object")
+    try:
+        point = point_from_form({k: '' if record.get(k) is None else str(record[k])
+                                 for k in ('latitude', 'longitude')})
+    except GeoError as error:
+        raise RecordError(str(error))
+    doc = {
+        'name': _text(record, 'name', 100),
+        'description': _text(record, 'description', 1000, required=False),
+        'location': _text(record, 'location', 100),
+        'status': _text(record, 'status', 20, required=False) or status,
+        'created_by': _int(record, 'created_by', required=False),
+        'rating_count': 0, 'rating_sum': 0, 'rating_mean': 0, 'rating_histogram': {},
+    }
+    if point:
+        doc['point'] = point
+    if doc['status'] not in STATUSES:
+        raise RecordError(f"status must be one of {', '.join(STATUSES)}")
+    if keep_ids:
+        doc['attractionID'] = _int(record, 'attractionID')
+    return doc
+
+
+def validate_review(record, keep_ids=False, status=None):
+    """
+    Returns the Reviews document for an import record, or raises
+    RecordError. attractionID, a rating from 1 to 10 and the review text are
+    required; the name defaults to "Anonymous" like the add review form.
+    """
+    if not isinstance(record, dict):
+        raise RecordError("not a JSON object")
+    doc = {
+        'attractionID': _int(record, 'attractionID'),
+        'first_name': _text(record, 'first_name', 50, required=False) or "Anonymous",
+        'rating': _int(record, 'rating', 1, 10),
+        'review': _text(record, 'review', 1000),
+        'reported': _bool(record, 'reported'),
+    }
+    if keep_ids:
+        doc['reviewID'] = _int(record, 'reviewID')
+    return doc
+
+
+# kind -> (model, ID field / counter name, validator)
+KINDS = {
+    'attractions': (Attractions, 'attractionID', validate_attraction),
+    'reviews': (Reviews, 'reviewID', validate_review),
+}
+
+
+def read_records(stream, fmt):
+    """
+    Yields (line number, record) for every record in an open NDJSON or CSV
+    file. A line that is not valid JSON is yielded as the raw string, which
+    validation then rejects.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, line
+
+
+class ImportResult(object):
+    """
+    Counts for one import run: records inserted, records already present
+    (from an earlier, interrupted run or with --keep-ids) and invalid records.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+
+def _load_checkpoint(path, kind, batch_size):
+    if not os.path.exists(path):
+        return {'kind': kind, 'batch_size': batch_size, 'line': 0, 'pending': None}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('kind') != kind:
+        raise ValueError(f"{path} is a checkpoint for importing {checkpoint.get('kind')}, not {kind}")
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    # write then rename, so a crash never leaves a half-written checkpoint
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def _missing_attractions(docs):
+    ids = {doc['attractionID'] for doc in docs}
+    found = set(Attractions.objects(attractionID__in=list(ids)).distinct('attractionID'))
+    return ids - found
+
+
+def _insert_batch(model, docs):
+    """
+    insert_many without stopping at duplicates; returns how many were new.
+    Any other write error is raised.
+    """
+    try:
+        return len(model._get_collection().insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as error:
+        if any(e['code'] != DUPLICATE_KEY for e in error.details['writeErrors']):
+            raise
+        return error.details['nInserted']
+
+
+def import_file(kind, path, fmt=None, batch_size=1000, keep_ids=False, status="approved",
+                checkpoint_path=None, restart=False, echo=print):
+    """
+    This function imports the attractions or reviews in the file at path and
+    returns an ImportResult. Invalid records are passed to echo with their
+    line number and skipped. Reviews must belong to an existing attraction.
+
+    Records get new IDs unless keep_ids is set, in which case the IDs in the
+    file are used (for migrating a whole database, so reviews keep pointing
+    at their attractions) and the counter is moved past them.
+
+    Progress is saved to checkpoint_path (path + ".checkpoint" by default)
+    after every batch and the file is removed when the import completes.
+    Before a batch is inserted the first ID reserved for it is saved too, so
+    a batch that was cut short is retried with the same IDs and the records
+    that made it in are skipped as duplicates. restart ignores a saved
+    checkpoint. After importing reviews the rating summaries are rebuilt.
+    """
+    model, id_field, validate = KINDS[kind]
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    checkpoint_path = checkpoint_path or path + '.checkpoint'
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = _load_checkpoint(checkpoint_path, kind, batch_size)
+    # a resumed import must cut batches exactly as before to reuse reserved IDs
+    batch_size = checkpoint['batch_size']
+    if checkpoint['line']:
+        echo(f"Resuming after line {checkpoint['line']}")
+
+    model.ensure_indexes()
+    if keep_ids:
+        seed_sequence(id_field)
+    result = ImportResult()
+
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        records = ((n, r) for n, r in read_records(stream, fmt) if n > checkpoint['line'])
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                break
+            docs, lines = [], []
+            for number, record in chunk:
+                try:
+                    docs.append(validate(record, keep_ids, status))
+                    lines.append(number)
+                except RecordError as error:
+                    result.invalid += 1
+                    echo(f"line {number}: {error}")
+            if kind == 'reviews' and docs:
+                missing = _missing_attractions(docs)
+                for number, doc in [(n, d) for n, d in zip(lines, docs) if d['attractionID'] in missing]:
+                    result.invalid += 1
+                    echo(f"line {number}: attraction {doc['attractionID']} does not exist")
+                docs = [d for d in docs if d['attractionID'] not in missing]
+
+            if docs:
+                if keep_ids:
+                    seed_sequence(id_field, max(doc[id_field] for doc in docs))
+                else:
+                    start = checkpoint['pending'] or reserve_ids(id_field, len(docs))
+                    checkpoint['pending'] = start
+                    _save_checkpoint(checkpoint_path, checkpoint)
+                    for offset, doc in enumerate(docs):
+                        doc[id_field] = start + offset
+                inserted = _insert_batch(model, docs)
+                result.inserted += inserted
+                result.duplicates += len(docs) - inserted
+
+            checkpoint['line'] = chunk[-1][0]
+            checkpoint['pending'] = None
+            _save_checkpoint(checkpoint_path, checkpoint)
+            echo(f"{kind}: {result.inserted} imported (line {checkpoint['line']})")
+
+    os.remove(checkpoint_path)
+    if kind == 'reviews' and result.inserted:
+        rebuild_ratings()
+        backfill_reports()  # reported reviews join the moderation queue
+    return result
+
+
+def export_records(kind, batch_size=1000):
+    """
+    Yields the approved attractions, or the visible reviews of approved
+    attractions, as plain dicts of EXPORT_FIELDS. Attractions come in ID
+    order and reviews grouped by attraction, fetched for batch_size
+    attractions at a time, so neither collection is ever held in memory.
+    """
+    fields = EXPORT_FIELDS[kind]
+    stored = [f for f in fields if f not in ('latitude', 'longitude')]
+    attractions = (Attractions.objects(status="approved").order_by('attractionID')
+                   .only(*(stored + ['point'] if kind == 'attractions' else ['attractionID']))
+                   .batch_size(batch_size).no_cache().as_pymongo())
+    if kind == 'attractions':
+        for doc in attractions:
+            lng, lat = (doc.get('point') or {}).get('coordinates') or (None, None)
+            yield dict({field: doc.get(field) for field in stored}, latitude=lat, longitude=lng)
+        return
+
+    ids = (doc['attractionID'] for doc in attractions)
+    while True:
+        chunk = list(islice(ids, batch_size))
+        if not chunk:
+            return
+        reviews = (Reviews.objects(attractionID__in=chunk, reported=False)
+                   .order_by('attractionID').only(*fields)
+                   .batch_size(batch_size).no_cache().as_pymongo())
+        for doc in reviews:
+            yield {field: doc.get(field) for field in fields}
+
+
+def export_lines(kind, fmt='ndjson', batch_size=1000):
+    """
+    Yields export_records as NDJSON lines or CSV rows (after a header row),
+    ready to be written to a file or streamed in a response.
+    """
+    records = export_records(kind, batch_size)
+    if fmt != 'csv':
+        for record in records:
+            yield json.dumps(record) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS[kind])
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
@@ -0,0 +1,154 @@
+"""
+Uploads.py
+This file contains the storage layer for uploaded attraction images.
+Uploads are streamed to disk in chunks while being hashed, checked against
+known image signatures on the first chunk and capped at UPLOAD_MAX_BYTES.
+Each file is stored under its SHA-256 content hash, so identical images are
+kept once and two users uploading "beach.jpg" never overwrite each other.
+An ImageBlob document counts how many attractions use each file; when the
+last one lets go, the file and its variants are deleted. Because a hashed
+file never changes, it is served with an immutable Cache-Control header.
+
+"""
+
+
+import os
+import glob
+import hashlib
+import tempfile
+
+from flask import request, current_app
+from pymongo import ReturnDocument
+
+from application.models import ImageBlob
+
+
+BLOB_DIR = 'images/blobs'
+
+# leading bytes -> file extension for the image types we accept
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    """
+    Raised when an upload is rejected; the message is shown to the user.
+    """
+
+
+def _static_path(path):
+    return os.path.join(current_app.root_path, 'static', path)
+
+
+def _sniff(head):
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def store_upload(file_storage):
+    """
+    This function stores an uploaded image and returns its path relative to
+    static/ (e.g. "images/blobs/3f/3fa9...c1.jpg"), taking one reference on
+    it. The body is copied in CHUNK_SIZE pieces to a temporary file in the
+    blob directory while being hashed, then renamed to its hash, or dropped
+    if that hash is already stored. Raises UploadError if the file is not a
+    JPEG, PNG, GIF or WebP image, or is larger than UPLOAD_MAX_BYTES.
+    """
+    limit = current_app.config.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+    blob_root = _static_path(BLOB_DIR)
+    os.makedirs(blob_root, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    ext = None
+    fd, tmp_path = tempfile.mkstemp(dir=blob_root, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = _sniff(chunk)
+                    if ext is None:
+                        raise UploadError("Only JPEG, PNG, GIF or WebP images can be uploaded")
+                size += len(chunk)
+                if size > limit:
+                    raise UploadError(f"Images must be smaller than {limit // (1024 * 1024)} MB")
+                digest.update(chunk)
+                out.write(chunk)
+        if ext is None:
+            raise UploadError("The uploaded image is empty")
+
+        name = digest.hexdigest()
+        path = f"{BLOB_DIR}/{name[:2]}/{name}.{ext}"
+        final_path = _static_path(path)
+        # take the reference first so a concurrent release of the same blob
+        # can't delete the file we are about to point at
+        acquire(path, size)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return path
+
+
+def acquire(path, size=None):
+    """
+    Adds one reference to a stored image.
+    """
+    update = {'$inc': {'refs': 1}}
+    if size is not None:
+        update['$setOnInsert'] = {'size': size}
+    ImageBlob._get_collection().update_one({'_id': path}, update, upsert=True)
+
+
+def release(path):
+    """
+    This function drops one reference to a stored image. When no attraction
+    uses it any more, the blob record, the file and its variants are
+    deleted. Paths that are not content-addressed blobs (images uploaded
+    before this storage existed) are left alone.
+    """
+    if not path or not path.startswith(BLOB_DIR + '/'):
+        return
+    collection = ImageBlob._get_collection()
+    doc = collection.find_one_and_update({'_id': path}, {'$inc': {'refs': -1}},
+                                         return_document=ReturnDocument.AFTER)
+    if doc is None or doc['refs'] > 0:
+        return
+    # only the request whose delete succeeds removes the files
+    if collection.delete_one({'_id': path, 'refs': {'$lte': 0}}).deleted_count:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for leftover in [_static_path(path)] + glob.glob(_static_path(f"images/variants/{stem}-*")):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+
+
+def cache_blobs_forever(response):
+    """
+    Marks content-addressed images as cacheable for a year and immutable.
+    """
+    if request.path.startswith(f"/static/{BLOB_DIR}/") and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    return response
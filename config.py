@@ -5,5 +5,78 @@ class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY') or b"r\xfaN\xa5\xdd\xa2at'\xf6J\xadM\xfa\xaa\x83"
     # to create secret key python -c "import os; print(os.urandom(16))"
 
-    MONGODB_SETTINGS = {'db': 'UTA_Enrollment'}
+    MONGODB_SETTINGS = {'db': os.environ.get('MONGODB_DB', 'UTA_Enrollment')}
     # 'host': 'mongodb://localhost:27017/UTA_Enrollment'
+
+    ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', 1))
+    # number of IDs each worker reserves per counter round trip (see sequences.py)
+
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'text')
+    # "text" uses the MongoDB text index, "memory" the in-process index (see search.py)
+    SEARCH_MAX_RESULTS = 200
+    SEARCH_REFRESH_SECONDS = 300
+
+    PAGE_SIZE = 24
+    MAX_PAGE_SIZE = 100
+    # default and maximum rows per page for the listing pages (see pagination.py)
+    REVIEW_PAGE_SIZE = 10
+    # reviews shown on the attraction page and per "load more"
+
+    MODERATION_BATCH_SIZE = 10
+    MODERATION_LEASE_SECONDS = 900
+    # reported reviews an admin claims at a time, and for how long (see reports.py)
+
+    GEO_NEAR_LIMIT = 50
+    # most attractions shown when sorting by distance (see geo.py)
+
+    AUTOCOMPLETE_LIMIT = 8
+    AUTOCOMPLETE_MAX_LIMIT = 20
+    AUTOCOMPLETE_MAX_ENTRIES = 200000
+    AUTOCOMPLETE_REFRESH_SECONDS = 300
+    # typeahead suggestions and the size of the prefix index (see autocomplete.py)
+
+    IMAGE_PROCESSING = os.environ.get('IMAGE_PROCESSING', 'async')
+    IMAGE_FORMAT = 'WEBP'
+    IMAGE_QUALITY = 80
+    IMAGE_THUMBNAIL_SIZE = (440, 280)
+    IMAGE_WIDTHS = (320, 640, 1280)
+    # thumbnail and responsive variants made for uploaded images (see images.py)
+
+    JOBS_MODE = os.environ.get('JOBS_MODE', 'thread')
+    # "thread" runs jobs in each web process, "worker" only in "flask jobs worker"
+    JOBS_THREADS = 2
+    JOBS_POLL_SECONDS = 1
+    JOBS_LEASE_SECONDS = 300
+    JOBS_BACKOFF_SECONDS = 5
+    JOBS_BACKOFF_MAX_SECONDS = 3600
+    JOBS_KEEP_SECONDS = 7 * 24 * 3600
+    # background job queue: workers, retries and how long finished jobs are kept (see jobs.py)
+
+    UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+    MAX_CONTENT_LENGTH = UPLOAD_MAX_BYTES + 1024 * 1024
+    # size cap for uploaded images, plus room for the other form fields (see uploads.py)
+
+    CACHE_ENABLED = True
+    CACHE_MAX_BYTES = 64 * 1024 * 1024
+    CACHE_TTL = 60
+    # in-process page/fragment cache (see cache.py)
+
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    # e.g. "pbkdf2:sha256:600000"; old hashes are upgraded on login (see auth.py)
+    AUTH_HASH_WORKERS = os.cpu_count() or 2
+    AUTH_HASH_QUEUE = 32
+    AUTH_HASH_TIMEOUT = 10
+
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_BYTES = 1024
+    COMPRESS_LEVEL = 6
+    # gzip for dynamic HTML responses; static files are precompressed by
+    # "flask build-assets" (see assets.py)
+
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
+    # proxies (e.g. the load balancer) in front of the app whose X-Forwarded-For/-Proto/-Host
+    # headers are trusted; 0 trusts none, so request.remote_addr is the proxy's address
+
+    METRICS_ENABLED = True
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    # request/DB metrics on /metrics and the slow MongoDB command log (see metrics.py)
@@ -0,0 +1,91 @@
+"""
+gunicorn.conf.py
+This file configures gunicorn, the production server on Linux. gunicorn
+reads it automatically when started from the project root:
+
+    gunicorn main:app
+
+The app is loaded once in the master process and the workers are forked
+from it, so they share its memory (code, compiled templates). Each worker
+then opens its own MongoDB connection and warms up before it is ready
+(see application/server.py). Settings can be overridden with the usual
+gunicorn flags or GUNICORN_CMD_ARGS, and the worker counts with
+WEB_CONCURRENCY / WEB_THREADS.
+
+Reloading without downtime:
+- kill -HUP <master pid> starts new workers with the new configuration and
+  stops the old ones gracefully. With preload_app the code is not reloaded.
+- To deploy new code, send USR2 (a new master and workers start from the
+  new code next to the old ones), then WINCH and QUIT to the old master
+  once the new workers answer on /readyz.
+
+"""
+
+
+import os
+import atexit
+import signal
+
+from application.server import worker_counts
+
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers, threads = worker_counts()
+worker_class = 'gthread'
+preload_app = True
+
+# give requests in flight time to finish on reload or shutdown
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """
+    Runs in the master once the app is loaded, before any worker is forked.
+    """
+    from main import app
+    from application.server import warm_templates, disconnect
+    with app.app_context():
+        warm_templates()
+    disconnect()
+
+
+def post_fork(server, worker):
+    from main import app
+    from application.server import reconnect
+    with app.app_context():
+        reconnect()
+
+
+def post_worker_init(worker):
+    """
+    Runs in each worker before it accepts connections. SIGTERM (a graceful
+    stop, also sent on HUP reloads) first marks the worker not ready, so
+    /readyz answers 503 while it finishes its requests. The job threads the
+    warm-up starts are stopped when the worker process exits, after letting
+    the jobs in progress finish.
+    """
+    from main import app
+    from application.server import warm_up, stopping
+    from application.jobs import stop_workers
+    with app.app_context():
+        warm_up(threads)
+
+    handle_exit = worker.handle_exit
+
+    def graceful_exit(sig, frame):
+        stopping()
+        handle_exit(sig, frame)
+
+    # the worker installed its handlers before this hook runs, so replace it
+    signal.signal(signal.SIGTERM, graceful_exit)
+    atexit.register(stop_workers, timeout=graceful_timeout)
+
+
+def worker_int(worker):
+    from application.server import stopping
+    stopping()
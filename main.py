@@ -1 +1,17 @@
-from application import app
+from application import create_app
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    # single-process production server, for hosts without gunicorn (Windows);
+    # on Linux use "gunicorn main:app", configured by gunicorn.conf.py
+    import os
+    from waitress import serve
+    from application.server import worker_counts, warm_up
+
+    _, threads = worker_counts()
+    threads = int(os.environ.get('WEB_THREADS', threads * 2))
+    with app.app_context():
+        warm_up(threads)
+    serve(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 8000)), threads=threads)